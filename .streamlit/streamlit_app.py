@@ -6,6 +6,7 @@ from typing import List
 
 import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
 import os
 import sys
 
@@ -14,10 +15,13 @@ ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if ROOT_DIR not in sys.path:
     sys.path.insert(0, ROOT_DIR)
 
-from app.agents.coach import responder_pergunta
+from app.agents.coach import responder_pergunta_com_relatorios
 from app.agents.seguranca import avaliar_mensagem
-from app.config import GOOGLE_API_KEY, GROQ_API
-from app.graph.orchestrator import app_graph
+from app.config import GOOGLE_API_KEY
+from app.graph.orchestrator import executar_ingestao
+from app.importacao import extrair_texto_pdf, importar_extrato
+from app.ocr import cliente_ocr
+from app.jobs import fila_relatorios
 from app.repository import (
     atualizar_transacao,
     calcular_gastos_por_categoria,
@@ -26,9 +30,7 @@ from app.repository import (
 )
 from app.schemas import GastoPorCategoria, TransacaoCreate, TransacaoSchema, TransacaoUpdate
 from app.database import session_scope
-import base64
-import requests
-from PyPDF2 import PdfReader
+from app.tools.reports import gerar_relatorio_html
 
 st.set_page_config(page_title="Moneytora", layout="wide", page_icon='💵')
 st.title("Moneytora – Monitoramento Financeiro com Agentes de IA")
@@ -53,11 +55,11 @@ def _mostrar_alerta_chave_api() -> None:
         )
 
 
-def _executar_fluxo_processamento(texto: str) -> dict[str, object]:
+def _executar_fluxo_processamento(texto: str, multiplas: bool = False) -> dict[str, object]:
     """Executa o LangGraph e retorna o estado final, tratando exceções."""
 
     try:
-        return app_graph.invoke({"texto_original": texto})
+        return executar_ingestao(texto, grafo="multiplo" if multiplas else "padrao")
     except EnvironmentError as exc:
         raise RuntimeError(
             "Não foi possível executar o fluxo automático. "
@@ -97,67 +99,6 @@ def _carregar_gastos_por_categoria() -> List[GastoPorCategoria]:
         return [GastoPorCategoria.model_validate(item) for item in dados]
 
 
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
-
-def extrair_texto_imagem_groq(arquivo) -> str:
-    """Extrai texto de uma imagem usando a Groq API (modelo multimodal)."""
-    conteudo = arquivo.read()
-    b64 = base64.b64encode(conteudo).decode("utf-8")
-
-    payload = {
-        "model": "meta-llama/llama-4-scout-17b-16e-instruct",
-        "messages": [
-            {
-                "role": "system",
-                "content": "Você é um OCR inteligente. Extraia todo o texto legível da imagem enviada e devolva apenas o texto puro."
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": { "url": f"data:image/png;base64,{b64}" }
-                    },
-                    {
-                        "type": "text",
-                        "text": "Extraia o texto desta imagem."
-                    }
-                ]
-            }
-        ],
-        "temperature": 0,
-        "top_p": 1,
-        "stream": False,
-        "max_completion_tokens": 1024
-    }
-
-    headers = {
-        "Authorization": f"Bearer {GROQ_API}",
-        "Content-Type": "application/json"
-    }
-
-    resp = requests.post(API_URL, headers=headers, json=payload)
-
-    if resp.status_code != 200:
-        raise RuntimeError(f"Erro ao chamar Groq API: {resp.status_code} {resp.text}")
-
-    res_json = resp.json()
-    if "choices" not in res_json or not res_json["choices"]:
-        raise RuntimeError(f"Resposta inesperada da Groq API: {res_json}")
-
-    mensagem = res_json["choices"][0]["message"]
-    return mensagem.get("content", "").strip()
-
-def extrair_texto_pdf_groq(arquivo):
-    """Extrai texto de um PDF localmente (rápido)"""
-    reader = PdfReader(arquivo)
-    texto = "\n".join(page.extract_text() or "" for page in reader.pages)
-    return texto.strip()
-
-def extrair_texto_ofx(arquivo):
-    """Lê arquivo OFX (texto simples)"""
-    return arquivo.read().decode("utf-8")
-
 def aba_processar_notificacoes() -> None:
     """Exibe a aba de processamento automático de notificações."""
 
@@ -176,55 +117,103 @@ def aba_processar_notificacoes() -> None:
             ),
             height=200,
         )
-        arquivo = st.file_uploader(
-            "Ou envie um arquivo (imagem, PDF ou OFX):",
-            type=["jpg", "jpeg", "png", "pdf", "ofx"]
+        arquivos = st.file_uploader(
+            "Ou envie arquivos (imagens de comprovantes, PDF, OFX ou CSV):",
+            type=["jpg", "jpeg", "png", "pdf", "ofx", "csv"],
+            accept_multiple_files=True,
+        )
+        multiplas = st.checkbox(
+            "O texto contém várias transações (extrato colado, resumo de SMS, recibo)"
         )
         enviar = st.form_submit_button("Processar transação")
 
     if not enviar:
         return
 
-    
-    if not texto.strip() and not arquivo:
+    if not texto.strip() and not arquivos:
         st.info("Insira o texto ou envie um arquivo para continuar.")
         return
 
-    # Se o usuário enviou um arquivo, extrair o texto antes de processar
-    if arquivo:
-        with st.spinner("Extraindo texto do arquivo..."):
-            if arquivo.type in ["image/jpeg", "image/png"]:
-                texto = extrair_texto_imagem_groq(arquivo)
-            elif arquivo.type == "application/pdf":
-                texto = extrair_texto_pdf_groq(arquivo)
-            elif arquivo.name.endswith(".ofx"):
-                texto = extrair_texto_ofx(arquivo)
-            else:
-                st.error("Tipo de arquivo não suportado.")
-                return
+    # Com arquivos enviados, o texto digitado é ignorado (como antes).
+    textos: List[str] = [] if arquivos else [texto.strip()]
+    imagens: List[bytes] = []
+    for arquivo in arquivos or []:
+        extensao = os.path.splitext(arquivo.name)[1].lower()
+        if extensao in (".ofx", ".csv", ".pdf"):
+            # Extratos estruturados são importados diretamente, sem passar pelos agentes.
+            with st.spinner(f"Importando {arquivo.name}..."):
+                try:
+                    totais = importar_extrato(arquivo, extensao)
+                except ValueError as exc:
+                    st.error(f"Não foi possível importar {arquivo.name}: {exc}")
+                    continue
+            if totais["lidas"] or extensao != ".pdf":
+                st.success(
+                    f"{arquivo.name}: {totais['inseridas']} transações importadas "
+                    f"({totais['duplicadas']} já existentes ignoradas)."
+                )
+                continue
+            # PDFs sem linhas de extrato reconhecíveis (comprovantes) seguem para os agentes.
+            arquivo.seek(0)
+            textos.append(extrair_texto_pdf(arquivo))
+        elif arquivo.type in ("image/jpeg", "image/png"):
+            imagens.append(arquivo.getvalue())
+        else:
+            st.error(f"Tipo de arquivo não suportado: {arquivo.name}")
 
-    with st.spinner("Executando agentes..."):
-        try:
-            print(texto)
-            resultado = _executar_fluxo_processamento(texto.strip())
-        except RuntimeError as exc:
-            st.error(str(exc))
-            return
+    if imagens:
+        with st.spinner("Extraindo texto das imagens..."):
+            try:
+                textos.extend(cliente_ocr.extrair_textos(imagens))
+            except RuntimeError as exc:
+                st.error(str(exc))
+                return
 
-    if erro := resultado.get("erro"):
-        st.error(f"Não foi possível concluir o processamento: {erro}")
-        return
+    for texto_extraido in textos:
+        with st.spinner("Executando agentes..."):
+            try:
+                resultado = _executar_fluxo_processamento(texto_extraido.strip(), multiplas)
+            except RuntimeError as exc:
+                st.error(str(exc))
+                continue
+
+        if erro := resultado.get("erro"):
+            st.error(f"Não foi possível concluir o processamento: {erro}")
+            continue
+
+        if multiplas:
+            for aviso in resultado.get("erros", []):
+                st.warning(aviso)
+            classificadas = sorted(resultado.get("classificadas", []), key=lambda item: item["indice"])
+            st.success(f"{len(resultado.get('transacao_ids', []))} transações processadas com sucesso!")
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {
+                            "Empresa": item.get("empresa"),
+                            "Valor": item.get("valor"),
+                            "Data": str(item.get("data")),
+                            "Categoria": item.get("categoria"),
+                        }
+                        for item in classificadas
+                        if not item.get("erro")
+                    ]
+                ),
+                width='stretch',
+                hide_index=True,
+            )
+            continue
 
-    st.success("Transação processada com sucesso!")
-    st.write(
-        {
-            "Transação ID": resultado.get("transacao_id"),
-            "Empresa": resultado.get("empresa"),
-            "Valor": resultado.get("valor"),
-            "Data": str(resultado.get("data")),
-            "Categoria": resultado.get("categoria"),
-        }
-    )
+        st.success("Transação processada com sucesso!")
+        st.write(
+            {
+                "Transação ID": resultado.get("transacao_id"),
+                "Empresa": resultado.get("empresa"),
+                "Valor": resultado.get("valor"),
+                "Data": str(resultado.get("data")),
+                "Categoria": resultado.get("categoria"),
+            }
+        )
 
 
 def aba_transacoes() -> None:
@@ -488,6 +477,18 @@ def aba_dashboard() -> None:
     )[["data", "empresa", "categoria", "valor"]]
     st.dataframe(recentes_formatado, width='stretch', hide_index=True)
 
+    st.markdown("#### Relatório do período")
+    col_inicio, col_fim = st.columns(2)
+    inicio = col_inicio.date_input("Início", value=date.today().replace(day=1), key="relatorio_inicio")
+    fim = col_fim.date_input("Fim", value=date.today(), key="relatorio_fim")
+    if st.button("Gerar relatório rápido"):
+        # Formato HTML/SVG: sem matplotlib/reportlab, fica pronto em milissegundos.
+        resultado = gerar_relatorio_html(inicio.isoformat(), fim.isoformat())
+        if not resultado["ok"]:
+            st.info(resultado["mensagem"])
+        else:
+            components.html(resultado["html"], height=900, scrolling=True)
+
 
 def aba_coach() -> None:
     """Interface de chat com o agente coach financeiro."""
@@ -535,10 +536,8 @@ def aba_coach() -> None:
             st.markdown(resposta)
         return
 
-    REPORTS_DIR = r"C:\Users\pedro\OneDrive\hack_akcit\moneytora\reports"
-
     try:
-        resposta = responder_pergunta(pergunta)
+        resposta, jobs_ids = responder_pergunta_com_relatorios(pergunta)
     except EnvironmentError:
         st.error(
             "O agente coach não está disponível no momento. "
@@ -555,30 +554,31 @@ def aba_coach() -> None:
     with st.chat_message("assistant"):
         st.markdown(resposta)
 
-        # --- 🔍 Verifica se o agente gerou algum PDF novo ---
-        if os.path.exists(REPORTS_DIR):
-            # busca o arquivo PDF mais recente na pasta
-            pdfs = [
-                os.path.join(REPORTS_DIR, f)
-                for f in os.listdir(REPORTS_DIR)
-                if f.lower().endswith(".pdf")
-            ]
-            if pdfs:
-                latest_pdf = max(pdfs, key=os.path.getmtime)
-                st.success(f"📄 Relatório gerado: `{os.path.basename(latest_pdf)}`")
-
-                # Exibe o PDF no próprio Streamlit
-                with open(latest_pdf, "rb") as f:
-                    st.download_button(
-                        label="⬇️ Baixar relatório PDF",
-                        data=f,
-                        file_name=os.path.basename(latest_pdf),
-                        mime="application/pdf",
-                    )
-
-                # opcional: exibir o PDF embutido
-                st.markdown("Visualização do relatório:")
-                st.pdf(latest_pdf)
+        # --- 🔍 Verifica se o agente solicitou algum relatório nesta resposta ---
+        # Só os PDFs pedidos pela tool nesta resposta, pelos ``job_id`` que ela devolveu.
+        jobs = [job for job in map(fila_relatorios.obter, jobs_ids) if job is not None]
+        for job in jobs:
+            with st.spinner("Gerando relatório PDF..."):
+                job.aguardar(timeout=120)
+            resultado = job.resultado or {}
+            if job.status != "concluido" or not resultado.get("pdf_bytes"):
+                st.warning(job.erro or resultado.get("mensagem") or "O relatório ainda não ficou pronto.")
+                continue
+
+            nome_arquivo = resultado["nome_arquivo"]
+            st.success(f"📄 Relatório gerado: `{nome_arquivo}`")
+            # O PDF vem direto da memória, sem arquivos temporários em disco.
+            st.download_button(
+                label="⬇️ Baixar relatório PDF",
+                data=resultado["pdf_bytes"],
+                file_name=nome_arquivo,
+                mime="application/pdf",
+                key=f"download_{job.id}",
+            )
+
+            # opcional: exibir o PDF embutido
+            st.markdown("Visualização do relatório:")
+            st.pdf(resultado["pdf_bytes"])
 
 
 _mostrar_alerta_chave_api()
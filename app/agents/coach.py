@@ -4,13 +4,18 @@ Este agente utiliza ferramentas para consultar dados financeiros e gerar relató
 além de responder perguntas gerais sobre educação financeira.
 """
 
-from typing import Optional
+import json
+from typing import List, Optional, Tuple
 
 from langchain.agents import create_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import AIMessage
+from langchain.agents.middleware import ModelRequest, dynamic_prompt
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
 
+from app import database, resumo_mensal
 from app.config import GOOGLE_API_KEY
+from app.llm import ERROS_INDISPONIBILIDADE, ChatGeminiControlado, modelos_do_agente, obter_llm
+from app.tools.fatos_financeiros import FERRAMENTAS_FATOS
+from app.tools.orcamento_saida import buscar_mais_resultados
 from app.tools.reports import gerar_relatorio_financeiro
 from app.tools.sql_consultation import consultar_dados_financeiros
 
@@ -35,9 +40,17 @@ Sua missão principal é ajudar o usuário a entender seus hábitos financeiros
 ## Capacidades
 
 Você tem acesso a ferramentas que permitem:
-1. **Consultar dados financeiros**: Use a tool `consultar_dados_financeiros` para responder perguntas sobre valores, totais, gastos por categoria, períodos, etc.
-2. **Gerar relatórios**: Use a tool `gerar_relatorio_pdf` quando o usuário pedir um relatório completo, PDF ou documento detalhado.
-3. **Responder dúvidas gerais**: Para dicas de organização financeira, economia e educação financeira (sem dar conselhos de investimento).
+1. **Fatos financeiros (use primeiro)**: Para as perguntas comuns, chame diretamente a tool correspondente, com uma única chamada:
+   - `total_por_categoria`: quanto foi gasto por categoria (ou em uma categoria) em um período.
+   - `maiores_despesas`: as N maiores despesas de um período.
+   - `comparar_meses`: gastos e entradas de um mês comparados ao mês anterior.
+   - `historico_empresa`: transações, total e datas com uma empresa.
+   - `contar_transacoes`: quantidade de transações em um período.
+   Converta referências como "este mês" ou "em outubro" para datas 'YYYY-MM-DD' ou mês 'YYYY-MM'.
+2. **Consultas livres**: Use `consultar_dados_financeiros` apenas quando nenhuma das tools acima responder à pergunta.
+3. **Gerar relatórios**: Use a tool `gerar_relatorio_financeiro` quando o usuário pedir um relatório completo. O formato padrão (HTML) fica pronto na hora: apresente o resumo e o link `html_url`. Use `formato="pdf"` somente se o usuário pedir um PDF ou documento para download; o PDF é gerado em segundo plano e fica disponível em `pdf_url`.
+4. **Resultados resumidos**: Listas longas voltam cortadas nas primeiras linhas, com o total e um agregado do restante em `mais_resultados`. Responda com o que foi exibido e use `buscar_mais_resultados` com o `handle` só se o usuário pedir os demais itens.
+5. **Responder dúvidas gerais**: Para dicas de organização financeira, economia e educação financeira (sem dar conselhos de investimento).
 
 ## Limitações e Guardrails
 
@@ -59,14 +72,50 @@ Você tem acesso a ferramentas que permitem:
 # FUNÇÕES AUXILIARES
 # ============================================================================
 
-def _get_llm() -> ChatGoogleGenerativeAI:
-    """Cria uma instância do modelo Gemini configurada para o coach."""
+def _get_llm() -> ChatGeminiControlado:
+    """Obtém o cliente Gemini compartilhado configurado para o coach."""
     if not GOOGLE_API_KEY:
         raise RuntimeError("Erro: GOOGLE_API_KEY não configurada.")
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=GOOGLE_API_KEY,
-        temperature=0.2,
+    return obter_llm(modelos_do_agente("coach")[0], agente="coach", temperature=0.2)
+
+
+def _resumo_do_cliente(cliente_id: Optional[str]) -> Optional[str]:
+    """Resumo mensal pré-calculado do cliente; ``None`` se indisponível."""
+    try:
+        with database.session_scope(cliente_id) as session:
+            return resumo_mensal.contexto_coach(session, cliente_id)
+    except Exception:
+        # O resumo só poupa chamadas de ferramenta; sem ele, o coach consulta os dados.
+        return None
+
+
+def _jobs_de_relatorio(mensagens: List[BaseMessage]) -> List[str]:
+    """``job_id`` dos PDFs enfileirados pela tool de relatórios nas ``mensagens``."""
+    jobs = []
+    for mensagem in mensagens:
+        if not isinstance(mensagem, ToolMessage) or mensagem.name != gerar_relatorio_financeiro.name:
+            continue
+        try:
+            resultado = json.loads(mensagem.content)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(resultado, dict) and resultado.get("job_id"):
+            jobs.append(resultado["job_id"])
+    return jobs
+
+
+@dynamic_prompt
+def _prompt_com_resumo(request: ModelRequest) -> str:
+    """Acrescenta ao prompt de sistema o resumo mensal passado no contexto da execução."""
+    contexto = request.runtime.context or {}
+    resumo = contexto.get("resumo")
+    if not resumo:
+        return COACH_SYSTEM_PROMPT
+    return (
+        f"{COACH_SYSTEM_PROMPT}\n## Resumo Pré-calculado\n\n"
+        "Use o resumo abaixo para responder sem ferramentas quando ele bastar; "
+        "para outros períodos ou detalhes, use as tools.\n\n"
+        f"{resumo}\n"
     )
 
 
@@ -84,10 +133,13 @@ def create_coach_agent():
     Returns:
         Agente coach configurado e pronto para uso
     """
-    # Lista de tools disponíveis (importadas do módulo app.tools.coach)
+    # Lista de tools disponíveis: fatos determinísticos primeiro; o agente SQL
+    # (consultar_dados_financeiros) fica como alternativa para perguntas livres.
     tools = [
+        *FERRAMENTAS_FATOS,
         consultar_dados_financeiros,
         gerar_relatorio_financeiro,
+        buscar_mais_resultados,
     ]
     
     # Cria o agente
@@ -95,6 +147,7 @@ def create_coach_agent():
         model=_get_llm(),
         tools=tools,
         system_prompt=COACH_SYSTEM_PROMPT,
+        middleware=[_prompt_com_resumo],
     )
     
     return agent
@@ -133,10 +186,22 @@ def responder_pergunta(mensagem: str, cliente_id: Optional[str] = None) -> str:
         >>> responder_pergunta("Como posso economizar mais?")
         "Aqui estão algumas dicas práticas para economizar: 1. Acompanhe seus gastos..."
     """
+    return responder_pergunta_com_relatorios(mensagem, cliente_id)[0]
+
+
+def responder_pergunta_com_relatorios(
+    mensagem: str, cliente_id: Optional[str] = None
+) -> Tuple[str, List[str]]:
+    """
+    Como ``responder_pergunta``, devolvendo também os ``job_id`` dos PDFs pedidos.
+    
+    Os ids vêm dos resultados da tool ``gerar_relatorio_financeiro`` desta execução,
+    e não da fila inteira: relatórios pedidos por outras conversas não aparecem aqui.
+    """
     global _cached_agent
     
     if not GOOGLE_API_KEY:
-        return "Erro: GOOGLE_API_KEY não configurada."
+        return "Erro: GOOGLE_API_KEY não configurada.", []
     
     try:
         # Cria ou reutiliza o agente
@@ -146,24 +211,29 @@ def responder_pergunta(mensagem: str, cliente_id: Optional[str] = None) -> str:
         # Prepara o contexto (se houver cliente_id)
         context = {"cliente_id": cliente_id} if cliente_id else {}
         
-        # Invoca o agente
+        # Invoca o agente; o resumo mensal vai para o prompt de sistema
         resultado = _cached_agent.invoke(
             {"messages": [("user", mensagem)]},
-            config={"configurable": {"context": context}}
+            config={"configurable": {"context": context}},
+            context={**context, "resumo": _resumo_do_cliente(cliente_id)},
         )
         
         # Extrai a resposta
         if isinstance(resultado, dict) and "messages" in resultado:
+            jobs = _jobs_de_relatorio(resultado["messages"])
             # Pega a última mensagem do agente
             last_message = resultado["messages"][-1]
             if isinstance(last_message, AIMessage):
-                return last_message.content
-            return str(last_message)
+                return last_message.content, jobs
+            return str(last_message), jobs
         
-        return str(resultado)
+        return str(resultado), []
         
+    except ERROS_INDISPONIBILIDADE:
+        # Fila cheia, prazo ou circuito aberto: a API responde 503, não um texto de erro.
+        raise
     except Exception as e:
-        return f"Ocorreu um erro ao processar sua pergunta: {str(e)}"
+        return f"Ocorreu um erro ao processar sua pergunta: {str(e)}", []
 
 
 def limpar_cache_agente():
@@ -1,63 +1,139 @@
 """Agente responsável por extrair dados estruturados de uma notificação financeira."""
 from datetime import date
 from functools import lru_cache
+from typing import List, Literal
 
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 from app.config import GOOGLE_API_KEY
+from app.llm import ChatGeminiControlado, ConfiguracaoAusenteError, executar_roteado, obter_llm
+from app.tools.classificacao_tool import CATEGORIAS_CONHECIDAS
 
 
 class DadosTransacao(BaseModel):
     """Estrutura da saída esperada pelo agente extrator."""
 
-    valor: float = Field(description="O valor numérico da transação sendo positivo para entradas e negativo para saídas.")
+    valor: float = Field(description="Valor da transação: positivo para entradas, negativo para saídas.")
     empresa: str = Field(description="O nome da empresa ou estabelecimento.")
-    data: date = Field(description="A data da transação no formato AAAA-MM-DD.")
+    data: date = Field(description="A data da transação (AAAA-MM-DD).")
 
 
-# Parser responsável por transformar a saída do LLM em um objeto ``DadosTransacao``.
-output_parser = PydanticOutputParser(pydantic_object=DadosTransacao)
+class DadosTransacaoCategorizada(DadosTransacao):
+    """Saída do modo que extrai e sugere a categoria na mesma chamada."""
 
-prompt_template = """
-Você é um especialista em extrair informações financeiras de textos.
-Analise o texto a seguir e extraia o valor, a empresa e a data da transação.
-Se a data não especificar o ano, assuma {date}`.
+    categoria_sugerida: Literal[CATEGORIAS_CONHECIDAS] = Field(
+        description="A categoria mais provável da transação."
+    )
 
-{format_instructions}
 
-Texto da transação:
-{texto_transacao}
-"""
+class DadosTransacoes(BaseModel):
+    """Saída do modo de múltiplas transações (extratos, resumos de SMS, recibos)."""
 
-prompt = ChatPromptTemplate.from_template(
-    template=prompt_template,
-    partial_variables={
-        "format_instructions": output_parser.get_format_instructions(),
-        "date": date.today().year,
-    },
+    transacoes: List[DadosTransacao] = Field(
+        description="Todas as transações encontradas no texto, na ordem em que aparecem."
+    )
+
+
+# O esquema de saída é enviado ao modelo pelo modo nativo de saída estruturada
+# (JSON schema), então os prompts trazem apenas a tarefa. O ano corrente é
+# informado a cada chamada, e não congelado na importação do módulo.
+_INSTRUCOES_BASE = (
+    "Extraia os dados financeiros do texto. Valores de saída são negativos e de "
+    "entrada, positivos. Datas sem ano são do ano {ano}."
+)
+
+prompt = ChatPromptTemplate.from_messages(
+    [("system", _INSTRUCOES_BASE), ("human", "{texto_transacao}")]
 )
 
+prompt_multiplas = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            _INSTRUCOES_BASE + " Liste todas as transações do texto, sem saldos ou totais.",
+        ),
+        ("human", "{texto_transacao}"),
+    ]
+)
+
+prompt_categorizado = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            _INSTRUCOES_BASE + ' Sugira a categoria mais provável; use "Outros" só se nenhuma servir.',
+        ),
+        ("human", "{texto_transacao}"),
+    ]
+)
 
-def _build_llm() -> ChatGoogleGenerativeAI:
+
+def _build_llm(modelo: str) -> ChatGeminiControlado:
     """Cria uma instância do modelo Gemini configurada para o extrator."""
 
     if not GOOGLE_API_KEY:
-        raise EnvironmentError(
+        raise ConfiguracaoAusenteError(
             "GOOGLE_API_KEY não configurada. Configure a variável de ambiente para utilizar o agente extrator."
         )
-    return ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=GOOGLE_API_KEY)
+    return obter_llm(modelo, agente="extrator")
+
+
+def _estruturado(schema, modelo: str):
+    return _build_llm(modelo).with_structured_output(schema, method="json_schema")
+
+
+# Encadeamos prompt -> modelo com saída estruturada utilizando a sintaxe de pipe do LangChain.
+# Há uma cadeia por modelo da rota do extrator (ver ``app.llm.ROTAS_PADRAO``).
+@lru_cache(maxsize=None)
+def _get_chain(modelo: str):
+    return prompt | _estruturado(DadosTransacao, modelo)
+
 
+@lru_cache(maxsize=None)
+def _get_chain_multiplas(modelo: str):
+    return prompt_multiplas | _estruturado(DadosTransacoes, modelo)
 
-# Encadeamos prompt -> modelo -> parser utilizando a sintaxe de pipe do LangChain.
-@lru_cache(maxsize=1)
-def _get_chain():
-    return prompt | _build_llm() | output_parser
+
+@lru_cache(maxsize=None)
+def _get_chain_categorizado(modelo: str):
+    return prompt_categorizado | _estruturado(DadosTransacaoCategorizada, modelo)
+
+
+def _entradas(texto: str) -> dict:
+    return {"texto_transacao": texto, "ano": date.today().year}
+
+
+def _transacao_confiavel(dados: DadosTransacao) -> bool:
+    """Uma extração sem empresa ou com valor zero indica que o modelo não entendeu o texto."""
+
+    return bool(dados.empresa.strip()) and dados.valor != 0
 
 
 def extrair_dados_transacao(texto: str) -> DadosTransacao:
     """Executa o agente extrator para obter os dados estruturados de uma transação."""
 
-    return _get_chain().invoke({"texto_transacao": texto})
+    return executar_roteado(
+        "extrator",
+        lambda modelo: _get_chain(modelo).invoke(_entradas(texto)),
+        _transacao_confiavel,
+    )
+
+
+def extrair_dados_categorizados(texto: str) -> DadosTransacaoCategorizada:
+    """Extrai a transação e sugere a categoria em uma única chamada ao modelo."""
+
+    return executar_roteado(
+        "extrator",
+        lambda modelo: _get_chain_categorizado(modelo).invoke(_entradas(texto)),
+        _transacao_confiavel,
+    )
+
+
+def extrair_transacoes(texto: str) -> DadosTransacoes:
+    """Extrai todas as transações de um texto em uma única chamada ao modelo."""
+
+    return executar_roteado(
+        "extrator",
+        lambda modelo: _get_chain_multiplas(modelo).invoke(_entradas(texto)),
+        lambda dados: bool(dados.transacoes) and all(map(_transacao_confiavel, dados.transacoes)),
+    )
@@ -2,9 +2,9 @@
 from functools import lru_cache
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 from app.config import GOOGLE_API_KEY
+from app.llm import ChatGeminiControlado, ConfiguracaoAusenteError, executar_roteado, obter_llm
 
 _PROMPT = ChatPromptTemplate.from_template(
     """
@@ -21,25 +21,40 @@ _PROMPT = ChatPromptTemplate.from_template(
 )
 
 
-def _build_llm() -> ChatGoogleGenerativeAI:
+_RESPOSTAS_VALIDAS = {"seguro", "malicioso"}
+
+
+def _build_llm(modelo: str) -> ChatGeminiControlado:
     if not GOOGLE_API_KEY:
-        raise EnvironmentError(
+        raise ConfiguracaoAusenteError(
             "GOOGLE_API_KEY não configurada. Configure a variável de ambiente para utilizar o agente de segurança."
         )
-    return ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=GOOGLE_API_KEY)
+    # Respostas de uma palavra são baratas: vale duplicar as que passam do p95.
+    return obter_llm(modelo, agente="seguranca", hedge=True)
 
 
-@lru_cache(maxsize=1)
-def _get_chain():
-    return _PROMPT | _build_llm()
+@lru_cache(maxsize=None)
+def _get_chain(modelo: str):
+    return _PROMPT | _build_llm(modelo)
 
 
-def avaliar_mensagem(texto_usuario: str) -> str:
-    """Classifica a mensagem do usuário como "seguro" ou "malicioso"."""
-
-    resultado = _get_chain().invoke({"texto_usuario": texto_usuario})
+def _normalizar(resultado) -> str:
     # O LangChain retorna objetos de mensagem; acessamos o conteúdo bruto e normalizamos.
     conteudo = getattr(resultado, "content", resultado)
     if isinstance(conteudo, list):  # Algumas versões retornam uma lista de partes.
         conteudo = " ".join(str(parte) for parte in conteudo)
-    return str(conteudo).strip().lower()
+    return str(conteudo).strip().lower().strip(".\"' ")
+
+
+def avaliar_mensagem(texto_usuario: str) -> str:
+    """Classifica a mensagem do usuário como "seguro" ou "malicioso".
+
+    O modelo menor da rota responde primeiro; qualquer resposta fora das duas
+    palavras esperadas é tratada como baixa confiança e escala para o próximo.
+    """
+
+    return executar_roteado(
+        "seguranca",
+        lambda modelo: _normalizar(_get_chain(modelo).invoke({"texto_usuario": texto_usuario})),
+        lambda resposta: resposta in _RESPOSTAS_VALIDAS,
+    )
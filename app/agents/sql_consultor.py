@@ -1,7 +1,5 @@
 """Agente sql financeiro responsável por fazer consultas no banco sobre as finanças."""
-from functools import lru_cache
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 try:
     from langchain_community.agent_toolkits.sql.base import create_sql_agent
 except ImportError:  # pragma: no cover - depende da versão instalada
@@ -16,39 +14,250 @@ except ImportError:  # pragma: no cover - depende da versão instalada
         from langchain.agents.agent_toolkits import SQLDatabaseToolkit
     except ImportError:  # pragma: no cover - compatibilidade
         SQLDatabaseToolkit = None
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
 from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 
 from app.config import GOOGLE_API_KEY
-from app.database import DATABASE_URL
+from app.llm import ChatGeminiControlado, ConfiguracaoAusenteError, modelos_do_agente, obter_llm
+from app.database import engine as engine_aplicacao, roteador
+
+PRAZO_CONSULTA = float(os.getenv("MONEYTORA_SQL_AGENT_TIMEOUT", "2"))
+MAX_LINHAS_CONSULTA = int(os.getenv("MONEYTORA_SQL_AGENT_MAX_ROWS", "200"))
+# Intervalo (em instruções da VM do SQLite) entre as verificações do prazo.
+_PASSOS_PROGRESSO = 1000
+_RE_VARREDURA = re.compile(r"^SCAN (?!CONSTANT ROW)")
+
+
+# O agente só enxerga esta tabela, com apenas as linhas do cliente (ou, sem cliente,
+# as transações sem cliente).
+TABELA_CLIENTE = "transacoes"
+# Agentes (e engines de leitura) mantidos em memória, um por cliente.
+MAX_AGENTES = int(os.getenv("MONEYTORA_SQL_AGENT_CACHE", "32"))
+# Pragmas usados pelo dialeto e pela reflexão do SQLAlchemy; os demais
+# (``table_list``, ``database_list``...) revelariam o nome da visão interna.
+_PRAGMAS_REFLEXAO = frozenset(
+    {
+        "read_uncommitted",
+        "table_info",
+        "table_xinfo",
+        "index_list",
+        "index_info",
+        "index_xinfo",
+        "foreign_key_list",
+    }
+)
+
+
+class ConsultaRejeitadaError(SQLAlchemyError):
+    """Consulta do agente recusada pela verificação de custo ou interrompida pelo prazo."""
+
+
+def _literal(valor: Optional[str]) -> str:
+    return "NULL" if valor is None else "'" + valor.replace("'", "''") + "'"
+
+
+def _autorizador_cliente(visao: str) -> Callable[..., int]:
+    """Autorizador que só deixa ler ``main.transacoes`` através da visão ``visao``.
+
+    Nega ``ATTACH``, as demais leituras do banco da aplicação (exceto o catálogo
+    do SQLite) e os pragmas fora da reflexão, e esconde o catálogo temporário: o
+    nome da visão interna nunca chega ao LLM, que não consegue imitá-la com uma CTE.
+    """
+
+    def autorizar(
+        acao: int, tabela: Optional[str], _coluna: Optional[str], banco: Optional[str], via: Optional[str]
+    ) -> int:
+        if acao == sqlite3.SQLITE_ATTACH:
+            return sqlite3.SQLITE_DENY
+        if acao == sqlite3.SQLITE_PRAGMA:
+            return sqlite3.SQLITE_OK if tabela in _PRAGMAS_REFLEXAO else sqlite3.SQLITE_DENY
+        if acao == sqlite3.SQLITE_READ:
+            catalogo = (tabela or "").startswith("sqlite_")
+            if banco == "main" and not catalogo and (tabela != TABELA_CLIENTE or via != visao):
+                return sqlite3.SQLITE_DENY
+            if banco == "temp" and catalogo:
+                # Lido como ``NULL``: a reflexão consulta o catálogo temporário e só
+                # precisa não encontrar tabelas temporárias.
+                return sqlite3.SQLITE_IGNORE
+        return sqlite3.SQLITE_OK
+
+    return autorizar
+
+
+def criar_engine_leitura(
+    caminho: Optional[str] = None, cliente_id: Optional[str] = None, isolar: bool = False
+) -> Engine:
+    """Engine somente leitura (``mode=ro`` e ``PRAGMA query_only``) sobre o banco da aplicação.
+
+    Com ``isolar`` (implícito quando há ``cliente_id``), cada conexão cria uma visão
+    temporária ``transacoes``, que tem precedência sobre a tabela de mesmo nome,
+    com apenas as linhas do cliente (ou as sem cliente, se ``cliente_id`` for
+    ``None``). A visão lê a tabela real por uma visão interna de nome aleatório, e
+    um autorizador do SQLite recusa qualquer outra leitura do banco da aplicação,
+    inclusive ``main.transacoes``. O isolamento vale para todo SQL que o LLM
+    escrever; nada é copiado, e o filtro usa os índices iniciados por ``cliente_id``.
+    """
+
+    caminho = os.path.abspath(caminho or engine_aplicacao.url.database)
+    isolar = isolar or cliente_id is not None
+
+    def _conectar() -> sqlite3.Connection:
+        conexao = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+        if not isolar:
+            conexao.execute("PRAGMA query_only = ON")
+            return conexao
 
-_db = SQLDatabase.from_uri(DATABASE_URL)
+        # As visões são criadas antes do ``query_only``, e o autorizador por último.
+        visao = f"_cliente_{secrets.token_hex(16)}"
+        conexao.execute(
+            f"CREATE TEMP VIEW {visao} AS SELECT * FROM main.{TABELA_CLIENTE} "
+            f"WHERE cliente_id IS {_literal(cliente_id)}"
+        )
+        conexao.execute(f"CREATE TEMP VIEW {TABELA_CLIENTE} AS SELECT * FROM {visao}")
+        conexao.execute("PRAGMA query_only = ON")
+        conexao.set_authorizer(_autorizador_cliente(visao))
+        return conexao
+
+    return create_engine("sqlite://", creator=_conectar)
+
+
+def _varreduras_aninhadas(plano: Sequence[Sequence[Any]]) -> bool:
+    """Há duas varreduras completas sob o mesmo nó do plano (produto cartesiano)?"""
+
+    varreduras: Dict[int, int] = {}
+    for _id, pai, _, detalhe in plano:
+        if _RE_VARREDURA.match(detalhe):
+            varreduras[pai] = varreduras.get(pai, 0) + 1
+    return any(quantidade > 1 for quantidade in varreduras.values())
+
+
+class SQLDatabaseLeitura(SQLDatabase):
+    """``SQLDatabase`` com conexão somente leitura, prazo por consulta e limite de linhas.
+
+    Antes de executar, o plano (``EXPLAIN QUERY PLAN``) é inspecionado e junções sem
+    índice entre varreduras completas são recusadas; durante a execução, um progress
+    handler do SQLite interrompe a consulta ao fim do prazo.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        prazo: float = PRAZO_CONSULTA,
+        max_linhas: int = MAX_LINHAS_CONSULTA,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(engine, **kwargs)
+        self.prazo = prazo
+        self.max_linhas = max_linhas
 
+    def _execute(
+        self,
+        command: Union[str, Any],
+        fetch: str = "all",
+        *,
+        parameters: Optional[Dict[str, Any]] = None,
+        execution_options: Optional[Dict[str, Any]] = None,
+    ) -> Union[Sequence[Dict[str, Any]], Any]:
+        if not isinstance(command, str):
+            raise ConsultaRejeitadaError("O agente só executa consultas em texto.")
+        comando = command.strip().rstrip(";")
 
-def _build_llm() -> ChatGoogleGenerativeAI:
+        with self._engine.connect() as conexao:
+            plano = conexao.exec_driver_sql(f"EXPLAIN QUERY PLAN {comando}", tuple()).fetchall()
+            if _varreduras_aninhadas(plano):
+                raise ConsultaRejeitadaError(
+                    "Consulta recusada: junção entre varreduras completas de tabelas "
+                    "(produto cartesiano). Filtre ou relacione as tabelas por uma coluna."
+                )
+
+            bruta = conexao.connection.driver_connection
+            limite = time.monotonic() + self.prazo
+            bruta.set_progress_handler(lambda: time.monotonic() > limite, _PASSOS_PROGRESSO)
+            try:
+                cursor = conexao.execute(text(comando), parameters or {})
+                if not cursor.returns_rows:
+                    return []
+                linhas = cursor.fetchmany(1 if fetch == "one" else self.max_linhas + 1)
+            except OperationalError as exc:
+                if "interrupted" in str(exc.orig):
+                    raise ConsultaRejeitadaError(
+                        f"Consulta interrompida após {self.prazo:.0f}s; restrinja o período ou agregue os dados."
+                    ) from exc
+                raise
+            finally:
+                bruta.set_progress_handler(None, 0)
+
+        resultado: List[Dict[str, Any]] = [linha._asdict() for linha in linhas[: self.max_linhas]]
+        if len(linhas) > self.max_linhas:
+            resultado.append({"aviso": f"resultado limitado às primeiras {self.max_linhas} linhas"})
+        return resultado
+
+
+def _banco(cliente_id: Optional[str] = None) -> SQLDatabaseLeitura:
+    if cliente_id is None:
+        return SQLDatabaseLeitura(criar_engine_leitura(isolar=True), include_tables=[TABELA_CLIENTE])
+    # Com o banco fragmentado, lê o arquivo do cliente (criado aqui se ainda não existir).
+    roteador.engine(cliente_id)
+    return SQLDatabaseLeitura(
+        criar_engine_leitura(roteador.caminho(cliente_id), cliente_id=cliente_id),
+        include_tables=[TABELA_CLIENTE],
+    )
+
+
+def _build_llm() -> ChatGeminiControlado:
     if not GOOGLE_API_KEY:
-        raise EnvironmentError(
+        raise ConfiguracaoAusenteError(
             "GOOGLE_API_KEY não configurada. Configure a variável de ambiente para utilizar o agente coach."
         )
-    # O modelo é compartilhado com os demais agentes para manter consistência de respostas.
-    return ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=GOOGLE_API_KEY)
+    # O cliente é compartilhado com os demais agentes (mesmos limites de vazão e cota).
+    return obter_llm(modelos_do_agente("sql")[0], agente="sql")
+
 
+_agentes: "OrderedDict[Optional[str], Tuple[SQLDatabaseLeitura, Any]]" = OrderedDict()
+_agentes_lock = threading.Lock()
 
-@lru_cache(maxsize=1)
-def _get_agent_executor():
+
+def _get_agent_executor(cliente_id: Optional[str] = None):
     if create_sql_agent is None or SQLDatabaseToolkit is None:
-        raise EnvironmentError(
+        raise ConfiguracaoAusenteError(
             "Dependências do LangChain para o agente coach não estão disponíveis na versão instalada."
         )
 
-    llm = _build_llm()
-    toolkit = SQLDatabaseToolkit(db=_db, llm=llm)
-    return create_sql_agent(llm=llm, toolkit=toolkit, verbose=False)
+    with _agentes_lock:
+        if cliente_id in _agentes:
+            _agentes.move_to_end(cliente_id)
+            return _agentes[cliente_id][1]
+        llm = _build_llm()
+        banco = _banco(cliente_id)
+        agente = create_sql_agent(llm=llm, toolkit=SQLDatabaseToolkit(db=banco, llm=llm), verbose=False)
+        _agentes[cliente_id] = (banco, agente)
+        while len(_agentes) > MAX_AGENTES:
+            # Como no ``RoteadorBanco``: consultas em andamento terminam normalmente, o
+            # ``dispose`` só fecha as conexões ociosas do engine descartado.
+            _, (antigo, _agente) = _agentes.popitem(last=False)
+            antigo._engine.dispose()
+        return agente
+
 
+def responder_pergunta(pergunta: str, cliente_id: Optional[str] = None) -> str:
+    """Executa o agente coach retornando a resposta textual ao usuário.
 
-def responder_pergunta(pergunta: str) -> str:
-    """Executa o agente coach retornando a resposta textual ao usuário."""
+    Com ``cliente_id``, o agente consulta apenas as transações do cliente; sem ele,
+    apenas as transações sem cliente.
+    """
 
-    agente = _get_agent_executor()
+    agente = _get_agent_executor(cliente_id)
     resultado = agente.invoke({"input": pergunta})
     if isinstance(resultado, dict):
         return str(resultado.get("output") or resultado)
@@ -0,0 +1,168 @@
+"""Cache persistente em SQLite compartilhado entre processos.
+
+O arquivo de cache é independente do banco de transações e pode ser acessado
+simultaneamente pela API, pelos workers e pelo Streamlit. Cada consumidor usa
+um ``namespace`` próprio, com limite de tamanho (LRU) e TTL opcionais.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.config import CACHE_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entradas (
+    namespace TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    valor BLOB NOT NULL,
+    tamanho INTEGER NOT NULL,
+    expira_em REAL,
+    ultimo_acesso REAL NOT NULL,
+    PRIMARY KEY (namespace, chave)
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entradas_lru
+    ON cache_entradas (namespace, ultimo_acesso);
+"""
+
+_schemas_criados: set[str] = set()
+_schemas_lock = threading.Lock()
+
+
+class CacheSQLite:
+    """Armazena blobs por chave com expiração e despejo por tamanho (LRU)."""
+
+    def __init__(
+        self,
+        namespace: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        caminho: Optional[str] = None,
+    ) -> None:
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.caminho = caminho or CACHE_PATH
+        self.hits = 0
+        self.misses = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+        with _schemas_lock:
+            if self.caminho not in _schemas_criados:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _schemas_criados.add(self.caminho)
+        return conn
+
+    def obter(self, chave: str) -> Optional[bytes]:
+        """Retorna o valor armazenado ou ``None`` em caso de ausência/expiração."""
+
+        agora = time.time()
+        conn = self._conectar()
+        try:
+            linha = conn.execute(
+                "SELECT valor, expira_em FROM cache_entradas WHERE namespace = ? AND chave = ?",
+                (self.namespace, chave),
+            ).fetchone()
+            if linha is None or (linha[1] is not None and linha[1] < agora):
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE cache_entradas SET ultimo_acesso = ? WHERE namespace = ? AND chave = ?",
+                (agora, self.namespace, chave),
+            )
+            self.hits += 1
+            return bytes(linha[0])
+        finally:
+            conn.close()
+
+    def gravar(self, chave: str, valor: bytes, ttl: Optional[float] = None) -> None:
+        """Grava o valor e despeja as entradas menos usadas acima do limite."""
+
+        agora = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expira_em = agora + ttl if ttl else None
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entradas "
+                "(namespace, chave, valor, tamanho, expira_em, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, chave, sqlite3.Binary(valor), len(valor), expira_em, agora),
+            )
+            conn.execute(
+                "DELETE FROM cache_entradas WHERE namespace = ? AND expira_em IS NOT NULL "
+                "AND expira_em < ?",
+                (self.namespace, agora),
+            )
+            conn.execute(
+                """
+                DELETE FROM cache_entradas
+                WHERE namespace = ? AND chave IN (
+                    SELECT chave FROM (
+                        SELECT chave, SUM(tamanho) OVER (
+                            ORDER BY ultimo_acesso DESC, chave
+                        ) AS acumulado
+                        FROM cache_entradas WHERE namespace = ?
+                    ) WHERE acumulado > ?
+                )
+                """,
+                (self.namespace, self.namespace, self.max_bytes),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def remover(self, chave: str) -> None:
+        conn = self._conectar()
+        try:
+            conn.execute(
+                "DELETE FROM cache_entradas WHERE namespace = ? AND chave = ?",
+                (self.namespace, chave),
+            )
+        finally:
+            conn.close()
+
+    def limpar(self) -> None:
+        """Remove todas as entradas do namespace."""
+
+        conn = self._conectar()
+        try:
+            conn.execute("DELETE FROM cache_entradas WHERE namespace = ?", (self.namespace,))
+        finally:
+            conn.close()
+
+    def obter_json(self, chave: str) -> Optional[Any]:
+        valor = self.obter(chave)
+        return None if valor is None else json.loads(valor.decode("utf-8"))
+
+    def gravar_json(self, chave: str, valor: Any, ttl: Optional[float] = None) -> None:
+        self.gravar(chave, json.dumps(valor, default=str).encode("utf-8"), ttl=ttl)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Resumo de ocupação do namespace e contadores de acerto deste processo."""
+
+        conn = self._conectar()
+        try:
+            entradas, tamanho = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM cache_entradas WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            "namespace": self.namespace,
+            "entradas": entradas,
+            "bytes": tamanho,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
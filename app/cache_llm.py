@@ -0,0 +1,115 @@
+"""Cache de respostas de LLM compartilhado entre processos.
+
+Implementa a interface ``BaseCache`` do LangChain sobre o ``CacheSQLite``, então
+API, workers e Streamlit reaproveitam as mesmas respostas. A chave combina o
+modelo com o hash do prompt normalizado e dos parâmetros da chamada (esquema de
+saída, temperatura etc.). Cada agente tem seu próprio namespace, com TTL e
+limite de tamanho (LRU) próprios: a verificação de segurança e a extração
+repetem-se por dias, enquanto as respostas do coach envelhecem rápido.
+
+TTLs em segundos podem ser ajustados por ``MONEYTORA_LLM_CACHE_TTLS`` (JSON,
+``0`` desliga a expiração) e o cache inteiro pode ser desligado com
+``MONEYTORA_LLM_CACHE=0``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import warnings
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+from app.cache import CacheSQLite
+
+CACHE_LLM_ATIVO = os.getenv("MONEYTORA_LLM_CACHE", "1") != "0"
+CACHE_LLM_MAX_BYTES = int(os.getenv("MONEYTORA_LLM_CACHE_MB", "50")) * 1024 * 1024
+
+_DIA = 24 * 60 * 60
+TTL_PADRAO = 60 * 60
+TTLS_POR_AGENTE: Dict[str, float] = {
+    "seguranca": 30 * _DIA,
+    "extrator": 30 * _DIA,
+    # Coach e consultor SQL recebem resultados do banco no prompt; mesmo assim,
+    # mantemos o TTL curto para não repetir uma formulação antiga indefinidamente.
+    "coach": 10 * 60,
+    "sql": 10 * 60,
+    **json.loads(os.getenv("MONEYTORA_LLM_CACHE_TTLS", "{}")),
+}
+
+_TIPOS_PERMITIDOS = [Generation, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk]
+# O prompt chega serializado em JSON: quebras de linha aparecem como ``\n``.
+_ESPACOS = re.compile(r"(?:\s|\\[nrt])+")
+
+
+def normalizar_prompt(prompt: str) -> str:
+    """Colapsa espaços em branco para que variações de formatação reaproveitem a resposta."""
+
+    return _ESPACOS.sub(" ", prompt).strip()
+
+
+class CacheLLM(BaseCache):
+    """``BaseCache`` do LangChain persistido no ``CacheSQLite``, por agente."""
+
+    def __init__(
+        self,
+        agente: str,
+        modelo: str,
+        ttl: Optional[float] = None,
+        max_bytes: int = CACHE_LLM_MAX_BYTES,
+        caminho: Optional[str] = None,
+    ) -> None:
+        self.agente = agente
+        self.modelo = modelo
+        ttl = TTLS_POR_AGENTE.get(agente, TTL_PADRAO) if ttl is None else ttl
+        self._cache = CacheSQLite(f"llm:{agente}", max_bytes=max_bytes, ttl=ttl or None, caminho=caminho)
+
+    def chave(self, prompt: str, llm_string: str) -> str:
+        conteudo = f"{llm_string}\0{normalizar_prompt(prompt)}".encode("utf-8")
+        return f"{self.modelo}:{hashlib.sha256(conteudo).hexdigest()}"
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        valor = self._cache.obter(self.chave(prompt, llm_string))
+        if valor is None:
+            return None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return loads(valor.decode("utf-8"), allowed_objects=_TIPOS_PERMITIDOS)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self._cache.gravar(self.chave(prompt, llm_string), dumps(list(return_val)).encode("utf-8"))
+
+    def clear(self, **kwargs: Any) -> None:
+        self._cache.limpar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {**self._cache.estatisticas(), "ttl": self._cache.ttl}
+
+
+_caches: Dict[Tuple[str, str], CacheLLM] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_llm(agente: str, modelo: str) -> Optional[CacheLLM]:
+    """Retorna o cache compartilhado do agente para ``modelo``, ou ``None`` se desligado."""
+
+    if not CACHE_LLM_ATIVO:
+        return None
+    with _caches_lock:
+        if (agente, modelo) not in _caches:
+            _caches[(agente, modelo)] = CacheLLM(agente, modelo)
+        return _caches[(agente, modelo)]
+
+
+def metricas_cache() -> Dict[str, Dict[str, Any]]:
+    """Ocupação, TTL e acertos/faltas do cache de cada agente e modelo já utilizados."""
+
+    with _caches_lock:
+        caches = dict(_caches)
+    return {f"{agente}:{modelo}": cache.estatisticas() for (agente, modelo), cache in caches.items()}
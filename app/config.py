@@ -9,3 +9,12 @@ GROQ_API = os.getenv("GROQ_API")
 # Não levantamos exceções automaticamente para permitir que o restante da aplicação seja
 # carregado em ambientes onde a chave ainda não foi configurada. Os módulos que dependem
 # diretamente da chave devem tratar a ausência de forma explícita.
+
+# Arquivo SQLite compartilhado pelos caches persistentes (relatórios, LLM, OCR...).
+CACHE_PATH = os.getenv("MONEYTORA_CACHE_PATH", "moneytora_cache.db")
+# Checkpoints do LangGraph, usados para retomar ingestões interrompidas.
+CHECKPOINT_PATH = os.getenv("MONEYTORA_CHECKPOINT_PATH", "moneytora_checkpoints.db")
+
+# Quando ativo, o extrator também sugere a categoria (sem chamadas extras ao LLM) e o
+# grafo padrão passa a usar essa sugestão para empresas ainda desconhecidas.
+EXTRACAO_COM_CATEGORIA = os.getenv("MONEYTORA_EXTRACAO_COM_CATEGORIA", "false").lower() in ("1", "true", "sim")
@@ -1,10 +1,41 @@
-"""Configuração do banco de dados e modelos ORM."""
+"""Configuração do banco de dados e modelos ORM.
+
+Por padrão todos os clientes ficam em ``moneytora.db``. Com
+``MONEYTORA_DB_SHARDING`` as tabelas por cliente (transações, resumos,
+estatísticas e categorias preferidas) passam a viver em arquivos SQLite
+separados, um por cliente (``cliente``) ou por grupo de clientes (``hash``),
+cada um com o seu lock de escrita, ``VACUUM`` e backup. As tabelas globais
+(classificação de empresas, idempotência) continuam no banco principal. O
+``RoteadorBanco`` entrega a sessão certa para cada ``cliente_id``.
+"""
 from __future__ import annotations
 
 import datetime
+import hashlib
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
 from contextlib import contextmanager
+from glob import glob
+from typing import Callable, Dict, List, Optional, TypeVar
 
-from sqlalchemy import Column, Date, DateTime, Float, Integer, String, create_engine
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    String,
+    create_engine,
+    func,
+    inspect,
+    text,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 
@@ -27,7 +58,39 @@ class Transacao(Base):
     empresa = Column(String, nullable=False)
     data = Column(Date, nullable=False)
     categoria = Column(String, nullable=False, index=True)
+    cliente_id = Column(String, nullable=True)
+    # Identificador do lançamento no extrato de origem (FITID do OFX); nulo quando
+    # a transação não veio de importação.
+    fitid = Column(String, nullable=True)
     data_criacao = Column(DateTime, default=datetime.datetime.utcnow)
+    data_atualizacao = Column(
+        DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
+    )
+
+    __table_args__ = (
+        # Índice de cobertura para a impressão digital dos relatórios: contagem, soma e
+        # carimbo de modificação de um período são lidos sem tocar na tabela.
+        Index("ix_transacoes_data_cobertura", "data", "valor", "data_atualizacao"),
+        # O FITID só se repete dentro do mesmo cliente; sem cliente, vale a chave vazia
+        # (no SQLite, NULLs nunca conflitam em um índice único).
+        Index(
+            "ux_transacoes_cliente_fitid",
+            func.coalesce(cliente_id, ""),
+            fitid,
+            unique=True,
+        ),
+        # Índices por cliente: consultas de um cliente percorrem apenas as suas linhas.
+        # O primeiro também cobre a impressão digital dos relatórios de um cliente.
+        Index(
+            "ix_transacoes_cliente_data_cobertura",
+            "cliente_id",
+            "data",
+            "valor",
+            "data_atualizacao",
+        ),
+        Index("ix_transacoes_cliente_categoria_data", "cliente_id", "categoria", "data"),
+        Index("ix_transacoes_cliente_empresa", "cliente_id", "empresa"),
+    )
 
 
 class EmpresaClassificacao(Base):
@@ -40,14 +103,288 @@ class EmpresaClassificacao(Base):
     categoria = Column(String, nullable=False)
 
 
+class EmpresaClassificacaoCliente(Base):
+    """Categoria escolhida por um cliente para uma empresa, com precedência sobre a global."""
+
+    __tablename__ = "empresa_classificacao_cliente"
+
+    cliente_id = Column(String, primary_key=True)
+    nome_empresa = Column(String, primary_key=True)
+    categoria = Column(String, nullable=False)
+
+
+class EstatisticaCategoria(Base):
+    """Esboço incremental (P²) dos quartis dos valores de cada categoria de um cliente."""
+
+    __tablename__ = "estatisticas_cliente_categoria"
+
+    # Transações sem cliente entram sob a chave vazia, como em ``ResumoMensal``.
+    cliente_id = Column(String, primary_key=True, default="")
+    categoria = Column(String, primary_key=True)
+    observacoes = Column(Integer, nullable=False, default=0)
+    q1 = Column(Float)
+    q3 = Column(Float)
+    # Marcadores dos estimadores em JSON compacto (ver ``app.estatisticas``).
+    estado = Column(String, nullable=False, default="{}")
+
+
+class ResumoMensal(Base):
+    """Resumo de um mês de transações de um cliente, mantido a cada escrita."""
+
+    __tablename__ = "resumos_mensais"
+
+    # Transações sem cliente são resumidas sob a chave vazia.
+    cliente_id = Column(String, primary_key=True, default="")
+    mes = Column(String, primary_key=True)  # AAAA-MM
+    # Incrementada a cada alteração: identifica a versão dos dados resumidos.
+    versao = Column(Integer, nullable=False, default=0)
+    total_gasto = Column(Float, nullable=False, default=0.0)
+    total_entradas = Column(Float, nullable=False, default=0.0)
+    quantidade = Column(Integer, nullable=False, default=0)
+    # JSON compacto: {categoria: [gasto, qtd]}, {empresa: [gasto, qtd]} e as
+    # maiores despesas atípicas do mês (ver ``app.resumo_mensal``).
+    categorias = Column(String, nullable=False, default="{}")
+    empresas = Column(String, nullable=False, default="{}")
+    anomalias = Column(String, nullable=False, default="[]")
+    atualizado_em = Column(
+        DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
+    )
+
+
+class ChaveIdempotencia(Base):
+    """Resultado armazenado de uma requisição identificada por ``Idempotency-Key``."""
+
+    __tablename__ = "chaves_idempotencia"
+
+    chave = Column(String, primary_key=True)
+    hash_requisicao = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # em_andamento | concluido
+    status_code = Column(Integer)
+    transacao_id = Column(Integer)
+    resposta = Column(String)
+    criado_em = Column(DateTime, default=datetime.datetime.utcnow)
+    # Início do arrendamento da reserva ``em_andamento``; identifica a execução dona.
+    reservado_em = Column(DateTime)
+    # Última renovação do arrendamento pela execução dona (ver ``app.idempotencia``).
+    renovado_em = Column(DateTime)
+    expira_em = Column(DateTime, nullable=False, index=True)
+
+
+# Tabelas que acompanham o cliente para o seu arquivo quando o banco é fragmentado.
+TABELAS_CLIENTE = [
+    Transacao.__table__,
+    ResumoMensal.__table__,
+    EstatisticaCategoria.__table__,
+    EmpresaClassificacaoCliente.__table__,
+]
+
+
+# Índices substituídos por versões mais novas (o FITID passou a ser único por cliente
+# e o índice simples de ``cliente_id`` é coberto pelos índices compostos).
+_INDICES_OBSOLETOS = ("ux_transacoes_fitid", "ix_transacoes_cliente_id")
+# Esboços por categoria misturavam todos os clientes; os por cliente recomeçam vazios.
+_TABELAS_OBSOLETAS = ("estatisticas_categoria",)
+
+
+def _migrar_esquema(alvo: Engine = engine, tabelas: Optional[list] = None) -> None:
+    """Adiciona colunas e índices novos em bancos criados por versões anteriores.
+
+    ``create_all`` só cria tabelas inexistentes; como não usamos uma ferramenta de
+    migração, as colunas anuláveis e os índices adicionados depois são aplicados aqui.
+    """
+
+    inspetor = inspect(alvo)
+    with alvo.begin() as conn:
+        for indice in _INDICES_OBSOLETOS:
+            conn.execute(text(f"DROP INDEX IF EXISTS {indice}"))
+        for tabela_obsoleta in _TABELAS_OBSOLETAS:
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabela_obsoleta}"))
+        # Índices de expressão não aparecem na reflexão: consultamos o catálogo.
+        indices = {
+            nome for (nome,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        }
+        for tabela in tabelas or Base.metadata.sorted_tables:
+            if not inspetor.has_table(tabela.name):
+                continue
+            existentes = {coluna["name"] for coluna in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name not in existentes:
+                    tipo = coluna.type.compile(dialect=alvo.dialect)
+                    conn.execute(
+                        text(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}")
+                    )
+            for indice in tabela.indexes:
+                if indice.name not in indices:
+                    indice.create(bind=conn)
+
+
+def _preparar_esquema(alvo: Engine = engine, tabelas: Optional[list] = None, tentativas: int = 3) -> None:
+    """Cria as tabelas inexistentes e aplica ``_migrar_esquema``.
+
+    Processos que sobem juntos (ex.: os workers ``spawn`` dos relatórios em lote) podem
+    criar o mesmo esquema ao mesmo tempo; quem perde a corrida ("already exists")
+    simplesmente repete a verificação.
+    """
+
+    for tentativa in range(tentativas):
+        try:
+            Base.metadata.create_all(bind=alvo, tables=tabelas)
+            _migrar_esquema(alvo, tabelas)
+            return
+        except OperationalError:
+            if tentativa == tentativas - 1:
+                raise
+
+
 # Criamos as tabelas automaticamente durante o bootstrap da aplicação.
-Base.metadata.create_all(bind=engine)
+_preparar_esquema()
+
+
+_T = TypeVar("_T")
+
+
+class RoteadorBanco:
+    """Entrega engines e sessões pelo ``cliente_id`` conforme o modo de fragmentação.
+
+    Modos: ``unico`` (tudo no banco principal), ``cliente`` (um arquivo por cliente)
+    e ``hash`` (``buckets`` arquivos, com o cliente escolhido por CRC32). Sem
+    ``cliente_id``, a sessão é sempre do banco principal. Os engines dos arquivos
+    ficam em um LRU limitado a ``max_engines``; o menos usado é descartado
+    (``dispose``) ao abrir um novo, e o esquema é garantido a cada abertura.
+    """
+
+    MODOS = ("unico", "cliente", "hash")
+
+    def __init__(
+        self,
+        modo: str = "unico",
+        diretorio: str = "shards",
+        buckets: int = 16,
+        max_engines: int = 32,
+        principal: Engine = engine,
+    ) -> None:
+        if modo not in self.MODOS:
+            raise ValueError(f"Modo de fragmentação desconhecido: {modo}")
+        self.modo = modo
+        self.diretorio = diretorio
+        self.buckets = buckets
+        self.max_engines = max_engines
+        self.principal = principal
+        self._engines: "OrderedDict[str, Engine]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aberturas = 0
+        self.descartes = 0
+
+    @property
+    def fragmentado(self) -> bool:
+        return self.modo != "unico"
+
+    def shard(self, cliente_id: Optional[str]) -> Optional[str]:
+        """Nome do arquivo (sem extensão) do cliente; ``None`` para o banco principal."""
+
+        if not self.fragmentado or not cliente_id:
+            return None
+        if self.modo == "hash":
+            return f"bucket_{zlib.crc32(cliente_id.encode('utf-8')) % self.buckets:03d}"
+        # O sufixo do hash evita colisões entre ids que ficam iguais após a limpeza.
+        legivel = re.sub(r"[^A-Za-z0-9_.-]", "_", cliente_id)[:40]
+        return f"cliente_{legivel}_{hashlib.sha1(cliente_id.encode('utf-8')).hexdigest()[:8]}"
+
+    def caminho(self, cliente_id: Optional[str]) -> str:
+        """Caminho do arquivo SQLite que guarda as transações do cliente."""
+
+        return self.caminho_do_shard(self.shard(cliente_id))
+
+    def caminho_do_shard(self, nome: Optional[str]) -> str:
+        if nome is None:
+            return self.principal.url.database
+        return os.path.join(self.diretorio, f"{nome}.db")
 
+    def shards(self) -> List[str]:
+        """Arquivos de shard já criados, em ordem alfabética."""
 
-def get_db() -> Session:
-    """Fornece uma sessão de banco para uso em endpoints FastAPI."""
+        return sorted(
+            os.path.splitext(os.path.basename(arquivo))[0]
+            for arquivo in glob(os.path.join(self.diretorio, "*.db"))
+        )
 
-    db = SessionLocal()
+    def _abrir(self, nome: str) -> Engine:
+        os.makedirs(self.diretorio, exist_ok=True)
+        novo = create_engine(
+            f"sqlite:///{self.caminho_do_shard(nome)}",
+            connect_args={"check_same_thread": False},
+        )
+        _preparar_esquema(novo, TABELAS_CLIENTE)
+        return novo
+
+    def engine_do_shard(self, nome: Optional[str]) -> Engine:
+        if nome is None:
+            return self.principal
+        with self._lock:
+            if nome in self._engines:
+                self._engines.move_to_end(nome)
+                return self._engines[nome]
+            novo = self._engines[nome] = self._abrir(nome)
+            self.aberturas += 1
+            while len(self._engines) > self.max_engines:
+                # Sessões em andamento terminam normalmente: o ``dispose`` só fecha
+                # as conexões ociosas e descarta as demais quando forem devolvidas.
+                _, antigo = self._engines.popitem(last=False)
+                antigo.dispose()
+                self.descartes += 1
+            return novo
+
+    def engine(self, cliente_id: Optional[str]) -> Engine:
+        return self.engine_do_shard(self.shard(cliente_id))
+
+    def sessao(self, cliente_id: Optional[str] = None) -> Session:
+        if self.shard(cliente_id) is None:
+            return SessionLocal()
+        return SessionLocal(bind=self.engine(cliente_id))
+
+    def agregar(self, consulta: Callable[[Session], _T]) -> Dict[str, _T]:
+        """Executa ``consulta`` no banco principal e em cada shard (consultas administrativas).
+
+        Retorna o resultado por banco; o principal aparece como ``"principal"``.
+        """
+
+        resultados: Dict[str, _T] = {}
+        for nome in [None, *self.shards()] if self.fragmentado else [None]:
+            session = SessionLocal(bind=self.engine_do_shard(nome))
+            try:
+                resultados[nome or "principal"] = consulta(session)
+            finally:
+                session.close()
+        return resultados
+
+    def metricas(self) -> Dict[str, object]:
+        return {
+            "modo": self.modo,
+            "diretorio": self.diretorio if self.fragmentado else None,
+            "buckets": self.buckets if self.modo == "hash" else None,
+            "shards": len(self.shards()) if self.fragmentado else 0,
+            "engines_abertos": len(self._engines),
+            "max_engines": self.max_engines,
+            "aberturas": self.aberturas,
+            "descartes": self.descartes,
+        }
+
+
+roteador = RoteadorBanco(
+    modo=os.getenv("MONEYTORA_DB_SHARDING", "unico"),
+    diretorio=os.getenv("MONEYTORA_DB_SHARD_DIR", "shards"),
+    buckets=int(os.getenv("MONEYTORA_DB_SHARD_BUCKETS", "16")),
+    max_engines=int(os.getenv("MONEYTORA_DB_MAX_ENGINES", "32")),
+)
+
+
+def get_db(cliente_id: Optional[str] = None) -> Session:
+    """Fornece uma sessão de banco para uso em endpoints FastAPI.
+
+    O ``cliente_id`` vem do parâmetro de consulta de mesmo nome e escolhe o shard.
+    """
+
+    db = roteador.sessao(cliente_id)
     try:
         yield db
     finally:
@@ -55,10 +392,13 @@ def get_db() -> Session:
 
 
 @contextmanager
-def session_scope() -> Session:
-    """Fornece um gerenciador de contexto para operações fora dos endpoints."""
+def session_scope(cliente_id: Optional[str] = None) -> Session:
+    """Fornece um gerenciador de contexto para operações fora dos endpoints.
+
+    Com ``cliente_id``, a sessão é do banco (shard) que guarda os dados do cliente.
+    """
 
-    session = SessionLocal()
+    session = roteador.sessao(cliente_id)
     try:
         yield session
         session.commit()
@@ -0,0 +1,185 @@
+"""Estatísticas incrementais por categoria para detecção de transações atípicas.
+
+Cada categoria de cada cliente mantém dois estimadores P² (Jain & Chlamtac, 1985)
+para o primeiro e o terceiro quartis dos valores absolutos: o padrão de gasto de um
+cliente não define o que é atípico para outro. Os estimadores ocupam cinco marcadores
+cada, são atualizados em O(1) a cada inserção e persistidos em JSON compacto na
+tabela ``estatisticas_cliente_categoria``. Os quartis correntes também ficam em colunas
+próprias, então a consulta do limite IQR é uma leitura por chave primária.
+
+O P² não permite retirar observações: alterações e exclusões de transações não
+são refletidas nos esboços, que descrevem os valores conforme foram inseridos. O
+desvio é aceitável para um alerta de valor atípico, que só precisa da ordem de
+grandeza dos quartis.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from . import database
+
+# Abaixo desse número de observações os quartis são instáveis demais para alertar.
+MIN_OBSERVACOES = 8
+FATOR_IQR = 1.5
+# Releituras de um esboço alterado por outra escrita antes de desistir.
+MAX_TENTATIVAS = 5
+
+
+class EstimadorP2:
+    """Estimador P² de um único quantil ``p`` sem armazenar as observações."""
+
+    def __init__(self, p: float, estado: Optional[Dict[str, Any]] = None) -> None:
+        self.p = p
+        estado = estado or {}
+        self.q: List[float] = list(estado.get("q", []))
+        self.n: List[int] = list(estado.get("n", []))
+        self.np: List[float] = list(estado.get("np", []))
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def para_dict(self) -> Dict[str, Any]:
+        if not self.n:
+            return {"q": self.q}
+        return {"q": [round(v, 6) for v in self.q], "n": self.n, "np": [round(v, 6) for v in self.np]}
+
+    def adicionar(self, x: float) -> None:
+        if not self.n:
+            # Fase inicial: guardamos as cinco primeiras observações ordenadas.
+            self.q.append(x)
+            self.q.sort()
+            if len(self.q) == 5:
+                p = self.p
+                self.n = [1, 2, 3, 4, 5]
+                self.np = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+            return
+
+        q, n = self.q, self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(1, 5) if x < q[i]) - 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in range(1, 4):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                passo = 1 if d > 0 else -1
+                candidato = self._parabolica(i, passo)
+                if not q[i - 1] < candidato < q[i + 1]:
+                    candidato = q[i] + passo * (q[i + passo] - q[i]) / (n[i + passo] - n[i])
+                q[i] = candidato
+                n[i] += passo
+
+    def _parabolica(self, i: int, d: int) -> float:
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def valor(self) -> Optional[float]:
+        if self.n:
+            return self.q[2]
+        if not self.q:
+            return None
+        # Com menos de cinco observações usamos o percentil exato interpolado.
+        k = (len(self.q) - 1) * self.p
+        f = int(k)
+        c = min(f + 1, len(self.q) - 1)
+        return self.q[f] + (self.q[c] - self.q[f]) * (k - f)
+
+
+def _carregar(db: Session, chave: Tuple[str, str]) -> Tuple[int, EstimadorP2, EstimadorP2]:
+    """Lê o esboço direto do banco; ``observacoes`` serve de versão para a gravação."""
+
+    tabela = database.EstatisticaCategoria.__table__
+    cliente_id, categoria = chave
+    linha = db.execute(
+        select(tabela.c.observacoes, tabela.c.estado).where(
+            tabela.c.cliente_id == cliente_id, tabela.c.categoria == categoria
+        )
+    ).first()
+    if linha is None:
+        return 0, EstimadorP2(0.25), EstimadorP2(0.75)
+    estado = json.loads(linha.estado or "{}")
+    return linha.observacoes, EstimadorP2(0.25, estado.get("q1")), EstimadorP2(0.75, estado.get("q3"))
+
+
+def _gravar(
+    db: Session, chave: Tuple[str, str], lidas: int, novas: int, q1: EstimadorP2, q3: EstimadorP2
+) -> bool:
+    """Grava se ninguém alterou o esboço desde a leitura; ``False`` caso contrário."""
+
+    modelo = database.EstatisticaCategoria
+    cliente_id, categoria = chave
+    valores = {
+        "observacoes": lidas + novas,
+        "q1": q1.valor(),
+        "q3": q3.valor(),
+        "estado": json.dumps({"q1": q1.para_dict(), "q3": q3.para_dict()}, separators=(",", ":")),
+    }
+    if not lidas:
+        comando = (
+            insert(modelo.__table__)
+            .prefix_with("OR IGNORE")
+            .values(cliente_id=cliente_id, categoria=categoria, **valores)
+        )
+    else:
+        comando = (
+            update(modelo)
+            .where(modelo.cliente_id == cliente_id, modelo.categoria == categoria, modelo.observacoes == lidas)
+            .values(**valores)
+        )
+    return db.execute(comando).rowcount == 1
+
+
+def registrar_valores(db: Session, itens: Iterable[Tuple[Optional[str], str, float]]) -> None:
+    """Atualiza os esboços com as triplas ``(cliente_id, categoria, valor)`` informadas.
+
+    Não realiza ``commit``: a atualização entra na mesma transação da inserção. Cada
+    esboço é gravado com compare-and-swap no número de observações; se outra escrita
+    o alterou depois da leitura, ele é relido e os valores são aplicados de novo.
+    """
+
+    valores: Dict[Tuple[str, str], List[float]] = {}
+    for cliente_id, categoria, valor in itens:
+        valores.setdefault((cliente_id or "", categoria), []).append(abs(valor))
+
+    for chave, novos in valores.items():
+        for _ in range(MAX_TENTATIVAS):
+            lidas, q1, q3 = _carregar(db, chave)
+            for valor in novos:
+                q1.adicionar(valor)
+                q3.adicionar(valor)
+            if _gravar(db, chave, lidas, len(novos), q1, q3):
+                break
+        else:
+            raise RuntimeError(f"Estatística {chave} alterada concorrentemente; tente novamente.")
+
+
+def registrar_valor(db: Session, categoria: str, valor: float, cliente_id: Optional[str] = None) -> None:
+    registrar_valores(db, [(cliente_id, categoria, valor)])
+
+
+def avaliar_anomalia(
+    db: Session, categoria: str, valor: float, cliente_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Compara o valor com o limite ``Q3 + 1.5 * IQR`` corrente da categoria do cliente."""
+
+    registro = db.get(database.EstatisticaCategoria, (cliente_id or "", categoria))
+    if registro is None or registro.observacoes < MIN_OBSERVACOES or registro.q3 is None:
+        return {"anomalia": False, "limite": None}
+
+    limite = registro.q3 + FATOR_IQR * (registro.q3 - registro.q1)
+    return {"anomalia": abs(valor) > limite, "limite": limite}
@@ -1,12 +1,48 @@
 """Definição do grafo de orquestração responsável pelo processamento das transações."""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Union
+
+from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import END, StateGraph
+from langgraph.types import Send
+from sqlalchemy.exc import OperationalError
+
+try:  # pragma: no cover - depende do pacote opcional instalado
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:  # pragma: no cover
+    SqliteSaver = None
 
-from app.agents.extrator import extrair_dados_transacao
+from app.agents.extrator import (
+    extrair_dados_categorizados,
+    extrair_dados_transacao,
+    extrair_transacoes,
+)
+from app.config import CHECKPOINT_PATH, EXTRACAO_COM_CATEGORIA
 from app.database import session_scope
-from app import repository, schemas
-from app.tools.classificacao_tool import classificar_empresa_por_categoria
+from app import estatisticas, repository, schemas
+from app.llm import ERROS_INDISPONIBILIDADE
+from app.persistencia import fila_persistencia
+from app.tools.classificacao_tool import classificar_empresa
+
+from .state import GraphState, GraphStateMultiplo, ItemState
+
+
+# Falhas que valem uma nova tentativa (banco bloqueado, LLM com fila esgotada,
+# sem resposta no prazo ou com o circuito aberto).
+# Elas interrompem a execução em vez de virar ``erro`` no estado, para que a
+# ingestão possa ser retomada do último checkpoint sem repetir a extração.
+ERROS_TRANSITORIOS = (OperationalError, *ERROS_INDISPONIBILIDADE)
 
-from .state import GraphState
+# Ingestões pendentes mais antigas que isso são descartadas pela poda dos checkpoints.
+IDADE_MAXIMA_INGESTAO = timedelta(hours=float(os.getenv("MONEYTORA_CHECKPOINT_TTL_HOURS", "72")))
+_INTERVALO_PODA = 300.0
+_ultima_poda = 0.0
+_poda_lock = threading.Lock()
 
 
 # -----------------------
@@ -19,13 +55,32 @@ def node_extrair_dados(state: GraphState) -> GraphState:
     try:
         dados = extrair_dados_transacao(state["texto_original"])
         state.update(dados.model_dump())
+    except ERROS_TRANSITORIOS:
+        raise
+    except Exception as exc:  # pragma: no cover - depende do LLM
+        state["erro"] = f"Falha na extração: {exc}"
+    return state
+
+
+def node_extrair_categorizado(state: GraphState) -> GraphState:
+    """Variante do extrator que também sugere a categoria na mesma chamada ao LLM."""
+
+    try:
+        dados = extrair_dados_categorizados(state["texto_original"])
+        state.update(dados.model_dump())
+    except ERROS_TRANSITORIOS:
+        raise
     except Exception as exc:  # pragma: no cover - depende do LLM
         state["erro"] = f"Falha na extração: {exc}"
     return state
 
 
 def node_classificar(state: GraphState) -> GraphState:
-    """Classifica a empresa em uma categoria utilizando a ferramenta dedicada."""
+    """Classifica a empresa em uma categoria utilizando a ferramenta dedicada.
+
+    Se o extrator sugeriu uma categoria, ela é usada para empresas que o histórico
+    e o mapeamento não conhecem.
+    """
 
     if state.get("erro"):
         return state
@@ -36,15 +91,37 @@ def node_classificar(state: GraphState) -> GraphState:
         return state
 
     try:
-        categoria = classificar_empresa_por_categoria.invoke(empresa)
+        categoria = classificar_empresa(
+            empresa, state.get("categoria_sugerida"), cliente_id=state.get("cliente_id")
+        )
         state["categoria"] = categoria
+    except ERROS_TRANSITORIOS:
+        raise
     except Exception as exc:  # pragma: no cover - defensivo
         state["erro"] = f"Falha na classificação: {exc}"
     return state
 
 
+def node_detectar_anomalia(state: GraphState) -> GraphState:
+    """Sinaliza transações atípicas pelos quartis incrementais da categoria do cliente."""
+
+    if state.get("erro"):
+        return state
+
+    try:
+        with session_scope(state.get("cliente_id")) as session:
+            avaliacao = estatisticas.avaliar_anomalia(
+                session, state["categoria"], state.get("valor") or 0.0, state.get("cliente_id")
+            )
+        state["anomalia"] = avaliacao["anomalia"]
+        state["limite_anomalia"] = avaliacao["limite"]
+    except Exception:  # pragma: no cover - a detecção nunca bloqueia a ingestão
+        state["anomalia"] = None
+    return state
+
+
 def node_persistir(state: GraphState) -> GraphState:
-    """Persiste a transação extraída no banco de dados SQLite."""
+    """Persiste a transação extraída no banco de dados SQLite (via fila de escrita)."""
 
     if state.get("erro"):
         return state
@@ -58,20 +135,97 @@ def node_persistir(state: GraphState) -> GraphState:
             state["erro"] = "Dados insuficientes para persistir a transação."
             return state
 
-        with session_scope() as session:
-            dados_transacao = schemas.TransacaoCreate(
-                valor=valor,
-                empresa=empresa,
-                data=data,
-                categoria=categoria,
-            )
-            nova_transacao = repository.criar_transacao(session, dados_transacao)
-            state["transacao_id"] = nova_transacao.id
+        dados_transacao = schemas.TransacaoCreate(
+            valor=valor,
+            empresa=empresa,
+            data=data,
+            categoria=categoria,
+            cliente_id=state.get("cliente_id"),
+        )
+        # A escrita vai para a fila do escritor único, que agrupa execuções
+        # concorrentes do grafo em um só commit.
+        state["transacao_id"] = fila_persistencia.persistir(dados_transacao)
+    except ERROS_TRANSITORIOS:
+        raise
     except Exception as exc:  # pragma: no cover - operações de IO
         state["erro"] = f"Falha na persistência: {exc}"
     return state
 
 
+def node_extrair_multiplas(state: GraphStateMultiplo) -> GraphStateMultiplo:
+    """Extrai todas as transações do texto com uma única chamada ao LLM."""
+
+    try:
+        dados = extrair_transacoes(state["texto_original"])
+    except ERROS_TRANSITORIOS:
+        raise
+    except Exception as exc:  # pragma: no cover - depende do LLM
+        return {"erro": f"Falha na extração: {exc}"}
+    if not dados.transacoes:
+        return {"erro": "Nenhuma transação identificada no texto."}
+    return {"transacoes": [transacao.model_dump() for transacao in dados.transacoes]}
+
+
+def node_classificar_item(state: ItemState) -> GraphStateMultiplo:
+    """Classifica e avalia uma das transações extraídas (executado em paralelo)."""
+
+    transacao = {**state["transacao"], "indice": state["indice"]}
+    if not transacao.get("empresa"):
+        transacao["erro"] = "Empresa não identificada para classificação."
+        return {"classificadas": [transacao]}
+
+    try:
+        transacao["categoria"] = classificar_empresa(
+            transacao["empresa"], transacao.get("categoria_sugerida"), cliente_id=state["cliente_id"]
+        )
+    except ERROS_TRANSITORIOS:
+        raise
+    except Exception as exc:  # pragma: no cover - defensivo
+        transacao["erro"] = f"Falha na classificação: {exc}"
+        return {"classificadas": [transacao]}
+
+    try:
+        with session_scope(state["cliente_id"]) as session:
+            avaliacao = estatisticas.avaliar_anomalia(
+                session, transacao["categoria"], transacao.get("valor") or 0.0, state["cliente_id"]
+            )
+        transacao["anomalia"] = avaliacao["anomalia"]
+    except Exception:  # pragma: no cover - a detecção nunca bloqueia a ingestão
+        transacao["anomalia"] = None
+    return {"classificadas": [transacao]}
+
+
+def node_persistir_lote(state: GraphStateMultiplo) -> GraphStateMultiplo:
+    """Persiste todas as transações classificadas em uma única transação do banco."""
+
+    classificadas = sorted(state.get("classificadas", []), key=lambda item: item["indice"])
+    erros = [f"Transação {item['indice'] + 1}: {item['erro']}" for item in classificadas if item.get("erro")]
+    validas = [item for item in classificadas if not item.get("erro")]
+    if not validas:
+        return {"erro": "; ".join(erros) or "Nenhuma transação válida para persistir.", "erros": erros}
+
+    try:
+        with session_scope(state.get("cliente_id")) as session:
+            ids = repository.criar_transacoes(
+                session,
+                [
+                    schemas.TransacaoCreate(
+                        valor=item["valor"],
+                        empresa=item["empresa"],
+                        data=item["data"],
+                        categoria=item["categoria"],
+                        cliente_id=state.get("cliente_id"),
+                    )
+                    for item in validas
+                ],
+            )
+    except ERROS_TRANSITORIOS:
+        raise
+    except Exception as exc:  # pragma: no cover - operações de IO
+        return {"erro": f"Falha na persistência: {exc}", "erros": erros}
+    return {"transacao_ids": ids, "erros": erros}
+
+
 # -----------------------
 # Regras de transição
 # -----------------------
@@ -79,26 +233,193 @@ def node_persistir(state: GraphState) -> GraphState:
 def deve_continuar(state: GraphState) -> str:
     """Define se o fluxo deve prosseguir para a persistência ou encerrar."""
 
-    return "__end__" if state.get("erro") else "persistir_dados"
+    return "__end__" if state.get("erro") else "detectar_anomalia"
+
+
+def distribuir_classificacao(state: GraphStateMultiplo) -> Union[str, List[Send]]:
+    """Abre um ramo de classificação para cada transação extraída."""
+
+    if state.get("erro"):
+        return END
+    return [
+        Send(
+            "classificar_item",
+            {"indice": indice, "transacao": transacao, "cliente_id": state.get("cliente_id")},
+        )
+        for indice, transacao in enumerate(state["transacoes"])
+    ]
 
 
 # -----------------------
 # Construção do grafo
 # -----------------------
 
-workflow = StateGraph(GraphState)
-workflow.add_node("extrair_dados", node_extrair_dados)
-workflow.add_node("classificar_categoria", node_classificar)
-workflow.add_node("persistir_dados", node_persistir)
-
-workflow.set_entry_point("extrair_dados")
-workflow.add_edge("extrair_dados", "classificar_categoria")
-workflow.add_conditional_edges(
-    "classificar_categoria",
-    deve_continuar,
-    {"persistir_dados": "persistir_dados", "__end__": END},
+def _construir_grafo(no_extracao) -> StateGraph:
+    workflow = StateGraph(GraphState)
+    workflow.add_node("extrair_dados", no_extracao)
+    workflow.add_node("classificar_categoria", node_classificar)
+    workflow.add_node("detectar_anomalia", node_detectar_anomalia)
+    workflow.add_node("persistir_dados", node_persistir)
+
+    workflow.set_entry_point("extrair_dados")
+    workflow.add_edge("extrair_dados", "classificar_categoria")
+    workflow.add_conditional_edges(
+        "classificar_categoria",
+        deve_continuar,
+        {"detectar_anomalia": "detectar_anomalia", "__end__": END},
+    )
+    workflow.add_edge("detectar_anomalia", "persistir_dados")
+    workflow.add_edge("persistir_dados", END)
+    return workflow
+
+
+def _criar_checkpointer():
+    """Checkpointer durável em SQLite; sem o pacote opcional, apenas em memória."""
+
+    if SqliteSaver is None:  # pragma: no cover
+        return InMemorySaver()
+    conexao = sqlite3.connect(CHECKPOINT_PATH, check_same_thread=False)
+    # Depois de cada checkpoint do WAL, o arquivo volta a no máximo 4 MB.
+    conexao.execute("PRAGMA journal_size_limit = 4194304")
+    return SqliteSaver(conexao)
+
+
+checkpointer = _criar_checkpointer()
+
+workflow = _construir_grafo(
+    node_extrair_categorizado if EXTRACAO_COM_CATEGORIA else node_extrair_dados
 )
-workflow.add_edge("persistir_dados", END)
 
 # ``compile`` converte a definição declarativa acima em uma aplicação executável.
-app_graph = workflow.compile()
+app_graph = workflow.compile(checkpointer=checkpointer)
+
+# Variante que extrai e sugere a categoria em uma única chamada ao LLM.
+app_graph_categorizado = _construir_grafo(node_extrair_categorizado).compile(
+    checkpointer=checkpointer
+)
+
+# Modo de múltiplas transações: uma extração, classificação em paralelo e um commit.
+workflow_multiplo = StateGraph(GraphStateMultiplo)
+workflow_multiplo.add_node("extrair_transacoes", node_extrair_multiplas)
+workflow_multiplo.add_node("classificar_item", node_classificar_item)
+workflow_multiplo.add_node("persistir_lote", node_persistir_lote)
+
+workflow_multiplo.set_entry_point("extrair_transacoes")
+workflow_multiplo.add_conditional_edges(
+    "extrair_transacoes", distribuir_classificacao, ["classificar_item", END]
+)
+workflow_multiplo.add_edge("classificar_item", "persistir_lote")
+workflow_multiplo.add_edge("persistir_lote", END)
+
+app_graph_multiplo = workflow_multiplo.compile(checkpointer=checkpointer)
+
+GRAFOS = {
+    "padrao": app_graph,
+    "categorizado": app_graph_categorizado,
+    "multiplo": app_graph_multiplo,
+}
+
+
+# -----------------------
+# Execução com checkpoints
+# -----------------------
+
+def config_ingestao(ingestao_id: str, grafo: str = "padrao") -> Dict[str, Any]:
+    return {"configurable": {"thread_id": ingestao_id}, "metadata": {"grafo": grafo}}
+
+
+def executar_ingestao(
+    texto: Optional[str],
+    ingestao_id: Optional[str] = None,
+    grafo: str = "padrao",
+    cliente_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Executa a ingestão identificada por ``ingestao_id``, retomando-a se estiver pendente.
+
+    Uma ingestão interrompida por erro transitório continua do último nó concluído
+    (sem nova chamada ao LLM). O checkpoint é gravado só na saída do grafo
+    (``durability="exit"``), e não a cada nó: uma execução bem-sucedida não deixa
+    rastro, e uma interrompida guarda o estado do último passo concluído. Ao
+    terminar, os checkpoints da ingestão são removidos. O ``cliente_id`` fica no
+    estado do grafo e, portanto, também vale na retomada.
+    """
+
+    podar_ingestoes()
+    ingestao_id = ingestao_id or uuid.uuid4().hex
+    app = GRAFOS[grafo]
+    config = config_ingestao(ingestao_id, grafo)
+    pendente = bool(app.get_state(config).next)
+    if not pendente and texto is None:
+        raise LookupError(ingestao_id)
+    entrada = {"texto_original": texto, "cliente_id": cliente_id}
+    estado = app.invoke(None if pendente else entrada, config, durability="exit")
+    checkpointer.delete_thread(ingestao_id)
+    return {**estado, "ingestao_id": ingestao_id, "grafo": grafo}
+
+
+def _ingestoes() -> Dict[str, str]:
+    """Grafo de cada ingestão com checkpoints, da mais recente para a mais antiga."""
+
+    # A listagem é materializada antes de consultar os estados: o saver mantém o
+    # lock da conexão enquanto o iterador está aberto.
+    ingestoes: Dict[str, str] = {}
+    for tupla in checkpointer.list(None):
+        ingestoes.setdefault(
+            tupla.config["configurable"]["thread_id"], tupla.metadata.get("grafo", "padrao")
+        )
+    return ingestoes
+
+
+def podar_ingestoes(forcar: bool = False) -> int:
+    """Remove checkpoints de ingestões concluídas ou pendentes há mais de ``IDADE_MAXIMA_INGESTAO``.
+
+    Executada no máximo a cada poucos minutos; cobre as execuções que terminaram
+    sem chegar ao ``delete_thread`` (ex.: erro não transitório) e as abandonadas.
+    """
+
+    global _ultima_poda
+    with _poda_lock:
+        agora = time.monotonic()
+        if not forcar and agora - _ultima_poda < _INTERVALO_PODA:
+            return 0
+        _ultima_poda = agora
+
+    limite = datetime.now(timezone.utc) - IDADE_MAXIMA_INGESTAO
+    removidas = 0
+    for ingestao_id, grafo in _ingestoes().items():
+        estado = GRAFOS[grafo].get_state(config_ingestao(ingestao_id, grafo))
+        if not estado.next or datetime.fromisoformat(estado.created_at) < limite:
+            checkpointer.delete_thread(ingestao_id)
+            removidas += 1
+    return removidas
+
+
+def listar_ingestoes_pendentes(limite: int = 100) -> List[Dict[str, Any]]:
+    """Lista as ingestões interrompidas que ainda podem ser retomadas."""
+
+    pendentes: List[Dict[str, Any]] = []
+    for ingestao_id, grafo in _ingestoes().items():
+        estado = GRAFOS[grafo].get_state(config_ingestao(ingestao_id, grafo))
+        if not estado.next:
+            continue
+        pendentes.append(
+            {
+                "ingestao_id": ingestao_id,
+                "grafo": grafo,
+                "proximos_nos": list(estado.next),
+                "atualizado_em": estado.created_at,
+                "texto_original": estado.values.get("texto_original"),
+            }
+        )
+        if len(pendentes) >= limite:
+            break
+    return pendentes
+
+
+def retomar_ingestao(ingestao_id: str) -> Dict[str, Any]:
+    """Retoma uma ingestão pendente a partir do último checkpoint."""
+
+    tupla = checkpointer.get_tuple({"configurable": {"thread_id": ingestao_id}})
+    if tupla is None:
+        raise LookupError(ingestao_id)
+    return executar_ingestao(None, ingestao_id, tupla.metadata.get("grafo", "padrao"))
@@ -1,13 +1,37 @@
 """Estrutura de estado compartilhado entre os nós do LangGraph."""
+import operator
 from datetime import date
-from typing import Optional, TypedDict
+from typing import Annotated, Any, Dict, List, Optional, TypedDict
 
 
 class GraphState(TypedDict, total=False):
     texto_original: str
+    cliente_id: Optional[str]
     valor: Optional[float]
     empresa: Optional[str]
     data: Optional[date]
     categoria: Optional[str]
+    categoria_sugerida: Optional[str]
+    anomalia: Optional[bool]
+    limite_anomalia: Optional[float]
     transacao_id: Optional[int]
     erro: Optional[str]
+
+
+class ItemState(TypedDict):
+    """Entrada de cada ramo paralelo de classificação no modo de múltiplas transações."""
+
+    indice: int
+    transacao: Dict[str, Any]
+    cliente_id: Optional[str]
+
+
+class GraphStateMultiplo(TypedDict, total=False):
+    texto_original: str
+    cliente_id: Optional[str]
+    transacoes: List[Dict[str, Any]]
+    # Cada ramo paralelo devolve o seu item; o redutor concatena os resultados.
+    classificadas: Annotated[List[Dict[str, Any]], operator.add]
+    transacao_ids: List[int]
+    erros: List[str]
+    erro: Optional[str]
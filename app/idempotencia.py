@@ -0,0 +1,230 @@
+"""Chaves de idempotência para o endpoint de ingestão.
+
+A primeira requisição com uma ``Idempotency-Key`` reserva a chave inserindo uma
+linha ``em_andamento``; a chave primária garante que apenas uma execução vença,
+mesmo entre processos. Repetições recebem a resposta armazenada e duplicatas
+concorrentes aguardam a execução em andamento em vez de rodar o grafo de novo.
+
+A reserva ``em_andamento`` é um arrendamento curto (``ARRENDAMENTO``) que a execução
+dona renova periodicamente enquanto roda: execuções longas nunca perdem a chave,
+mas se o processo morrer a renovação para e uma repetição posterior assume a chave
+em vez de esperar o TTL.
+As chaves valem por cliente: clientes diferentes podem usar a mesma chave.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from . import database
+
+TTL = datetime.timedelta(hours=float(os.getenv("MONEYTORA_IDEMPOTENCY_TTL_HOURS", "24")))
+# Sem renovação dentro deste prazo, a reserva ``em_andamento`` pode ser assumida.
+ARRENDAMENTO = datetime.timedelta(
+    seconds=float(os.getenv("MONEYTORA_IDEMPOTENCY_LEASE_SECONDS", "120"))
+)
+# Tempo máximo que uma duplicata espera pela execução original antes de desistir.
+ESPERA_MAXIMA = float(os.getenv("MONEYTORA_IDEMPOTENCY_WAIT_SECONDS", "60"))
+_INTERVALO_LIMPEZA = 300.0
+
+_eventos: Dict[str, threading.Event] = {}
+_eventos_lock = threading.Lock()
+_ultima_limpeza = 0.0
+
+
+class ConflitoIdempotenciaError(ValueError):
+    """A chave já foi usada com um corpo de requisição diferente."""
+
+
+class EmAndamentoError(RuntimeError):
+    """A execução original ainda não terminou dentro do tempo de espera."""
+
+
+def chave_do_cliente(chave: str, cliente_id: Optional[str]) -> str:
+    """Escopo da chave por cliente; sem cliente, a chave como veio."""
+
+    # O ``cliente_id`` é codificado para não conter ":": o prefixo nunca é ambíguo.
+    return f"{quote(cliente_id, safe='')}:{chave}" if cliente_id else chave
+
+
+def calcular_hash(payload: Dict[str, Any]) -> str:
+    bruto = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def limpar_expiradas(forcar: bool = False) -> int:
+    """Remove chaves expiradas (executado no máximo a cada poucos minutos)."""
+
+    global _ultima_limpeza
+    agora = time.monotonic()
+    if not forcar and agora - _ultima_limpeza < _INTERVALO_LIMPEZA:
+        return 0
+    _ultima_limpeza = agora
+    with database.session_scope() as session:
+        return (
+            session.query(database.ChaveIdempotencia)
+            .filter(database.ChaveIdempotencia.expira_em < datetime.datetime.utcnow())
+            .delete(synchronize_session=False)
+        )
+
+
+def _reservar(chave: str, hash_requisicao: str) -> Optional[datetime.datetime]:
+    """Reserva a chave; devolve o ``reservado_em`` que identifica a reserva, ou ``None``."""
+
+    agora = datetime.datetime.utcnow()
+    try:
+        with database.session_scope() as session:
+            session.add(
+                database.ChaveIdempotencia(
+                    chave=chave,
+                    hash_requisicao=hash_requisicao,
+                    status="em_andamento",
+                    criado_em=agora,
+                    reservado_em=agora,
+                    expira_em=agora + TTL,
+                )
+            )
+        return agora
+    except IntegrityError:
+        return None
+
+
+def _consultar(chave: str) -> Optional[database.ChaveIdempotencia]:
+    with database.session_scope() as session:
+        registro = session.get(database.ChaveIdempotencia, chave)
+        if registro is not None:
+            session.expunge(registro)
+        return registro
+
+
+def _aguardar_conclusao(chave: str, hash_requisicao: str) -> Tuple[int, Dict[str, Any]]:
+    limite = time.monotonic() + ESPERA_MAXIMA
+    intervalo = 0.05
+    while True:
+        registro = _consultar(chave)
+        if registro is None:
+            # A execução original falhou e liberou a chave: assumimos a execução.
+            raise LookupError(chave)
+        agora = datetime.datetime.utcnow()
+        if registro.expira_em < agora:
+            _liberar(chave, registro.reservado_em)
+            raise LookupError(chave)
+        if registro.hash_requisicao != hash_requisicao:
+            raise ConflitoIdempotenciaError(
+                "A chave de idempotência já foi utilizada com outra requisição."
+            )
+        if registro.status == "concluido":
+            return registro.status_code, json.loads(registro.resposta)
+        if (registro.renovado_em or registro.reservado_em or registro.criado_em) + ARRENDAMENTO < agora:
+            # A execução original parou de renovar a reserva sem concluir nem liberar
+            # a chave (o processo morreu): assumimos.
+            _liberar(chave, registro.reservado_em)
+            raise LookupError(chave)
+        if time.monotonic() >= limite:
+            raise EmAndamentoError("A requisição original ainda está em processamento.")
+
+        with _eventos_lock:
+            evento = _eventos.get(chave)
+        if evento is not None:
+            evento.wait(min(intervalo, max(limite - time.monotonic(), 0)))
+        else:
+            # Execução em outro processo: consultamos o banco com backoff.
+            time.sleep(intervalo)
+        intervalo = min(intervalo * 2, 1.0)
+
+
+def executar_idempotente(
+    chave: str,
+    payload: Dict[str, Any],
+    executar: Callable[[], Tuple[int, Dict[str, Any]]],
+) -> Tuple[int, Dict[str, Any]]:
+    """Executa ``executar`` uma única vez por chave e retorna ``(status_code, corpo)``.
+
+    Apenas respostas de sucesso (2xx) são armazenadas; em caso de erro a chave é
+    liberada para que o cliente possa tentar novamente. Para chaves por cliente,
+    ``chave`` vem de ``chave_do_cliente``.
+    """
+
+    limpar_expiradas()
+    hash_requisicao = calcular_hash(payload)
+
+    while True:
+        reservado_em = _reservar(chave, hash_requisicao)
+        if reservado_em is not None:
+            break
+        try:
+            return _aguardar_conclusao(chave, hash_requisicao)
+        except LookupError:
+            continue
+
+    evento = threading.Event()
+    with _eventos_lock:
+        _eventos[chave] = evento
+    renovacao = threading.Thread(
+        target=_renovar_reserva, args=(chave, reservado_em, evento), daemon=True
+    )
+    renovacao.start()
+    try:
+        status_code, corpo = executar()
+    except BaseException:
+        _liberar(chave, reservado_em)
+        raise
+    else:
+        if 200 <= status_code < 300:
+            # Só grava se a reserva ainda for desta execução (o arrendamento pode ter
+            # vencido e outra execução ter assumido a chave).
+            with database.session_scope() as session:
+                _da_reserva(session, chave, reservado_em).filter(
+                    database.ChaveIdempotencia.status == "em_andamento"
+                ).update(
+                    {
+                        "status": "concluido",
+                        "status_code": status_code,
+                        "resposta": json.dumps(corpo, default=str),
+                        "transacao_id": corpo.get("transacao_id"),
+                    },
+                    synchronize_session=False,
+                )
+        else:
+            _liberar(chave, reservado_em)
+        return status_code, corpo
+    finally:
+        with _eventos_lock:
+            _eventos.pop(chave, None)
+        evento.set()
+
+
+def _renovar_reserva(chave: str, reservado_em: datetime.datetime, parar: threading.Event) -> None:
+    """Renova o arrendamento da reserva até ``parar`` ser sinalizado."""
+
+    while not parar.wait(ARRENDAMENTO.total_seconds() / 3):
+        try:
+            with database.session_scope() as session:
+                _da_reserva(session, chave, reservado_em).filter(
+                    database.ChaveIdempotencia.status == "em_andamento"
+                ).update({"renovado_em": datetime.datetime.utcnow()}, synchronize_session=False)
+        except SQLAlchemyError:
+            # Banco ocupado: a próxima renovação ainda chega antes do arrendamento vencer.
+            continue
+
+
+def _da_reserva(session, chave: str, reservado_em: Optional[datetime.datetime]):
+    return session.query(database.ChaveIdempotencia).filter(
+        database.ChaveIdempotencia.chave == chave,
+        database.ChaveIdempotencia.reservado_em == reservado_em,
+    )
+
+
+def _liberar(chave: str, reservado_em: Optional[datetime.datetime]) -> None:
+    """Remove a reserva identificada por ``reservado_em`` (nunca a de outra execução)."""
+
+    with database.session_scope() as session:
+        _da_reserva(session, chave, reservado_em).delete(synchronize_session=False)
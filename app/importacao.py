@@ -0,0 +1,437 @@
+"""Importação direta de extratos OFX (SGML e XML), CSV e PDF, sem chamadas ao LLM.
+
+Os arquivos são lidos em streaming: cada ``<STMTTRN>`` (ou linha do CSV) vira um
+``TransacaoCreate`` assim que é concluído, então o consumo de memória independe do
+tamanho do extrato. A classificação é feita em lote por empresa e a persistência
+usa inserções em massa em blocos, com deduplicação pelo FITID.
+
+Nos PDFs, o texto das páginas é extraído em um pool de processos, com no máximo
+algumas páginas em andamento por vez, e fica em cache pelo hash do conteúdo da
+página; cada linha reconhecida como lançamento vira um registro.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from pypdf import PdfReader
+
+from app import repository, schemas
+from app.cache import CacheSQLite
+from app.database import session_scope
+from app.tools.classificacao_tool import classificar_empresas_em_lote
+
+TAMANHO_LOTE = 500
+_TAMANHO_BLOCO_LEITURA = 64 * 1024
+
+_RE_TRANSACAO = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+_RE_CAMPO = re.compile(r"<([A-Za-z0-9.]+)>([^<\r\n]*)")
+_RE_CONTA = re.compile(r"<ACCTID>([^<\r\n]*)", re.IGNORECASE)
+_RE_CHARSET = re.compile(r"CHARSET:\s*(\S+)|encoding=[\"']([^\"']+)", re.IGNORECASE)
+
+Fonte = Union[bytes, str, IO[bytes], IO[str]]
+
+
+def _blocos_texto(fonte: Fonte) -> Iterator[str]:
+    """Lê a fonte em blocos decodificados, detectando o charset do cabeçalho OFX."""
+
+    if isinstance(fonte, (bytes, str)):
+        fonte = io.BytesIO(fonte) if isinstance(fonte, bytes) else io.StringIO(fonte)
+
+    decodificador = None
+    while True:
+        bloco = fonte.read(_TAMANHO_BLOCO_LEITURA)
+        if not bloco:
+            break
+        if isinstance(bloco, str):
+            yield bloco
+            continue
+        if decodificador is None:
+            encontrado = _RE_CHARSET.search(bloco[:1024].decode("ascii", errors="ignore"))
+            charset = (encontrado.group(1) or encontrado.group(2)) if encontrado else "utf-8"
+            if bloco.startswith(codecs.BOM_UTF8):
+                charset = "utf-8-sig"
+            charset = {"1252": "cp1252", "none": "utf-8", "usascii": "ascii"}.get(charset.lower(), charset)
+            try:
+                decodificador = codecs.getincrementaldecoder(charset)(errors="replace")
+            except LookupError:
+                decodificador = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        yield decodificador.decode(bloco)
+    if decodificador is not None:
+        final = decodificador.decode(b"", final=True)
+        if final:
+            yield final
+
+
+def _parse_data_ofx(valor: str) -> date:
+    # DTPOSTED segue AAAAMMDD[HHMMSS[.XXX][fuso]]; só a data nos interessa.
+    return datetime.strptime(valor.strip()[:8], "%Y%m%d").date()
+
+
+def _parse_valor(valor: str) -> float:
+    """Converte valores no formato brasileiro ou internacional.
+
+    Com os dois separadores, o último é o decimal ("1.234,56" e "1,234.56"). Com um
+    só, ele separa milhares quando todos os grupos seguintes têm três dígitos
+    ("1.234", "1,234,567"), e é o decimal nos demais casos ("55,90", "0.123").
+    """
+
+    original = valor
+    valor = valor.strip().replace("R$", "").replace(" ", "")
+    if "," in valor and "." in valor:
+        decimal = "," if valor.rfind(",") > valor.rfind(".") else "."
+        milhar = "." if decimal == "," else ","
+        valor = valor.replace(milhar, "").replace(decimal, ".")
+    elif "," in valor or "." in valor:
+        separador = "," if "," in valor else "."
+        inteiro, *grupos = valor.lstrip("+-").split(separador)
+        if all(len(grupo) == 3 for grupo in grupos) and (len(grupos) > 1 or inteiro.strip("0")):
+            valor = valor.replace(separador, "")
+        else:
+            valor = valor.replace(",", ".")
+    try:
+        return float(valor)
+    except ValueError as exc:
+        raise ValueError(f"Valor inválido: {original!r}") from exc
+
+
+def iterar_ofx(fonte: Fonte) -> Iterator[Dict[str, Any]]:
+    """Gera os lançamentos ``STMTTRN`` de um OFX, nas variantes SGML e XML."""
+
+    buffer = ""
+    conta = ""
+    for bloco in _blocos_texto(fonte):
+        buffer += bloco
+        if not conta:
+            encontrada = _RE_CONTA.search(buffer)
+            if encontrada:
+                conta = encontrada.group(1).strip()
+
+        fim = 0
+        for encontrado in _RE_TRANSACAO.finditer(buffer):
+            campos = {
+                nome.upper(): valor.strip()
+                for nome, valor in _RE_CAMPO.findall(encontrado.group(1))
+            }
+            fim = encontrado.end()
+            if "TRNAMT" not in campos or "DTPOSTED" not in campos:
+                continue
+            yield {
+                "fitid": f"{conta}:{campos['FITID']}" if campos.get("FITID") else None,
+                "valor": _parse_valor(campos["TRNAMT"]),
+                "data": _parse_data_ofx(campos["DTPOSTED"]),
+                "empresa": campos.get("NAME") or campos.get("MEMO") or "Desconhecido",
+            }
+        # Mantemos apenas o trecho ainda não concluído (memória limitada).
+        if fim:
+            buffer = buffer[fim:]
+        else:
+            inicio = buffer.upper().rfind("<STMTTRN>")
+            buffer = buffer[inicio:] if inicio >= 0 else buffer[-64:]
+
+
+_COLUNAS_CSV = {
+    "data": ("data", "date", "dt", "data lançamento", "data lancamento"),
+    "valor": ("valor", "amount", "value", "valor (r$)"),
+    "empresa": ("empresa", "descricao", "descrição", "description", "historico", "histórico", "estabelecimento"),
+    "fitid": ("fitid", "id", "identificador"),
+}
+
+
+def _parse_data_csv(valor: str) -> date:
+    valor = valor.strip()
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida no CSV: {valor!r}")
+
+
+def _fitid_sintetico(
+    prefixo: str, ocorrencias: Dict[str, int], data_transacao: date, valor: float, empresa: str
+) -> str:
+    # Sem identificador no arquivo, derivamos um estável a partir do conteúdo
+    # (com o número da ocorrência para não fundir lançamentos idênticos).
+    base = f"{data_transacao}|{valor:.2f}|{empresa.lower()}"
+    ocorrencias[base] = ocorrencias.get(base, 0) + 1
+    return f"{prefixo}:" + hashlib.sha1(f"{base}|{ocorrencias[base]}".encode()).hexdigest()[:20]
+
+
+def iterar_csv(fonte: Fonte) -> Iterator[Dict[str, Any]]:
+    """Gera os lançamentos de um CSV com colunas de data, valor e descrição."""
+
+    linhas = (linha for bloco in _blocos_texto(fonte) for linha in io.StringIO(bloco))
+    linhas = _linhas_completas(linhas)
+    primeira = next(linhas, None)
+    if primeira is None:
+        return
+    delimitador = ";" if primeira.count(";") > primeira.count(",") else ","
+    leitor = csv.reader(_encadear(primeira, linhas), delimiter=delimitador)
+
+    cabecalho = [coluna.strip().lower() for coluna in next(leitor)]
+    indices = {}
+    for campo, nomes in _COLUNAS_CSV.items():
+        indices[campo] = next((i for i, coluna in enumerate(cabecalho) if coluna in nomes), None)
+    if indices["data"] is None or indices["valor"] is None or indices["empresa"] is None:
+        raise ValueError("O CSV precisa das colunas de data, valor e descrição/empresa.")
+
+    necessarias = max(indice for indice in indices.values() if indice is not None) + 1
+    ocorrencias: Dict[str, int] = {}
+    for linha in leitor:
+        if not any(celula.strip() for celula in linha):
+            continue
+        # ``line_num`` é a linha do arquivo, como o usuário a vê no editor.
+        if len(linha) < necessarias:
+            raise ValueError(
+                f"Linha {leitor.line_num} do CSV: {len(linha)} colunas, o cabeçalho tem {len(cabecalho)}."
+            )
+        try:
+            data_transacao = _parse_data_csv(linha[indices["data"]])
+            valor = _parse_valor(linha[indices["valor"]])
+        except ValueError as exc:
+            raise ValueError(f"Linha {leitor.line_num} do CSV: {exc}") from exc
+        empresa = linha[indices["empresa"]].strip() or "Desconhecido"
+        if indices["fitid"] is not None and linha[indices["fitid"]].strip():
+            fitid = f"csv:{linha[indices['fitid']].strip()}"
+        else:
+            fitid = _fitid_sintetico("csv", ocorrencias, data_transacao, valor, empresa)
+        yield {"fitid": fitid, "valor": valor, "data": data_transacao, "empresa": empresa}
+
+
+def _linhas_completas(partes: Iterable[str]) -> Iterator[str]:
+    # Os blocos lidos podem cortar uma linha ao meio; reagrupamos antes do csv.reader.
+    pendente = ""
+    for parte in partes:
+        pendente += parte
+        if pendente.endswith("\n"):
+            yield pendente
+            pendente = ""
+    if pendente:
+        yield pendente
+
+
+def _encadear(primeira: str, resto: Iterator[str]) -> Iterator[str]:
+    yield primeira
+    yield from resto
+
+
+_cache_paginas = CacheSQLite(
+    "pdf_paginas",
+    max_bytes=int(os.getenv("MONEYTORA_PDF_CACHE_MAX_MB", "50")) * 1024 * 1024,
+)
+
+# Valor no formato brasileiro, com sinal ou indicador de débito/crédito opcionais.
+_VALOR_EXTRATO = r"-?\s?(?:R\$\s?)?-?\d{1,3}(?:\.\d{3})*,\d{2}(?:\s?[DC]\b|-)?"
+# Linha de extrato: data, descrição, valor e, opcionalmente, o saldo após o lançamento.
+_RE_LINHA_EXTRATO = re.compile(
+    rf"^\s*(?P<data>\d{{2}}/\d{{2}}(?:/\d{{2,4}})?)\s+(?P<descricao>.+?)\s+"
+    rf"(?P<valor>{_VALOR_EXTRATO})(?:\s+{_VALOR_EXTRATO})?\s*$"
+)
+_RE_ANO = re.compile(r"\b\d{2}/\d{2}/(\d{4})\b")
+_LINHAS_IGNORADAS = ("saldo", "total")
+
+# Estado por processo, usado apenas dentro dos workers do pool.
+_leitor_pdf: Optional[PdfReader] = None
+_cache_worker: Optional[CacheSQLite] = None
+
+
+def _inicializar_leitor(caminho: str, cache: CacheSQLite) -> None:
+    """Abre o PDF uma única vez por processo do pool."""
+
+    global _leitor_pdf, _cache_worker
+    _leitor_pdf = PdfReader(caminho)
+    _cache_worker = cache
+
+
+def _texto_pagina(indice: int) -> str:
+    return _extrair_pagina(_leitor_pdf, _cache_worker, indice)
+
+
+def _extrair_pagina(leitor: PdfReader, cache: CacheSQLite, indice: int) -> str:
+    pagina = leitor.pages[indice]
+    conteudo = pagina.get_contents()
+    dados = conteudo.get_data() if conteudo is not None else b""
+    if not dados:
+        return ""
+
+    chave = hashlib.sha256(dados).hexdigest()
+    em_cache = cache.obter(chave)
+    if em_cache is not None:
+        return em_cache.decode("utf-8")
+    texto = pagina.extract_text() or ""
+    cache.gravar(chave, texto.encode("utf-8"))
+    return texto
+
+
+@contextmanager
+def _arquivo_pdf(fonte: Union[bytes, str, IO[bytes]]) -> Iterator[str]:
+    # Os workers abrem o PDF pelo caminho; uploads são copiados para um temporário.
+    if isinstance(fonte, (str, os.PathLike)):
+        yield os.fspath(fonte)
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temporario:
+        if isinstance(fonte, bytes):
+            temporario.write(fonte)
+        else:
+            shutil.copyfileobj(fonte, temporario)
+    try:
+        yield temporario.name
+    finally:
+        os.remove(temporario.name)
+
+
+def textos_pdf(
+    fonte: Union[bytes, str, IO[bytes]], max_workers: Optional[int] = None
+) -> Iterator[str]:
+    """Gera o texto de cada página, em ordem, extraindo as páginas em paralelo."""
+
+    with _arquivo_pdf(fonte) as caminho:
+        leitor = PdfReader(caminho)
+        total = len(leitor.pages)
+        workers = min(max_workers or os.cpu_count() or 1, total)
+        if workers <= 1:
+            # O leitor fica local: importações simultâneas não compartilham estado.
+            for indice in range(total):
+                yield _extrair_pagina(leitor, _cache_paginas, indice)
+            return
+
+        # ``spawn``: os workers não herdam por ``fork`` as threads e conexões
+        # abertas do processo da API.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_leitor,
+            initargs=(caminho, _cache_paginas),
+        ) as executor:
+            # Janela deslizante: poucas páginas em andamento, entregues na ordem.
+            pendentes: deque = deque()
+            proxima = 0
+            while proxima < total or pendentes:
+                while proxima < total and len(pendentes) < workers * 2:
+                    pendentes.append(executor.submit(_texto_pagina, proxima))
+                    proxima += 1
+                yield pendentes.popleft().result()
+
+
+def extrair_texto_pdf(
+    fonte: Union[bytes, str, IO[bytes]], max_workers: Optional[int] = None
+) -> str:
+    """Retorna o texto completo do PDF (usado para comprovantes avulsos)."""
+
+    return "\n".join(textos_pdf(fonte, max_workers=max_workers)).strip()
+
+
+def _parse_valor_extrato(bruto: str) -> float:
+    bruto = bruto.strip()
+    valor = _parse_valor(re.search(r"\d{1,3}(?:\.\d{3})*,\d{2}", bruto).group(0))
+    negativo = "-" in bruto or bruto.endswith("D")
+    return -valor if negativo else valor
+
+
+def _parse_data_extrato(bruto: str, ano: Optional[int]) -> date:
+    if bruto.count("/") == 2:
+        return _parse_data_csv(bruto)
+    dia, mes = (int(parte) for parte in bruto.split("/"))
+    return date(ano or date.today().year, mes, dia)
+
+
+def iterar_pdf(
+    fonte: Union[bytes, str, IO[bytes]], max_workers: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Gera um lançamento para cada linha de extrato reconhecida no PDF."""
+
+    ano: Optional[int] = None
+    ocorrencias: Dict[str, int] = {}
+    for texto in textos_pdf(fonte, max_workers=max_workers):
+        if ano is None:
+            # Linhas com só dia/mês usam o primeiro ano completo que aparecer no extrato.
+            encontrado = _RE_ANO.search(texto)
+            ano = int(encontrado.group(1)) if encontrado else None
+        for linha in texto.splitlines():
+            encontrada = _RE_LINHA_EXTRATO.match(linha)
+            if not encontrada:
+                continue
+            empresa = " ".join(encontrada.group("descricao").split())
+            if empresa.lower().startswith(_LINHAS_IGNORADAS):
+                continue
+            try:
+                data_transacao = _parse_data_extrato(encontrada.group("data"), ano)
+            except ValueError:
+                continue
+            valor = _parse_valor_extrato(encontrada.group("valor"))
+            yield {
+                "fitid": _fitid_sintetico("pdf", ocorrencias, data_transacao, valor, empresa),
+                "valor": valor,
+                "data": data_transacao,
+                "empresa": empresa,
+            }
+
+
+def _em_lotes(registros: Iterable[Dict[str, Any]], tamanho: int) -> Iterator[List[Dict[str, Any]]]:
+    lote: List[Dict[str, Any]] = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def importar_registros(
+    registros: Iterable[Dict[str, Any]],
+    cliente_id: Optional[str] = None,
+    tamanho_lote: int = TAMANHO_LOTE,
+) -> Dict[str, int]:
+    """Classifica e persiste os registros em blocos, ignorando FITIDs já importados."""
+
+    totais = {"lidas": 0, "inseridas": 0, "duplicadas": 0}
+    for lote in _em_lotes(registros, tamanho_lote):
+        categorias = classificar_empresas_em_lote(
+            {registro["empresa"] for registro in lote}, cliente_id=cliente_id
+        )
+        transacoes = [
+            schemas.TransacaoCreate(
+                **registro, categoria=categorias[registro["empresa"]], cliente_id=cliente_id
+            )
+            for registro in lote
+        ]
+        with session_scope(cliente_id) as session:
+            inseridas = repository.criar_transacoes_em_lote(session, transacoes)
+        totais["lidas"] += len(lote)
+        totais["inseridas"] += inseridas
+        totais["duplicadas"] += len(lote) - inseridas
+    return totais
+
+
+def importar_extrato(
+    fonte: Fonte,
+    formato: str,
+    cliente_id: Optional[str] = None,
+    tamanho_lote: int = TAMANHO_LOTE,
+) -> Dict[str, int]:
+    """Importa um extrato ``ofx``, ``csv`` ou ``pdf`` e retorna os totais da importação."""
+
+    formato = formato.lower().lstrip(".")
+    if formato == "ofx":
+        registros = iterar_ofx(fonte)
+    elif formato == "csv":
+        registros = iterar_csv(fonte)
+    elif formato == "pdf":
+        registros = iterar_pdf(fonte)
+    else:
+        raise ValueError(f"Formato de extrato não suportado: {formato}")
+    return importar_registros(registros, cliente_id=cliente_id, tamanho_lote=tamanho_lote)
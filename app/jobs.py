@@ -0,0 +1,178 @@
+"""Fila de jobs em segundo plano com pool de workers e capacidade limitada.
+
+Usada para tirar trabalhos pesados (como a renderização de relatórios) do caminho
+das requisições: quem enfileira recebe imediatamente um identificador e consulta o
+status depois. Cada job guarda o cliente que o pediu, e os resultados concluídos
+saem da memória após ``retencao``.
+"""
+from __future__ import annotations
+
+import datetime
+import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FilaCheiaError(RuntimeError):
+    """Levantada quando a fila atingiu a capacidade máxima."""
+
+
+@dataclass
+class Job:
+    """Estado de um job enfileirado."""
+
+    id: str
+    tipo: str
+    parametros: Dict[str, Any]
+    chave: Optional[str] = None
+    # Cliente dono do job (o ``cliente_id`` dos parâmetros); só ele consulta o resultado.
+    cliente_id: Optional[str] = None
+    status: str = "pendente"  # pendente -> executando -> concluido | erro
+    criado_em: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    iniciado_em: Optional[datetime.datetime] = None
+    concluido_em: Optional[datetime.datetime] = None
+    resultado: Any = None
+    erro: Optional[str] = None
+    concluido: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def aguardar(self, timeout: Optional[float] = None) -> bool:
+        return self.concluido.wait(timeout)
+
+
+class FilaJobs:
+    """Pool de threads alimentado por uma fila limitada.
+
+    Jobs com a mesma ``chave`` ainda pendentes ou em execução são reaproveitados em
+    vez de enfileirados novamente. Os workers são iniciados sob demanda. Jobs
+    concluídos há mais de ``retencao`` são descartados com o resultado.
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        workers: int = 2,
+        tamanho_max: int = 32,
+        historico_max: int = 500,
+        retencao: Optional[datetime.timedelta] = None,
+    ) -> None:
+        self.nome = nome
+        self.workers = workers
+        self.historico_max = historico_max
+        self.retencao = retencao
+        self._fila: "queue.Queue[tuple[Job, Callable[..., Any]]]" = queue.Queue(maxsize=tamanho_max)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._ativos_por_chave: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def _iniciar_workers(self) -> None:
+        if self._threads:
+            return
+        for indice in range(self.workers):
+            thread = threading.Thread(
+                target=self._loop, name=f"{self.nome}-worker-{indice}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def enfileirar(
+        self,
+        tipo: str,
+        funcao: Callable[..., Any],
+        chave: Optional[str] = None,
+        **parametros: Any,
+    ) -> Job:
+        """Enfileira ``funcao(**parametros)`` e retorna o job correspondente."""
+
+        with self._lock:
+            if chave and chave in self._ativos_por_chave:
+                return self._ativos_por_chave[chave]
+
+            job = Job(
+                id=uuid.uuid4().hex,
+                tipo=tipo,
+                parametros=parametros,
+                chave=chave,
+                cliente_id=parametros.get("cliente_id"),
+            )
+            try:
+                self._fila.put_nowait((job, funcao))
+            except queue.Full as exc:
+                raise FilaCheiaError(
+                    f"A fila '{self.nome}' está cheia; tente novamente em instantes."
+                ) from exc
+
+            self._jobs[job.id] = job
+            if chave:
+                self._ativos_por_chave[chave] = job
+            while len(self._jobs) > self.historico_max:
+                antigo_id, antigo = next(iter(self._jobs.items()))
+                if not antigo.concluido.is_set():
+                    break
+                self._jobs.pop(antigo_id)
+            self._podar()
+            self._iniciar_workers()
+        return job
+
+    def _podar(self) -> None:
+        """Descarta os jobs concluídos há mais de ``retencao`` (chamado com o lock)."""
+
+        if self.retencao is None:
+            return
+        limite = datetime.datetime.utcnow() - self.retencao
+        for job_id in [
+            job.id
+            for job in self._jobs.values()
+            if job.concluido.is_set() and job.concluido_em is not None and job.concluido_em < limite
+        ]:
+            self._jobs.pop(job_id)
+
+    def obter(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._podar()
+            return self._jobs.get(job_id)
+
+    def listar(self) -> List[Job]:
+        with self._lock:
+            self._podar()
+            return list(self._jobs.values())
+
+    def profundidade(self) -> int:
+        """Quantidade de jobs aguardando um worker."""
+
+        return self._fila.qsize()
+
+    def _loop(self) -> None:
+        while True:
+            job, funcao = self._fila.get()
+            job.status = "executando"
+            job.iniciado_em = datetime.datetime.utcnow()
+            try:
+                job.resultado = funcao(**job.parametros)
+                job.status = "concluido"
+            except Exception as exc:  # pragma: no cover - depende do job
+                job.erro = str(exc)
+                job.status = "erro"
+            finally:
+                job.concluido_em = datetime.datetime.utcnow()
+                with self._lock:
+                    if job.chave and self._ativos_por_chave.get(job.chave) is job:
+                        self._ativos_por_chave.pop(job.chave)
+                job.concluido.set()
+                self._fila.task_done()
+
+
+fila_relatorios = FilaJobs(
+    "relatorios",
+    workers=int(os.getenv("MONEYTORA_REPORT_WORKERS", "2")),
+    tamanho_max=int(os.getenv("MONEYTORA_REPORT_QUEUE_SIZE", "32")),
+    # Os PDFs concluídos ficam em memória até saírem do histórico ou expirarem.
+    historico_max=int(os.getenv("MONEYTORA_REPORT_JOBS_HISTORY", "100")),
+    retencao=datetime.timedelta(
+        seconds=float(os.getenv("MONEYTORA_REPORT_RESULT_TTL_SECONDS", "900"))
+    ),
+)
@@ -0,0 +1,669 @@
+"""Registro central dos clientes de LLM com controle de vazão por modelo.
+
+Todos os agentes obtêm seus modelos por ``obter_llm``, que devolve uma instância
+compartilhada por combinação de (modelo, configurações). Cada chamada ao provedor
+passa pelo controle do modelo: um balde de tokens limita a taxa de requisições
+por minuto do processo inteiro e um semáforo limita as chamadas simultâneas. Quem
+excede o limite espera na fila até o seu prazo; se o prazo acabar, recebe
+``PrazoFilaExcedidoError`` em vez de disparar uma rajada de erros de cota.
+
+Limites padrão vêm de ``MONEYTORA_LLM_RPM``, ``MONEYTORA_LLM_BURST``,
+``MONEYTORA_LLM_MAX_IN_FLIGHT`` e ``MONEYTORA_LLM_QUEUE_DEADLINE``; ajustes por
+modelo podem ser passados em JSON em ``MONEYTORA_LLM_LIMITS``, por exemplo
+``{"gemini-2.5-flash": {"rpm": 1000, "concorrencia": 16}}``.
+
+Cada chamada tem ainda um prazo total (``MONEYTORA_LLM_CALL_DEADLINE``), novas
+tentativas com backoff exponencial e jitter para erros transitórios
+(``MONEYTORA_LLM_RETRIES``) e, opcionalmente, uma requisição de reserva (hedge)
+disparada quando a primeira passa do p95 de latência do modelo. Um disjuntor por
+modelo abre após falhas seguidas (``MONEYTORA_LLM_BREAKER_FAILURES``) e rejeita
+as chamadas com ``CircuitoAbertoError`` até o fim do resfriamento
+(``MONEYTORA_LLM_BREAKER_COOLDOWN``), quando uma única sondagem é liberada.
+
+Cada agente tem uma lista de modelos em ordem de escalonamento (``ROTAS_PADRAO``,
+sobrescrita por ``MONEYTORA_LLM_ROUTES`` em JSON). ``executar_roteado`` tenta o
+primeiro modelo e só passa ao seguinte quando a resposta falha na validação ou
+não é considerada confiável, registrando decisões e latências por modelo.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from langchain_core.exceptions import (
+    ModelAPIError,
+    ModelConnectionError,
+    ModelRateLimitError,
+    ModelTimeoutError,
+)
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from app.cache_llm import cache_llm
+from app.config import GOOGLE_API_KEY
+
+MODELO_PADRAO = os.getenv("MONEYTORA_LLM_MODEL", "gemini-2.5-flash")
+RPM_PADRAO = float(os.getenv("MONEYTORA_LLM_RPM", "60"))
+RAJADA_PADRAO = int(os.getenv("MONEYTORA_LLM_BURST", "10"))
+CONCORRENCIA_PADRAO = int(os.getenv("MONEYTORA_LLM_MAX_IN_FLIGHT", "4"))
+PRAZO_FILA_PADRAO = float(os.getenv("MONEYTORA_LLM_QUEUE_DEADLINE", "30"))
+_LIMITES_POR_MODELO: Dict[str, Dict[str, float]] = json.loads(
+    os.getenv("MONEYTORA_LLM_LIMITS", "{}")
+)
+T = TypeVar("T")
+
+PRAZO_CHAMADA_PADRAO = float(os.getenv("MONEYTORA_LLM_CALL_DEADLINE", "45"))
+TENTATIVAS_PADRAO = int(os.getenv("MONEYTORA_LLM_RETRIES", "2"))
+HEDGE_PADRAO = os.getenv("MONEYTORA_LLM_HEDGE", "0") == "1"
+FALHAS_DISJUNTOR = int(os.getenv("MONEYTORA_LLM_BREAKER_FAILURES", "5"))
+RESFRIAMENTO_DISJUNTOR = float(os.getenv("MONEYTORA_LLM_BREAKER_COOLDOWN", "30"))
+# O atraso do hedge só é confiável com algumas amostras de latência do modelo.
+_AMOSTRAS_MINIMAS_HEDGE = 20
+_BACKOFF_BASE = 0.5
+_BACKOFF_TETO = 8.0
+
+
+class PrazoFilaExcedidoError(TimeoutError):
+    """A chamada esperou na fila do modelo além do prazo permitido."""
+
+
+class PrazoChamadaExcedidoError(TimeoutError):
+    """O modelo não respondeu dentro do prazo total da chamada."""
+
+
+class CircuitoAbertoError(RuntimeError):
+    """O modelo está marcado como indisponível; a chamada falha sem ir ao provedor."""
+
+
+class ConfiguracaoAusenteError(EnvironmentError):
+    """Falta configuração (chave de API, dependência): nenhum modelo da rota resolveria."""
+
+
+# Falhas de capacidade ou disponibilidade: o chamador pode tentar mais tarde.
+ERROS_INDISPONIBILIDADE = (PrazoFilaExcedidoError, PrazoChamadaExcedidoError, CircuitoAbertoError)
+
+
+def _percentil(valores: List[float], fracao: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[int(fracao * (len(ordenados) - 1))]
+
+
+class BaldeTokens:
+    """Balde de tokens: ``taxa`` reposições por segundo até ``capacidade``."""
+
+    def __init__(self, taxa: float, capacidade: int) -> None:
+        self.taxa = taxa
+        self.capacidade = max(1, capacidade)
+        self._tokens = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self, limite: float) -> bool:
+        """Consome um token, esperando no máximo até o instante ``limite`` (monotônico)."""
+
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(
+                    self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa
+                )
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                espera = (1 - self._tokens) / self.taxa
+            if agora + espera > limite:
+                return False
+            time.sleep(espera)
+
+
+class DisjuntorCircuito:
+    """Abre após ``limite_falhas`` falhas seguidas; após ``resfriamento`` segundos, libera uma sondagem."""
+
+    def __init__(self, limite_falhas: int, resfriamento: float) -> None:
+        self.limite_falhas = max(1, limite_falhas)
+        self.resfriamento = resfriamento
+        self.estado = "fechado"
+        self.falhas_seguidas = 0
+        self.rejeitadas = 0
+        self._aberto_em = 0.0
+        self._sondando = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> None:
+        """Levanta ``CircuitoAbertoError`` se a chamada não deve chegar ao provedor."""
+
+        with self._lock:
+            if self.estado == "fechado":
+                return
+            if self.estado == "aberto" and time.monotonic() - self._aberto_em >= self.resfriamento:
+                self.estado = "meio_aberto"
+                self._sondando = False
+            if self.estado == "meio_aberto" and not self._sondando:
+                self._sondando = True
+                return
+            self.rejeitadas += 1
+        raise CircuitoAbertoError("Provedor do modelo indisponível; tente novamente em instantes.")
+
+    @property
+    def aberto(self) -> bool:
+        return self.estado == "aberto"
+
+    def registrar_sucesso(self) -> None:
+        with self._lock:
+            self.estado = "fechado"
+            self.falhas_seguidas = 0
+            self._sondando = False
+
+    def registrar_falha(self) -> None:
+        with self._lock:
+            self.falhas_seguidas += 1
+            if self.estado == "meio_aberto" or self.falhas_seguidas >= self.limite_falhas:
+                self.estado = "aberto"
+                self._aberto_em = time.monotonic()
+            self._sondando = False
+
+    def liberar(self) -> None:
+        """Encerra a sondagem sem mudar o estado (erro que não diz nada sobre o provedor)."""
+
+        with self._lock:
+            self._sondando = False
+
+
+class ControleModelo:
+    """Limites de vazão, disjuntor e métricas de fila e latência de um modelo."""
+
+    def __init__(
+        self,
+        modelo: str,
+        rpm: float,
+        rajada: int,
+        concorrencia: int,
+        limite_falhas: int = FALHAS_DISJUNTOR,
+        resfriamento: float = RESFRIAMENTO_DISJUNTOR,
+    ) -> None:
+        self.modelo = modelo
+        self.rpm = rpm
+        self.concorrencia = concorrencia
+        self._balde = BaldeTokens(rpm / 60, rajada)
+        self._semaforo = threading.BoundedSemaphore(concorrencia)
+        self._lock = threading.Lock()
+        self.disjuntor = DisjuntorCircuito(limite_falhas, resfriamento)
+        self._latencias: Deque[float] = deque(maxlen=500)
+        self.aguardando = 0
+        self.em_execucao = 0
+        self.concluidas = 0
+        self.rejeitadas = 0
+        self.retentativas = 0
+        self.hedges = 0
+        self.hedges_vencedores = 0
+
+    def entrar(self, prazo: float) -> None:
+        """Aguarda uma vaga e um token por até ``prazo`` segundos."""
+
+        limite = time.monotonic() + prazo
+        with self._lock:
+            self.aguardando += 1
+        try:
+            obtida = self._semaforo.acquire(timeout=max(0.0, limite - time.monotonic()))
+            if obtida and not self._balde.adquirir(limite):
+                self._semaforo.release()
+                obtida = False
+        finally:
+            with self._lock:
+                self.aguardando -= 1
+        if not obtida:
+            with self._lock:
+                self.rejeitadas += 1
+            raise PrazoFilaExcedidoError(
+                f"Fila do modelo {self.modelo} excedeu o prazo de {prazo:.0f}s."
+            )
+        with self._lock:
+            self.em_execucao += 1
+
+    def sair(self) -> None:
+        with self._lock:
+            self.em_execucao -= 1
+            self.concluidas += 1
+        self._semaforo.release()
+
+    @contextmanager
+    def reservar(self, prazo: float) -> Iterator[None]:
+        self.entrar(prazo)
+        try:
+            yield
+        finally:
+            self.sair()
+
+    def registrar_latencia(self, segundos: float) -> None:
+        with self._lock:
+            self._latencias.append(segundos)
+
+    def atraso_hedge(self) -> Optional[float]:
+        """p95 das latências recentes, ou ``None`` se ainda há poucas amostras."""
+
+        with self._lock:
+            if len(self._latencias) < _AMOSTRAS_MINIMAS_HEDGE:
+                return None
+            return _percentil(list(self._latencias), 0.95)
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._lock:
+            p95 = _percentil(list(self._latencias), 0.95)
+            return {
+                "rpm": self.rpm,
+                "concorrencia": self.concorrencia,
+                "aguardando": self.aguardando,
+                "em_execucao": self.em_execucao,
+                "concluidas": self.concluidas,
+                "rejeitadas": self.rejeitadas,
+                "retentativas": self.retentativas,
+                "hedges": self.hedges,
+                "hedges_vencedores": self.hedges_vencedores,
+                "latencia_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "circuito": self.disjuntor.estado,
+                "rejeitadas_circuito": self.disjuntor.rejeitadas,
+            }
+
+
+_controles: Dict[str, ControleModelo] = {}
+_controles_lock = threading.Lock()
+
+
+def controle_modelo(modelo: str) -> ControleModelo:
+    """Retorna (criando se preciso) o controle de vazão compartilhado do modelo."""
+
+    with _controles_lock:
+        controle = _controles.get(modelo)
+        if controle is None:
+            limites = _LIMITES_POR_MODELO.get(modelo, {})
+            controle = ControleModelo(
+                modelo,
+                rpm=float(limites.get("rpm", RPM_PADRAO)),
+                rajada=int(limites.get("rajada", RAJADA_PADRAO)),
+                concorrencia=int(limites.get("concorrencia", CONCORRENCIA_PADRAO)),
+            )
+            _controles[modelo] = controle
+        return controle
+
+
+# Erros em que vale tentar de novo: o provedor pode responder na próxima vez.
+_ERROS_RETENTAVEIS = (
+    TimeoutError,
+    ConnectionError,
+    ModelAPIError,
+    ModelConnectionError,
+    ModelRateLimitError,
+    ModelTimeoutError,
+)
+# Chamadas em andamento continuam nessas threads mesmo após o prazo do chamador
+# (não há como cancelar uma requisição síncrona), mas liberam a vaga ao terminar.
+_executor_chamadas = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MONEYTORA_LLM_WORKERS", "32")),
+    thread_name_prefix="llm-chamada",
+)
+
+
+def _retentavel(exc: BaseException) -> bool:
+    if isinstance(exc, (PrazoFilaExcedidoError, CircuitoAbertoError)):
+        return False
+    return isinstance(exc, _ERROS_RETENTAVEIS)
+
+
+def _tentativa(controle: ControleModelo, chamar: Callable[[], T], limite: float, hedge: bool) -> T:
+    """Executa uma tentativa até ``limite``, com uma cópia de reserva após o p95 se ``hedge``."""
+
+    futuros: List[Future] = [_executor_chamadas.submit(chamar)]
+    pendentes = set(futuros)
+    atraso = controle.atraso_hedge() if hedge else None
+    while True:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            raise PrazoChamadaExcedidoError(
+                f"O modelo {controle.modelo} não respondeu dentro do prazo."
+            )
+        aguardar_hedge = atraso is not None and len(futuros) == 1
+        prontos, pendentes = wait(
+            pendentes,
+            timeout=min(restante, atraso) if aguardar_hedge else restante,
+            return_when=FIRST_COMPLETED,
+        )
+        for futuro in prontos:
+            if futuro.exception() is None:
+                for outro in pendentes:
+                    outro.cancel()
+                if futuro is not futuros[0]:
+                    with controle._lock:
+                        controle.hedges_vencedores += 1
+                return futuro.result()
+        if prontos and not pendentes:
+            raise next(iter(prontos)).exception()
+        if not prontos and aguardar_hedge:
+            reserva = _executor_chamadas.submit(chamar)
+            futuros.append(reserva)
+            pendentes.add(reserva)
+            with controle._lock:
+                controle.hedges += 1
+
+
+def executar_resiliente(
+    controle: ControleModelo,
+    chamar: Callable[[], T],
+    prazo: float = PRAZO_CHAMADA_PADRAO,
+    tentativas: int = TENTATIVAS_PADRAO,
+    hedge: bool = HEDGE_PADRAO,
+) -> T:
+    """Executa ``chamar`` com disjuntor, prazo total, novas tentativas com jitter e hedge opcional."""
+
+    disjuntor = controle.disjuntor
+    disjuntor.permitir()
+    limite = time.monotonic() + prazo
+    for tentativa in range(tentativas + 1):
+        try:
+            resultado = _tentativa(controle, chamar, limite, hedge)
+        except Exception as exc:
+            if not _retentavel(exc):
+                disjuntor.liberar()
+                raise
+            disjuntor.registrar_falha()
+            # "Full jitter": espalha as novas tentativas de chamadores concorrentes.
+            espera = random.uniform(0, min(_BACKOFF_TETO, _BACKOFF_BASE * 2**tentativa))
+            if (
+                tentativa == tentativas
+                or disjuntor.aberto
+                or time.monotonic() + espera >= limite
+            ):
+                raise
+            with controle._lock:
+                controle.retentativas += 1
+            time.sleep(espera)
+        else:
+            disjuntor.registrar_sucesso()
+            return resultado
+    raise AssertionError("inalcançável")  # pragma: no cover
+
+
+class ChatGeminiControlado(ChatGoogleGenerativeAI):
+    """``ChatGoogleGenerativeAI`` cujas chamadas passam pelo controle e pela resiliência do modelo."""
+
+    prazo_fila: float = PRAZO_FILA_PADRAO
+    prazo_chamada: float = PRAZO_CHAMADA_PADRAO
+    tentativas: int = TENTATIVAS_PADRAO
+    hedge: bool = HEDGE_PADRAO
+
+    def _chamada_unica(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]],
+        run_manager: Any,
+        kwargs: Dict[str, Any],
+    ) -> ChatResult:
+        controle = controle_modelo(self.model)
+        with controle.reservar(self.prazo_fila):
+            inicio = time.monotonic()
+            resultado = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            controle.registrar_latencia(time.monotonic() - inicio)
+            return resultado
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return executar_resiliente(
+            controle_modelo(self.model),
+            lambda: self._chamada_unica(messages, stop, run_manager, kwargs),
+            prazo=self.prazo_chamada,
+            tentativas=self.tentativas,
+            hedge=self.hedge,
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Fila, prazo, retentativas e hedge são bloqueantes; rodamos em thread
+        # para não travar o event loop.
+        return await asyncio.to_thread(
+            self._generate, messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # Um stream já iniciado não pode ser repetido nem duplicado: aqui valem
+        # apenas a fila e o disjuntor.
+        controle = controle_modelo(self.model)
+        controle.disjuntor.permitir()
+        with controle.reservar(self.prazo_fila):
+            try:
+                yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as exc:
+                if _retentavel(exc):
+                    controle.disjuntor.registrar_falha()
+                else:
+                    controle.disjuntor.liberar()
+                raise
+        controle.disjuntor.registrar_sucesso()
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        controle = controle_modelo(self.model)
+        controle.disjuntor.permitir()
+        await asyncio.to_thread(controle.entrar, self.prazo_fila)
+        try:
+            async for chunk in super()._astream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ):
+                yield chunk
+        except Exception as exc:
+            if _retentavel(exc):
+                controle.disjuntor.registrar_falha()
+            else:
+                controle.disjuntor.liberar()
+            raise
+        finally:
+            controle.sair()
+        controle.disjuntor.registrar_sucesso()
+
+
+_clientes: Dict[Tuple[str, Optional[str], Tuple[Tuple[str, Any], ...]], ChatGeminiControlado] = {}
+_clientes_lock = threading.Lock()
+
+
+def obter_llm(
+    modelo: str = MODELO_PADRAO, agente: Optional[str] = None, **configuracoes: Any
+) -> ChatGeminiControlado:
+    """Retorna o cliente compartilhado para ``modelo`` com as ``configuracoes`` dadas.
+
+    Com ``agente``, as respostas passam pelo cache persistente daquele agente
+    (ver ``app.cache_llm``). Levanta ``ConfiguracaoAusenteError`` se a ``GOOGLE_API_KEY``
+    não estiver configurada.
+    """
+
+    if not GOOGLE_API_KEY:
+        raise ConfiguracaoAusenteError("GOOGLE_API_KEY não configurada.")
+
+    chave = (modelo, agente, tuple(sorted(configuracoes.items())))
+    with _clientes_lock:
+        cliente = _clientes.get(chave)
+        if cliente is None:
+            cliente = ChatGeminiControlado(
+                model=modelo,
+                google_api_key=GOOGLE_API_KEY,
+                **{
+                    # As retentativas ficam a cargo de ``executar_resiliente``; o SDK
+                    # faz uma só tentativa e desiste no prazo da chamada.
+                    "max_retries": 1,
+                    "timeout": configuracoes.get("prazo_chamada", PRAZO_CHAMADA_PADRAO),
+                    "cache": cache_llm(agente, modelo) if agente else None,
+                    **configuracoes,
+                },
+            )
+            _clientes[chave] = cliente
+        return cliente
+
+
+def metricas() -> Dict[str, Dict[str, Any]]:
+    """Profundidade de fila e contadores de cada modelo já utilizado."""
+
+    with _controles_lock:
+        controles = list(_controles.values())
+    return {controle.modelo: controle.metricas() for controle in controles}
+
+
+# -----------------------
+# Roteamento por agente
+# -----------------------
+
+ROTAS_PADRAO: Dict[str, List[str]] = {
+    # Tarefas curtas começam no modelo menor e escalam só quando necessário.
+    "seguranca": ["gemini-2.5-flash-lite", "gemini-2.5-flash"],
+    "extrator": ["gemini-2.5-flash-lite", "gemini-2.5-flash"],
+    "coach": ["gemini-2.5-flash"],
+    "sql": ["gemini-2.5-flash"],
+}
+_ROTAS: Dict[str, List[str]] = {
+    **ROTAS_PADRAO,
+    **json.loads(os.getenv("MONEYTORA_LLM_ROUTES", "{}")),
+}
+
+def modelos_do_agente(agente: str) -> List[str]:
+    """Modelos do agente em ordem de escalonamento (o primeiro é o padrão)."""
+
+    return list(_ROTAS.get(agente) or [MODELO_PADRAO])
+
+
+class EstatisticasRota:
+    """Decisões e latências recentes do roteamento de um agente."""
+
+    def __init__(self, amostras: int = 500) -> None:
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.escalonamentos = 0
+        self._por_modelo: Dict[str, Dict[str, Any]] = {}
+        self._amostras = amostras
+
+    def registrar(self, modelo: str, resultado: str, latencia: float) -> None:
+        with self._lock:
+            dados = self._por_modelo.setdefault(
+                modelo,
+                {"aceitas": 0, "escaladas": 0, "latencias": deque(maxlen=self._amostras)},
+            )
+            dados["aceitas" if resultado == "aceita" else "escaladas"] += 1
+            dados["latencias"].append(latencia)
+
+    def resumo(self) -> Dict[str, Any]:
+        with self._lock:
+            por_modelo = {}
+            for modelo, dados in self._por_modelo.items():
+                latencias = list(dados["latencias"])
+                p50, p95 = _percentil(latencias, 0.5), _percentil(latencias, 0.95)
+                por_modelo[modelo] = {
+                    "aceitas": dados["aceitas"],
+                    "escaladas": dados["escaladas"],
+                    "latencia_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                    "latencia_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                }
+            return {
+                "chamadas": self.chamadas,
+                "escalonamentos": self.escalonamentos,
+                "modelos": por_modelo,
+            }
+
+
+_estatisticas_rotas: Dict[str, EstatisticasRota] = {}
+_estatisticas_lock = threading.Lock()
+
+
+def _estatisticas(agente: str) -> EstatisticasRota:
+    with _estatisticas_lock:
+        return _estatisticas_rotas.setdefault(agente, EstatisticasRota())
+
+
+def executar_roteado(
+    agente: str,
+    chamar: Callable[[str], T],
+    aceitar: Callable[[T], bool] = lambda _: True,
+) -> T:
+    """Executa ``chamar(modelo)`` percorrendo os modelos do agente até uma resposta aceita.
+
+    Escala para o próximo modelo só quando a saída não valida no esquema
+    (``ValueError``, base dos erros de parse e de validação) ou quando ``aceitar``
+    rejeita a resposta. Prazos excedidos, circuito aberto e demais falhas propagam
+    na hora: um segundo modelo dobraria a latência de pior caso sem chance melhor
+    de responder. No último modelo, a falha é propagada e uma resposta não aceita
+    é devolvida mesmo assim.
+    """
+
+    estatisticas = _estatisticas(agente)
+    modelos = modelos_do_agente(agente)
+    with estatisticas._lock:
+        estatisticas.chamadas += 1
+
+    for posicao, modelo in enumerate(modelos):
+        ultimo = posicao == len(modelos) - 1
+        inicio = time.perf_counter()
+        try:
+            resultado = chamar(modelo)
+        except ValueError:
+            estatisticas.registrar(modelo, "erro", time.perf_counter() - inicio)
+            if ultimo:
+                raise
+        except Exception:
+            estatisticas.registrar(modelo, "erro", time.perf_counter() - inicio)
+            raise
+        else:
+            aceito = aceitar(resultado)
+            estatisticas.registrar(
+                modelo, "aceita" if aceito or ultimo else "escalada", time.perf_counter() - inicio
+            )
+            if aceito or ultimo:
+                return resultado
+        with estatisticas._lock:
+            estatisticas.escalonamentos += 1
+    raise RuntimeError(f"Nenhum modelo configurado para o agente {agente}.")  # pragma: no cover
+
+
+def metricas_roteamento() -> Dict[str, Dict[str, Any]]:
+    """Resumo das decisões de roteamento e latências por agente e modelo."""
+
+    with _estatisticas_lock:
+        itens = list(_estatisticas_rotas.items())
+    return {agente: estatisticas.resumo() for agente, estatisticas in itens}
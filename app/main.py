@@ -1,14 +1,34 @@
 """Aplicação FastAPI que expõe os fluxos do Moneytora."""
-from typing import List
+import io
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.agents.coach import responder_pergunta
 from app.agents.seguranca import avaliar_mensagem
-from app.graph.orchestrator import app_graph
-from app import database, repository, schemas
+from app.graph.orchestrator import (
+    ERROS_TRANSITORIOS,
+    app_graph,
+    executar_ingestao,
+    listar_ingestoes_pendentes,
+    retomar_ingestao,
+)
+from app import cache_llm, database, idempotencia, llm, repository, schemas
+from app.importacao import importar_extrato
+from app.jobs import FilaCheiaError, Job, fila_relatorios
+from app.llm import ERROS_INDISPONIBILIDADE
 from app.schemas import ChatRequest, ProcessarTextoRequest
+from app.tools.reports import (
+    enfileirar_relatorio,
+    gerar_relatorio,
+    gerar_relatorio_html,
+    url_job_relatorio,
+)
+from app.tools.reports_lote import gerar_relatorios_em_lote
 
 app = FastAPI(
     title="Moneytora API",
@@ -24,49 +44,204 @@ def read_root() -> dict[str, str]:
     return {"status": "Moneytora API is running"}
 
 
-@app.post("/api/transacoes/processar")
-def processar_transacao(request: ProcessarTextoRequest) -> dict[str, object]:
-    """Processa um texto de notificação financeira utilizando o LangGraph."""
-
-    inputs = {"texto_original": request.texto}
-    final_state = app_graph.invoke(inputs)
-
+def _resposta_ingestao(final_state: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
     if final_state.get("erro"):
-        raise HTTPException(status_code=400, detail=final_state["erro"])
+        return 400, {"detail": final_state["erro"]}
+
+    if final_state.get("grafo") == "multiplo":
+        classificadas = sorted(final_state.get("classificadas", []), key=lambda item: item["indice"])
+        return 200, {
+            "success": True,
+            "ingestao_id": final_state.get("ingestao_id"),
+            "transacao_ids": final_state.get("transacao_ids", []),
+            "anomalias": [item.get("anomalia") for item in classificadas if not item.get("erro")],
+            "erros": final_state.get("erros", []),
+            "mensagem": f"{len(final_state.get('transacao_ids', []))} transações processadas e armazenadas.",
+        }
 
-    return {
+    return 200, {
         "success": True,
+        "ingestao_id": final_state.get("ingestao_id"),
         "transacao_id": final_state.get("transacao_id"),
+        "anomalia": final_state.get("anomalia"),
         "mensagem": "Transação processada e armazenada com sucesso.",
     }
 
 
+def _falha_transitoria(ingestao_id: str) -> Tuple[int, Dict[str, Any]]:
+    return 503, {
+        "detail": {
+            "mensagem": "Falha transitória durante a ingestão; ela pode ser retomada sem nova extração.",
+            "ingestao_id": ingestao_id,
+        }
+    }
+
+
+def _executar_processamento(
+    texto: str,
+    multiplas: bool = False,
+    ingestao_id: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+) -> Tuple[int, Dict[str, Any]]:
+    ingestao_id = ingestao_id or uuid.uuid4().hex
+    try:
+        final_state = executar_ingestao(
+            texto,
+            ingestao_id,
+            grafo="multiplo" if multiplas else "padrao",
+            cliente_id=cliente_id,
+        )
+    except ERROS_TRANSITORIOS:
+        return _falha_transitoria(ingestao_id)
+    return _resposta_ingestao(final_state)
+
+
+@app.post("/api/transacoes/processar")
+def processar_transacao(
+    request: ProcessarTextoRequest,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
+) -> dict[str, object]:
+    """Processa um texto de notificação financeira utilizando o LangGraph.
+
+    Com o cabeçalho ``Idempotency-Key``, repetições da mesma requisição devolvem o
+    resultado armazenado sem executar o grafo (e o LLM) novamente; a chave também
+    identifica a ingestão, então repetir após uma falha transitória retoma a execução
+    do último checkpoint. Com ``multiplas=true``, todas as transações do texto são
+    extraídas em uma única chamada ao LLM e gravadas em um único commit.
+    """
+
+    if idempotency_key:
+        # A chave vale por cliente, tanto para a resposta quanto para o checkpoint.
+        chave = idempotencia.chave_do_cliente(idempotency_key, request.cliente_id)
+        try:
+            status_code, corpo = idempotencia.executar_idempotente(
+                chave,
+                # Sem ``cliente_id``, o hash é o mesmo das requisições anteriores ao campo.
+                request.model_dump(exclude_none=True),
+                lambda: _executar_processamento(
+                    request.texto,
+                    request.multiplas,
+                    ingestao_id=chave,
+                    cliente_id=request.cliente_id,
+                ),
+            )
+        except idempotencia.ConflitoIdempotenciaError as exc:
+            raise HTTPException(status_code=422, detail=str(exc)) from exc
+        except idempotencia.EmAndamentoError as exc:
+            raise HTTPException(status_code=409, detail=str(exc)) from exc
+    else:
+        status_code, corpo = _executar_processamento(
+            request.texto, request.multiplas, cliente_id=request.cliente_id
+        )
+
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail=corpo["detail"])
+    return corpo
+
+
+@app.get("/api/admin/ingestoes")
+def listar_ingestoes(limite: int = 100) -> List[Dict[str, Any]]:
+    """Lista as ingestões interrompidas por falhas transitórias que podem ser retomadas."""
+
+    return listar_ingestoes_pendentes(limite=limite)
+
+
+@app.get("/api/admin/llm")
+def metricas_llm() -> Dict[str, Dict[str, Any]]:
+    """Profundidade de fila, chamadas em andamento e rejeições por modelo."""
+
+    return llm.metricas()
+
+
+@app.get("/api/admin/llm/roteamento")
+def metricas_roteamento_llm() -> Dict[str, Dict[str, Any]]:
+    """Chamadas, escalonamentos e latências (p50/p95) por agente e modelo."""
+
+    return llm.metricas_roteamento()
+
+
+@app.get("/api/admin/llm/cache")
+def metricas_cache_llm() -> Dict[str, Dict[str, Any]]:
+    """Ocupação, TTL e acertos/faltas do cache de respostas por agente e modelo."""
+
+    return cache_llm.metricas_cache()
+
+
+@app.get("/api/admin/banco")
+def metricas_banco() -> Dict[str, Any]:
+    """Modo de fragmentação, engines abertos e transações por arquivo de banco."""
+
+    return {
+        **database.roteador.metricas(),
+        "transacoes": database.roteador.agregar(repository.contar_transacoes),
+    }
+
+
+@app.post("/api/admin/ingestoes/{ingestao_id}/retomar")
+def retomar_ingestao_pendente(ingestao_id: str) -> dict[str, object]:
+    """Retoma uma ingestão a partir do último nó concluído, sem repetir a extração."""
+
+    try:
+        final_state = retomar_ingestao(ingestao_id)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail="Ingestão pendente não encontrada.") from exc
+    except ERROS_TRANSITORIOS:
+        status_code, corpo = _falha_transitoria(ingestao_id)
+    else:
+        status_code, corpo = _resposta_ingestao(final_state)
+
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail=corpo["detail"])
+    return corpo
+
+
+@app.post("/api/transacoes/importar")
+async def importar_transacoes(
+    request: Request, formato: str = "ofx", cliente_id: Optional[str] = None
+) -> Dict[str, int]:
+    """Importa um extrato OFX ou CSV enviado no corpo da requisição, sem usar o LLM."""
+
+    conteudo = await request.body()
+    try:
+        return await run_in_threadpool(importar_extrato, conteudo, formato, cliente_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
 @app.post("/api/transacoes/", response_model=schemas.TransacaoSchema)
-def create_transacao(
-    transacao: schemas.TransacaoCreate,
-    db: Session = Depends(database.get_db),
-) -> schemas.TransacaoSchema:
-    """Cria uma nova transação manualmente."""
+def create_transacao(transacao: schemas.TransacaoCreate) -> schemas.TransacaoSchema:
+    """Cria uma nova transação manualmente (no banco do ``cliente_id`` do corpo)."""
 
-    return repository.criar_transacao(db, transacao)
+    with database.session_scope(transacao.cliente_id) as db:
+        return schemas.TransacaoSchema.model_validate(repository.criar_transacao(db, transacao))
 
 
 @app.get("/api/transacoes/", response_model=List[schemas.TransacaoSchema])
 def get_transacoes(
-    skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)
+    skip: int = 0,
+    limit: int = 100,
+    cliente_id: Optional[str] = None,
+    db: Session = Depends(database.get_db),
 ) -> List[schemas.TransacaoSchema]:
-    """Lista transações cadastradas com suporte a paginação simples."""
+    """Lista transações cadastradas com suporte a paginação simples.
 
-    return repository.listar_transacoes(db, skip=skip, limit=limit)
+    Com ``cliente_id``, esta e as demais rotas de transações enxergam apenas as
+    transações do cliente; sem ele, apenas as transações sem cliente. Uma transação
+    de outro cliente responde 404.
+    """
+
+    return repository.listar_transacoes(db, skip=skip, limit=limit, cliente_id=cliente_id)
 
 
 @app.get("/api/transacoes/{transacao_id}", response_model=schemas.TransacaoSchema)
 def get_transacao(
-    transacao_id: int, db: Session = Depends(database.get_db)
+    transacao_id: int,
+    cliente_id: Optional[str] = None,
+    db: Session = Depends(database.get_db),
 ) -> schemas.TransacaoSchema:
     """Recupera uma transação específica pelo identificador."""
 
-    db_transacao = repository.obter_transacao(db, transacao_id=transacao_id)
+    db_transacao = repository.obter_transacao(db, transacao_id=transacao_id, cliente_id=cliente_id)
     if db_transacao is None:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
     return db_transacao
@@ -76,11 +251,12 @@ def get_transacao(
 def update_transacao(
     transacao_id: int,
     transacao: schemas.TransacaoUpdate,
+    cliente_id: Optional[str] = None,
     db: Session = Depends(database.get_db),
 ) -> schemas.TransacaoSchema:
     """Atualiza uma transação existente."""
 
-    db_transacao = repository.atualizar_transacao(db, transacao_id, transacao)
+    db_transacao = repository.atualizar_transacao(db, transacao_id, transacao, cliente_id=cliente_id)
     if db_transacao is None:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
     return db_transacao
@@ -88,11 +264,13 @@ def update_transacao(
 
 @app.delete("/api/transacoes/{transacao_id}", response_model=schemas.TransacaoSchema)
 def delete_transacao(
-    transacao_id: int, db: Session = Depends(database.get_db)
+    transacao_id: int,
+    cliente_id: Optional[str] = None,
+    db: Session = Depends(database.get_db),
 ) -> schemas.TransacaoSchema:
     """Remove uma transação existente."""
 
-    db_transacao = repository.deletar_transacao(db, transacao_id=transacao_id)
+    db_transacao = repository.deletar_transacao(db, transacao_id=transacao_id, cliente_id=cliente_id)
     if db_transacao is None:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
     return db_transacao
@@ -103,11 +281,17 @@ def delete_transacao(
     response_model=List[schemas.GastoPorCategoria],
 )
 def get_gastos_por_categoria(
+    cliente_id: Optional[str] = None,
     db: Session = Depends(database.get_db),
 ) -> List[schemas.GastoPorCategoria]:
-    """Retorna o total de gastos agrupados por categoria."""
+    """Retorna o total de gastos agrupados por categoria.
 
-    return repository.calcular_gastos_por_categoria(db)
+    Sem ``cliente_id`` e com o banco fragmentado, soma os gastos de todos os shards.
+    """
+
+    if cliente_id is None and database.roteador.fragmentado:
+        return repository.calcular_gastos_por_categoria_em_todos_os_bancos()
+    return repository.calcular_gastos_por_categoria(db, cliente_id=cliente_id)
 
 
 @app.post("/api/chat")
@@ -116,6 +300,10 @@ def chat_financeiro(request: ChatRequest) -> dict[str, object]:
 
     try:
         classificacao = avaliar_mensagem(request.pergunta)
+    # Os prazos excedidos derivam de ``TimeoutError`` (um ``EnvironmentError``):
+    # a indisponibilidade precisa ser tratada antes da falta de configuração.
+    except ERROS_INDISPONIBILIDADE as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
     except EnvironmentError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
@@ -127,8 +315,140 @@ def chat_financeiro(request: ChatRequest) -> dict[str, object]:
         }
 
     try:
-        resposta = responder_pergunta(request.pergunta)
+        resposta = responder_pergunta(request.pergunta, cliente_id=request.cliente_id)
+    except ERROS_INDISPONIBILIDADE as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
     except EnvironmentError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
     return {"success": True, "resposta": resposta}
+
+
+def _pdf_response(resultado: Dict[str, Any]) -> StreamingResponse:
+    """Envia o PDF gerado em memória sem passar pelo sistema de arquivos."""
+
+    return StreamingResponse(
+        io.BytesIO(resultado["pdf_bytes"]),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{resultado["nome_arquivo"]}"'
+        },
+    )
+
+
+def _job_para_schema(job: Job) -> schemas.RelatorioJobSchema:
+    resultado = job.resultado if isinstance(job.resultado, dict) else None
+    pdf_disponivel = job.status == "concluido" and bool(resultado and resultado.get("pdf_bytes"))
+    return schemas.RelatorioJobSchema(
+        id=job.id,
+        status=job.status,
+        criado_em=job.criado_em,
+        iniciado_em=job.iniciado_em,
+        concluido_em=job.concluido_em,
+        erro=job.erro,
+        resultado={k: v for k, v in resultado.items() if k != "pdf_bytes"} if resultado else None,
+        pdf_url=url_job_relatorio(job, "/pdf") if pdf_disponivel else None,
+    )
+
+
+def _obter_job_relatorio(job_id: str, cliente_id: Optional[str]) -> Job:
+    job = fila_relatorios.obter(job_id)
+    # O job de outro cliente responde como inexistente, como nas rotas de transações.
+    if job is None or job.cliente_id != cliente_id:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    return job
+
+
+@app.post(
+    "/api/relatorios",
+    response_model=schemas.RelatorioJobSchema,
+    status_code=202,
+)
+def solicitar_relatorio(request: schemas.RelatorioRequest) -> schemas.RelatorioJobSchema:
+    """Enfileira a geração de um relatório em PDF e retorna o identificador do job."""
+
+    try:
+        job = enfileirar_relatorio(
+            request.start_date, request.end_date, cliente_id=request.cliente_id
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="Data inválida.") from exc
+    except FilaCheiaError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return _job_para_schema(job)
+
+
+@app.post(
+    "/api/relatorios/lote",
+    response_model=schemas.RelatorioJobSchema,
+    status_code=202,
+)
+def solicitar_relatorios_em_lote(
+    request: schemas.RelatorioLoteRequest,
+) -> schemas.RelatorioJobSchema:
+    """Enfileira o fechamento do mês: um relatório por cliente e o manifesto do lote."""
+
+    try:
+        job = fila_relatorios.enfileirar(
+            "relatorio_lote",
+            gerar_relatorios_em_lote,
+            chave=f"lote|{request.start_date}|{request.end_date}|{request.formato}",
+            start_date=request.start_date,
+            end_date=request.end_date,
+            formato=request.formato,
+        )
+    except FilaCheiaError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return _job_para_schema(job)
+
+
+@app.get("/api/relatorios/download")
+def download_relatorio_direto(
+    start_date: str, end_date: str, cliente_id: Optional[str] = None
+) -> StreamingResponse:
+    """Gera o PDF do período em memória e o envia diretamente na resposta."""
+
+    try:
+        resultado = gerar_relatorio(start_date, end_date, cliente_id=cliente_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="Data inválida.") from exc
+    if not resultado["ok"]:
+        raise HTTPException(status_code=404, detail=resultado["mensagem"])
+    return _pdf_response(resultado)
+
+
+@app.get("/api/relatorios/html", response_class=HTMLResponse)
+def relatorio_html(
+    start_date: str, end_date: str, cliente_id: Optional[str] = None
+) -> HTMLResponse:
+    """Retorna o relatório do período como página HTML com gráficos SVG embutidos."""
+
+    try:
+        resultado = gerar_relatorio_html(start_date, end_date, cliente_id=cliente_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="Data inválida.") from exc
+    if not resultado["ok"]:
+        raise HTTPException(status_code=404, detail=resultado["mensagem"])
+    return HTMLResponse(resultado["html"])
+
+
+@app.get("/api/relatorios/{job_id}", response_model=schemas.RelatorioJobSchema)
+def status_relatorio(job_id: str, cliente_id: Optional[str] = None) -> schemas.RelatorioJobSchema:
+    """Consulta o status de um job de relatório do cliente."""
+
+    return _job_para_schema(_obter_job_relatorio(job_id, cliente_id))
+
+
+@app.get("/api/relatorios/{job_id}/pdf")
+def download_relatorio(job_id: str, cliente_id: Optional[str] = None) -> StreamingResponse:
+    """Faz o download do PDF de um job concluído do cliente."""
+
+    job = _obter_job_relatorio(job_id, cliente_id)
+    if job.status == "erro":
+        raise HTTPException(status_code=500, detail=job.erro)
+    if job.status != "concluido":
+        raise HTTPException(status_code=409, detail="O relatório ainda está sendo gerado.")
+
+    if not (job.resultado or {}).get("pdf_bytes"):
+        raise HTTPException(status_code=404, detail=(job.resultado or {}).get("mensagem"))
+    return _pdf_response(job.resultado)
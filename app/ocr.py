@@ -0,0 +1,176 @@
+"""Cliente de OCR para imagens de comprovantes via API multimodal da Groq.
+
+O cliente mantém uma sessão HTTP com pool de conexões e retentativas com backoff
+exponencial, reduz e recomprime as imagens antes do envio (JPEG com lado máximo e
+tamanho-alvo configuráveis) e guarda o texto extraído no cache persistente pelo
+hash da imagem original. Lotes de comprovantes são enviados em paralelo com
+concorrência limitada.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, List, Optional, Sequence, Tuple, Union
+
+import requests
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.cache import CacheSQLite
+from app.config import GROQ_API
+
+OCR_URL = os.getenv("MONEYTORA_OCR_URL", "https://api.groq.com/openai/v1/chat/completions")
+OCR_MODELO = os.getenv("MONEYTORA_OCR_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+OCR_CONCORRENCIA = int(os.getenv("MONEYTORA_OCR_CONCURRENCY", "4"))
+OCR_TIMEOUT = float(os.getenv("MONEYTORA_OCR_TIMEOUT", "60"))
+# Comprovantes continuam legíveis bem abaixo da resolução das câmeras de celular.
+LADO_MAXIMO = int(os.getenv("MONEYTORA_OCR_MAX_SIDE", "1600"))
+BYTES_ALVO = int(os.getenv("MONEYTORA_OCR_TARGET_KB", "300")) * 1024
+
+_MIMES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+_PROMPT_SISTEMA = (
+    "Você é um OCR inteligente. Extraia todo o texto legível da imagem enviada "
+    "e devolva apenas o texto puro."
+)
+
+
+def preparar_imagem(
+    conteudo: bytes, lado_maximo: int = LADO_MAXIMO, bytes_alvo: int = BYTES_ALVO
+) -> Tuple[bytes, str]:
+    """Reduz e recomprime a imagem para o envio, retornando ``(bytes, mime)``.
+
+    Imagens já pequenas e em formato aceito são enviadas como estão.
+    """
+
+    imagem = Image.open(io.BytesIO(conteudo))
+    formato = imagem.format
+    if (
+        formato in _MIMES
+        and len(conteudo) <= bytes_alvo
+        and max(imagem.size) <= lado_maximo
+    ):
+        return conteudo, _MIMES[formato]
+
+    imagem = ImageOps.exif_transpose(imagem)
+    imagem = imagem.convert("L" if imagem.mode in ("1", "L", "LA") else "RGB")
+    imagem.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+
+    for qualidade in (85, 75, 65, 55, 45):
+        saida = io.BytesIO()
+        imagem.save(saida, format="JPEG", quality=qualidade, optimize=True)
+        if saida.tell() <= bytes_alvo:
+            break
+    return saida.getvalue(), "image/jpeg"
+
+
+class ClienteOCR:
+    """Extrai texto de imagens reaproveitando conexões, cache e um pool de threads."""
+
+    def __init__(
+        self,
+        url: str = OCR_URL,
+        api_key: Optional[str] = GROQ_API,
+        modelo: str = OCR_MODELO,
+        max_concorrencia: int = OCR_CONCORRENCIA,
+        timeout: float = OCR_TIMEOUT,
+        tentativas: int = 3,
+        cache: Optional[CacheSQLite] = None,
+    ) -> None:
+        self.url = url
+        self.api_key = api_key
+        self.modelo = modelo
+        self.max_concorrencia = max(1, max_concorrencia)
+        # (conexão, leitura): a conexão deve falhar rápido; a inferência pode demorar.
+        self.timeout = (min(5.0, timeout), timeout)
+        self.cache = cache or CacheSQLite("ocr", max_bytes=20 * 1024 * 1024)
+
+        retry = Retry(
+            total=tentativas,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adaptador = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.max_concorrencia, max_retries=retry
+        )
+        self.sessao = requests.Session()
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+
+    def _chave(self, conteudo: bytes) -> str:
+        return f"{self.modelo}:{hashlib.sha256(conteudo).hexdigest()}"
+
+    def _requisitar(self, imagem: bytes, mime: str) -> str:
+        b64 = base64.b64encode(imagem).decode("ascii")
+        payload = {
+            "model": self.modelo,
+            "messages": [
+                {"role": "system", "content": _PROMPT_SISTEMA},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}},
+                        {"type": "text", "text": "Extraia o texto desta imagem."},
+                    ],
+                },
+            ],
+            "temperature": 0,
+            "top_p": 1,
+            "stream": False,
+            "max_completion_tokens": 1024,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        try:
+            resp = self.sessao.post(self.url, headers=headers, json=payload, timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise RuntimeError(f"Erro ao chamar a API de OCR: {exc}") from exc
+        if resp.status_code != 200:
+            raise RuntimeError(f"Erro ao chamar a API de OCR: {resp.status_code} {resp.text}")
+
+        res_json = resp.json()
+        if "choices" not in res_json or not res_json["choices"]:
+            raise RuntimeError(f"Resposta inesperada da API de OCR: {res_json}")
+        return (res_json["choices"][0]["message"].get("content") or "").strip()
+
+    def extrair_texto(self, conteudo: bytes) -> str:
+        """Retorna o texto de uma imagem, consultando o cache antes da API."""
+
+        chave = self._chave(conteudo)
+        em_cache = self.cache.obter(chave)
+        if em_cache is not None:
+            return em_cache.decode("utf-8")
+
+        texto = self._requisitar(*preparar_imagem(conteudo))
+        self.cache.gravar(chave, texto.encode("utf-8"))
+        return texto
+
+    def extrair_textos(self, imagens: Sequence[bytes]) -> List[str]:
+        """Processa várias imagens em paralelo, preservando a ordem de entrada."""
+
+        unicas = list(dict.fromkeys(imagens))
+        if len(unicas) <= 1:
+            textos = [self.extrair_texto(imagem) for imagem in unicas]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(self.max_concorrencia, len(unicas))
+            ) as executor:
+                textos = list(executor.map(self.extrair_texto, unicas))
+        por_imagem = dict(zip(unicas, textos))
+        return [por_imagem[imagem] for imagem in imagens]
+
+
+cliente_ocr = ClienteOCR()
+
+
+def extrair_texto_imagem(arquivo: Union[bytes, IO[bytes]]) -> str:
+    """Extrai o texto de uma imagem (bytes ou arquivo enviado) com o cliente padrão."""
+
+    conteudo = arquivo if isinstance(arquivo, bytes) else arquivo.read()
+    return cliente_ocr.extrair_texto(conteudo)
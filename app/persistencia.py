@@ -0,0 +1,149 @@
+"""Serviço de persistência com um único escritor e commits em micro-lotes.
+
+Com ingestão concorrente, um commit por transação significa um fsync por linha e
+disputa pelo lock de escrita do SQLite. Aqui, uma única thread escritora consome
+uma fila limitada: ao receber a primeira inserção, espera alguns milissegundos
+pelas seguintes e grava todas em uma só transação do banco. Cada chamador recebe
+um ``Future`` com o id da sua própria transação.
+
+Com o banco fragmentado (ver ``database.RoteadorBanco``), cada shard tem o seu
+lock de escrita: a fila passa a ter ``escritores`` threads, cada uma responsável
+por um grupo fixo de shards, e cada lote é gravado com um commit por shard.
+Assim a vazão de escrita cresce com o número de shards.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from app import database, repository, schemas
+
+_Pedido = Tuple[schemas.TransacaoCreate, "Future[int]"]
+
+
+class FilaPersistencia:
+    """Agrupa inserções concorrentes em commits únicos, com uma thread por grupo de shards."""
+
+    def __init__(
+        self,
+        janela_ms: float = 5.0,
+        tamanho_lote: int = 256,
+        tamanho_max: int = 1024,
+        escritores: int = 1,
+        timeout: float = 30.0,
+    ) -> None:
+        self.janela = janela_ms / 1000
+        self.tamanho_lote = tamanho_lote
+        self.timeout = timeout
+        self._filas: List["queue.Queue[_Pedido]"] = [
+            queue.Queue(maxsize=tamanho_max) for _ in range(max(1, escritores))
+        ]
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self.lotes_gravados = 0
+        self.transacoes_gravadas = 0
+
+    def _iniciar(self) -> None:
+        with self._lock:
+            if not self._threads:
+                for indice, fila in enumerate(self._filas):
+                    thread = threading.Thread(
+                        target=self._loop,
+                        args=(fila,),
+                        name=f"persistencia-escritor-{indice}",
+                        daemon=True,
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _fila_do_shard(self, shard: Optional[str]) -> "queue.Queue[_Pedido]":
+        # Um shard sempre cai na mesma fila: as escritas de um arquivo não competem.
+        return self._filas[zlib.crc32((shard or "").encode("utf-8")) % len(self._filas)]
+
+    def enviar(self, transacao: schemas.TransacaoCreate) -> "Future[int]":
+        """Enfileira a transação; bloqueia apenas se a fila estiver cheia."""
+
+        self._iniciar()
+        futuro: "Future[int]" = Future()
+        self._fila_do_shard(database.roteador.shard(transacao.cliente_id)).put((transacao, futuro))
+        return futuro
+
+    def persistir(self, transacao: schemas.TransacaoCreate, timeout: Optional[float] = None) -> int:
+        """Enfileira a transação e aguarda o commit (até ``timeout``), retornando o id gerado."""
+
+        futuro = self.enviar(transacao)
+        try:
+            return futuro.result(self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            # Se ainda estava na fila, o escritor descarta o pedido cancelado.
+            futuro.cancel()
+            raise
+
+    def profundidade(self) -> int:
+        return sum(fila.qsize() for fila in self._filas)
+
+    def _coletar_lote(self, fila: "queue.Queue[_Pedido]") -> List[_Pedido]:
+        lote = [fila.get()]
+        limite = time.monotonic() + self.janela
+        while len(lote) < self.tamanho_lote:
+            restante = limite - time.monotonic()
+            try:
+                lote.append(fila.get(timeout=restante) if restante > 0 else fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar(self, lote: List[_Pedido]) -> None:
+        # Todos os pedidos do lote são do mesmo shard (ver ``_loop``).
+        with database.session_scope(lote[0][0].cliente_id) as session:
+            ids = repository.criar_transacoes(session, [transacao for transacao, _ in lote])
+        for (_, futuro), transacao_id in zip(lote, ids):
+            futuro.set_result(transacao_id)
+        with self._lock:
+            self.lotes_gravados += 1
+            self.transacoes_gravadas += len(lote)
+
+    def _processar(self, pedidos: List[_Pedido]) -> None:
+        por_shard: Dict[Optional[str], List[_Pedido]] = {}
+        for transacao, futuro in pedidos:
+            if futuro.set_running_or_notify_cancel():
+                shard = database.roteador.shard(transacao.cliente_id)
+                por_shard.setdefault(shard, []).append((transacao, futuro))
+        for lote in por_shard.values():
+            try:
+                self._gravar(lote)
+            except Exception:
+                # Um registro inválido não pode derrubar os demais: regravamos um a um.
+                for pedido in lote:
+                    try:
+                        self._gravar([pedido])
+                    except Exception as exc:
+                        pedido[1].set_exception(exc)
+
+    def _loop(self, fila: "queue.Queue[_Pedido]") -> None:
+        while True:
+            pedidos = self._coletar_lote(fila)
+            try:
+                self._processar(pedidos)
+            except Exception as exc:
+                # Falha fora da gravação (ex.: roteamento do shard): os pedidos pendentes
+                # recebem o erro e a thread segue atendendo a fila.
+                for _, futuro in pedidos:
+                    if not futuro.done():
+                        futuro.set_exception(exc)
+
+
+fila_persistencia = FilaPersistencia(
+    janela_ms=float(os.getenv("MONEYTORA_PERSIST_WINDOW_MS", "5")),
+    tamanho_lote=int(os.getenv("MONEYTORA_PERSIST_BATCH_SIZE", "256")),
+    tamanho_max=int(os.getenv("MONEYTORA_PERSIST_QUEUE_SIZE", "1024")),
+    escritores=int(
+        os.getenv("MONEYTORA_PERSIST_WRITERS", "4" if database.roteador.fragmentado else "1")
+    ),
+    timeout=float(os.getenv("MONEYTORA_PERSIST_TIMEOUT_S", "30")),
+)
@@ -1,12 +1,13 @@
 """Camada de acesso a dados centralizada para operações com transações."""
 from __future__ import annotations
 
-from typing import Iterable, List, Optional
+import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
 
-from sqlalchemy import func
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
 
-from . import database, schemas
+from . import database, estatisticas, resumo_mensal, schemas
 
 
 def criar_transacao(db: Session, transacao: schemas.TransacaoCreate) -> database.Transacao:
@@ -14,62 +15,212 @@ def criar_transacao(db: Session, transacao: schemas.TransacaoCreate) -> database
 
     db_transacao = database.Transacao(**transacao.model_dump())
     db.add(db_transacao)
+    estatisticas.registrar_valor(db, transacao.categoria, transacao.valor, transacao.cliente_id)
+    db.flush()
+    resumo_mensal.registrar_alteracoes(db, adicionadas=[db_transacao])
     db.commit()
     db.refresh(db_transacao)
     return db_transacao
 
 
-def listar_transacoes(db: Session, skip: int = 0, limit: int = 100) -> List[database.Transacao]:
+def criar_transacoes(
+    db: Session, transacoes: Sequence[schemas.TransacaoCreate]
+) -> List[int]:
+    """Persiste várias transações em um único commit e retorna os ids, na mesma ordem."""
+
+    db_transacoes = [database.Transacao(**t.model_dump()) for t in transacoes]
+    db.add_all(db_transacoes)
+    db.flush()
+    ids = [t.id for t in db_transacoes]
+    estatisticas.registrar_valores(db, ((t.cliente_id, t.categoria, t.valor) for t in transacoes))
+    resumo_mensal.registrar_alteracoes(db, adicionadas=db_transacoes)
+    db.commit()
+    return ids
+
+
+def criar_transacoes_em_lote(
+    db: Session, transacoes: Sequence[schemas.TransacaoCreate]
+) -> int:
+    """Insere várias transações com um único ``executemany`` e retorna quantas entraram.
+
+    Transações com ``fitid`` já existente para o mesmo cliente (ou repetido no próprio
+    lote) são ignoradas; o mesmo extrato pode ser importado por clientes diferentes.
+    """
+
+    existentes = set()
+    for cliente_id in {t.cliente_id for t in transacoes if t.fitid}:
+        fitids = {t.fitid for t in transacoes if t.fitid and t.cliente_id == cliente_id}
+        filtro_cliente = (
+            database.Transacao.cliente_id == cliente_id
+            if cliente_id is not None
+            else database.Transacao.cliente_id.is_(None)
+        )
+        existentes |= {
+            (cliente_id, fitid)
+            for (fitid,) in db.query(database.Transacao.fitid).filter(
+                filtro_cliente, database.Transacao.fitid.in_(fitids)
+            )
+        }
+
+    agora = datetime.datetime.utcnow()
+    novas = []
+    for transacao in transacoes:
+        if transacao.fitid:
+            chave = (transacao.cliente_id, transacao.fitid)
+            if chave in existentes:
+                continue
+            existentes.add(chave)
+        novas.append({**transacao.model_dump(), "data_criacao": agora, "data_atualizacao": agora})
+
+    if novas:
+        # ``OR IGNORE`` cobre a corrida com outra importação simultânea do mesmo arquivo;
+        # o ``RETURNING`` devolve só as linhas que de fato entraram.
+        tabela = database.Transacao.__table__
+        inseridas = db.connection().execute(
+            insert(tabela).prefix_with("OR IGNORE").returning(tabela.c.cliente_id, tabela.c.fitid),
+            novas,
+        ).all()
+        if len(inseridas) < len(novas):
+            # Sem ``fitid`` não há conflito possível: só as linhas com ``fitid`` caem aqui.
+            com_fitid = {(cliente_id, fitid) for cliente_id, fitid in inseridas if fitid}
+            novas = [t for t in novas if not t["fitid"] or (t["cliente_id"], t["fitid"]) in com_fitid]
+        estatisticas.registrar_valores(
+            db, ((t["cliente_id"], t["categoria"], t["valor"]) for t in novas)
+        )
+        resumo_mensal.registrar_alteracoes(db, adicionadas=novas)
+    db.commit()
+    return len(novas)
+
+
+def _transacoes(db: Session, cliente_id: Optional[str] = None):
+    """Consulta de transações restrita ao cliente informado (sem cliente, as sem cliente).
+
+    Mesma regra das ferramentas dos agentes e do resumo mensal: sem ``cliente_id``
+    nunca se enxergam transações de um cliente.
+    """
+
+    filtro_cliente = (
+        database.Transacao.cliente_id == cliente_id
+        if cliente_id is not None
+        else database.Transacao.cliente_id.is_(None)
+    )
+    return db.query(database.Transacao).filter(filtro_cliente)
+
+
+def listar_transacoes(
+    db: Session, skip: int = 0, limit: int = 100, cliente_id: Optional[str] = None
+) -> List[database.Transacao]:
     """Retorna uma lista paginada de transações cadastradas."""
 
-    return db.query(database.Transacao).offset(skip).limit(limit).all()
+    return _transacoes(db, cliente_id).offset(skip).limit(limit).all()
+
+
+def obter_transacao(
+    db: Session, transacao_id: int, cliente_id: Optional[str] = None
+) -> Optional[database.Transacao]:
+    """Obtém uma transação pelo identificador (de outro cliente, retorna ``None``)."""
+
+    return _transacoes(db, cliente_id).filter(database.Transacao.id == transacao_id).first()
+
 
+def _instantaneo(transacao: database.Transacao) -> dict:
+    campos = ("cliente_id", "data", "valor", "categoria", "empresa")
+    return {campo: getattr(transacao, campo) for campo in campos}
 
-def obter_transacao(db: Session, transacao_id: int) -> Optional[database.Transacao]:
-    """Obtém uma transação pelo identificador."""
 
-    return db.query(database.Transacao).filter(database.Transacao.id == transacao_id).first()
+def _lembrar_categoria(db: Session, transacao: database.Transacao) -> None:
+    """Guarda a categoria escolhida pelo cliente para as próximas transações da empresa."""
+
+    db.merge(
+        database.EmpresaClassificacaoCliente(
+            cliente_id=transacao.cliente_id,
+            nome_empresa=transacao.empresa.lower(),
+            categoria=transacao.categoria,
+        )
+    )
 
 
 def atualizar_transacao(
-    db: Session, transacao_id: int, dados: schemas.TransacaoUpdate
+    db: Session,
+    transacao_id: int,
+    dados: schemas.TransacaoUpdate,
+    cliente_id: Optional[str] = None,
 ) -> Optional[database.Transacao]:
-    """Atualiza uma transação existente com os dados informados."""
+    """Atualiza uma transação existente com os dados informados.
+
+    Quando o cliente corrige a categoria, a escolha passa a valer para as próximas
+    transações dele com a mesma empresa (sem alterar a classificação global).
+    O resumo mensal acompanha a alteração; os esboços de ``app.estatisticas`` não,
+    pois o P² não permite retirar observações.
+    """
 
-    db_transacao = obter_transacao(db, transacao_id)
+    db_transacao = obter_transacao(db, transacao_id, cliente_id)
     if not db_transacao:
         return None
 
+    antes = _instantaneo(db_transacao)
     for campo, valor in dados.model_dump(exclude_unset=True).items():
         setattr(db_transacao, campo, valor)
+    if db_transacao.cliente_id and db_transacao.categoria != antes["categoria"]:
+        _lembrar_categoria(db, db_transacao)
 
+    db.flush()
+    resumo_mensal.registrar_alteracoes(db, removidas=[antes], adicionadas=[db_transacao])
     db.commit()
     db.refresh(db_transacao)
     return db_transacao
 
 
-def deletar_transacao(db: Session, transacao_id: int) -> Optional[database.Transacao]:
-    """Remove uma transação do banco de dados e retorna o registro excluído."""
+def deletar_transacao(
+    db: Session, transacao_id: int, cliente_id: Optional[str] = None
+) -> Optional[database.Transacao]:
+    """Remove uma transação do banco de dados e retorna o registro excluído.
+
+    Como em ``atualizar_transacao``, os esboços de ``app.estatisticas`` não mudam.
+    """
 
-    db_transacao = obter_transacao(db, transacao_id)
+    db_transacao = obter_transacao(db, transacao_id, cliente_id)
     if db_transacao:
+        antes = _instantaneo(db_transacao)
         db.delete(db_transacao)
+        db.flush()
+        resumo_mensal.registrar_alteracoes(db, removidas=[antes])
         db.commit()
     return db_transacao
 
 
-def calcular_gastos_por_categoria(db: Session) -> List[schemas.GastoPorCategoria]:
-    """Agrega o total de gastos por categoria."""
+def calcular_gastos_por_categoria(
+    db: Session, cliente_id: Optional[str] = None
+) -> List[schemas.GastoPorCategoria]:
+    """Agrega o total de gastos por categoria (de um cliente, se informado)."""
 
-    resultados: Iterable[tuple[str, float]] = (
-        db.query(
-            database.Transacao.categoria,
-            func.sum(database.Transacao.valor).label("total"),
-        )
-        .group_by(database.Transacao.categoria)
-        .all()
+    consulta = db.query(
+        database.Transacao.categoria,
+        func.sum(database.Transacao.valor).label("total"),
     )
+    if cliente_id is not None:
+        consulta = consulta.filter(database.Transacao.cliente_id == cliente_id)
+    resultados: Iterable[tuple[str, float]] = consulta.group_by(database.Transacao.categoria).all()
     return [
         schemas.GastoPorCategoria(categoria=categoria, total=float(total or 0))
         for categoria, total in resultados
     ]
+
+
+def calcular_gastos_por_categoria_em_todos_os_bancos() -> List[schemas.GastoPorCategoria]:
+    """Soma os gastos por categoria do banco principal e de todos os shards."""
+
+    totais: Dict[str, float] = {}
+    for gastos in database.roteador.agregar(calcular_gastos_por_categoria).values():
+        for gasto in gastos:
+            totais[gasto.categoria] = totais.get(gasto.categoria, 0.0) + gasto.total
+    return [
+        schemas.GastoPorCategoria(categoria=categoria, total=total)
+        for categoria, total in totais.items()
+    ]
+
+
+def contar_transacoes(db: Session) -> int:
+    """Quantidade de transações do banco da sessão."""
+
+    return db.query(func.count(database.Transacao.id)).scalar()
@@ -0,0 +1,284 @@
+"""Resumo mensal por cliente mantido incrementalmente a cada escrita.
+
+Cada inserção, alteração ou exclusão de transação aplica sua diferença ao resumo
+do mês (totais, divisão por categoria, empresas e despesas atípicas) na mesma
+transação do banco, e incrementa a ``versao`` do resumo. O coach recebe o texto
+compacto de ``contexto_coach`` no prompt de sistema e responde perguntas abertas
+sem chamar ferramentas; como a versão entra no texto, respostas guardadas no
+cache do LLM deixam de valer assim que os dados mudam.
+
+Meses sem resumo (dados anteriores a esta tabela) são reconstruídos a partir das
+transações: gravados na primeira escrita do mês, apenas montados em memória nas
+leituras.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from . import database, estatisticas
+
+MAX_ANOMALIAS = 5
+MAX_CATEGORIAS_CONTEXTO = 6
+MAX_EMPRESAS_CONTEXTO = 5
+# Releituras de um resumo alterado por outra escrita antes de desistir.
+MAX_TENTATIVAS = 5
+
+_Chave = Tuple[str, str]
+
+
+def _mes(data: date) -> str:
+    return data.strftime("%Y-%m")
+
+
+def _mes_anterior(mes: str) -> str:
+    ano, numero = map(int, mes.split("-"))
+    return f"{ano - 1}-12" if numero == 1 else f"{ano}-{numero - 1:02d}"
+
+
+def _campo(transacao: Any, nome: str) -> Any:
+    return transacao[nome] if isinstance(transacao, dict) else getattr(transacao, nome)
+
+
+def _moeda(valor: float) -> str:
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _variacao(atual: float, anterior: Optional[float]) -> str:
+    if not anterior:
+        return ""
+    return f" ({100 * (atual - anterior) / anterior:+.0f}% vs mês anterior)"
+
+
+class _Resumo:
+    """Valores decodificados de um resumo mensal para aplicar diferenças.
+
+    Trabalha sobre uma cópia da linha, fora da sessão: a gravação é feita por
+    ``gravar`` com compare-and-swap na ``versao``.
+    """
+
+    def __init__(self, cliente_id: str, mes: str, linha: Optional[Mapping[str, Any]] = None) -> None:
+        linha = linha or {}
+        self.cliente_id = cliente_id
+        self.mes = mes
+        # ``None`` enquanto o resumo não existir no banco.
+        self.versao: Optional[int] = linha.get("versao")
+        self.total_gasto: float = linha.get("total_gasto") or 0.0
+        self.total_entradas: float = linha.get("total_entradas") or 0.0
+        self.quantidade: int = linha.get("quantidade") or 0
+        self.categorias: Dict[str, List[float]] = json.loads(linha.get("categorias") or "{}")
+        self.empresas: Dict[str, List[float]] = json.loads(linha.get("empresas") or "{}")
+        self.anomalias: List[Dict[str, Any]] = json.loads(linha.get("anomalias") or "[]")
+
+    @staticmethod
+    def _somar(grupos: Dict[str, List[float]], chave: str, valor: float, sinal: int) -> None:
+        gasto, quantidade = grupos.get(chave, [0.0, 0])
+        gasto, quantidade = round(gasto + sinal * valor, 2), quantidade + sinal
+        if quantidade <= 0:
+            grupos.pop(chave, None)
+        else:
+            grupos[chave] = [gasto, quantidade]
+
+    def aplicar(self, db: Session, transacao: Any, sinal: int) -> None:
+        valor = _campo(transacao, "valor")
+        self.quantidade += sinal
+        if valor >= 0:
+            self.total_entradas = round(self.total_entradas + sinal * valor, 2)
+            return
+
+        gasto = abs(valor)
+        categoria, empresa = _campo(transacao, "categoria"), _campo(transacao, "empresa")
+        self.total_gasto = round(self.total_gasto + sinal * gasto, 2)
+        self._somar(self.categorias, categoria, gasto, sinal)
+        self._somar(self.empresas, empresa, gasto, sinal)
+
+        item = {"empresa": empresa, "valor": gasto, "data": _campo(transacao, "data").isoformat()}
+        if sinal < 0:
+            if item in self.anomalias:
+                self.anomalias.remove(item)
+        elif estatisticas.avaliar_anomalia(db, categoria, valor, self.cliente_id)["anomalia"]:
+            self.anomalias.append(item)
+            self.anomalias.sort(key=lambda a: a["valor"], reverse=True)
+            del self.anomalias[MAX_ANOMALIAS:]
+
+    def valores(self) -> Dict[str, Any]:
+        return {
+            "total_gasto": self.total_gasto,
+            "total_entradas": self.total_entradas,
+            "quantidade": self.quantidade,
+            "categorias": json.dumps(self.categorias, ensure_ascii=False, separators=(",", ":")),
+            "empresas": json.dumps(self.empresas, ensure_ascii=False, separators=(",", ":")),
+            "anomalias": json.dumps(self.anomalias, ensure_ascii=False, separators=(",", ":")),
+        }
+
+    def gravar(self, db: Session) -> bool:
+        """Grava se a ``versao`` lida ainda for a atual; ``False`` se outra escrita veio antes."""
+
+        modelo = database.ResumoMensal
+        if self.versao is None:
+            # ``OR IGNORE``: outra escrita pode ter criado o resumo depois da leitura.
+            comando = (
+                insert(modelo.__table__)
+                .prefix_with("OR IGNORE")
+                .values(cliente_id=self.cliente_id, mes=self.mes, versao=1, **self.valores())
+            )
+        else:
+            # Pela ORM, para sincronizar instâncias do resumo já carregadas na sessão.
+            comando = (
+                update(modelo)
+                .where(modelo.cliente_id == self.cliente_id, modelo.mes == self.mes, modelo.versao == self.versao)
+                .values(versao=modelo.versao + 1, **self.valores())
+            )
+        return db.execute(comando).rowcount == 1
+
+    def registro(self) -> database.ResumoMensal:
+        return database.ResumoMensal(
+            cliente_id=self.cliente_id, mes=self.mes, versao=self.versao or 0, **self.valores()
+        )
+
+
+def _ler(db: Session, cliente_id: str, mes: str) -> Optional[_Resumo]:
+    """Lê o resumo direto do banco, sem passar pelo mapa de identidade da sessão."""
+
+    tabela = database.ResumoMensal.__table__
+    linha = db.execute(
+        select(tabela).where(tabela.c.cliente_id == cliente_id, tabela.c.mes == mes)
+    ).mappings().first()
+    return _Resumo(cliente_id, mes, linha) if linha is not None else None
+
+
+def _reconstruir(db: Session, cliente_id: str, mes: str) -> Optional[_Resumo]:
+    """Monta o resumo do mês a partir das transações; ``None`` se o mês estiver vazio."""
+
+    ano, numero = map(int, mes.split("-"))
+    inicio = date(ano, numero, 1)
+    fim = date(ano + numero // 12, numero % 12 + 1, 1)
+    transacao = database.Transacao
+    filtro_cliente = (
+        transacao.cliente_id == cliente_id if cliente_id else transacao.cliente_id.is_(None)
+    )
+    linhas = (
+        db.query(transacao.valor, transacao.categoria, transacao.empresa, transacao.data)
+        .filter(filtro_cliente, transacao.data >= inicio, transacao.data < fim)
+        .all()
+    )
+    if not linhas:
+        return None
+
+    resumo = _Resumo(cliente_id, mes)
+    for linha in linhas:
+        resumo.aplicar(db, dict(linha._mapping), 1)
+    return resumo
+
+
+def registrar_alteracoes(
+    db: Session, removidas: Iterable[Any] = (), adicionadas: Iterable[Any] = ()
+) -> None:
+    """Aplica aos resumos mensais as transações removidas e adicionadas.
+
+    Deve ser chamado depois do ``flush`` das alterações e não realiza ``commit``:
+    a atualização entra na mesma transação da escrita. Aceita objetos
+    ``Transacao`` ou dicionários com os mesmos campos. Cada resumo é gravado com
+    compare-and-swap na ``versao``; se outra escrita o alterou depois da leitura,
+    ele é relido e as diferenças são aplicadas de novo.
+    """
+
+    alteracoes: Dict[_Chave, List[Tuple[int, Any]]] = {}
+    for sinal, transacoes in ((-1, removidas), (1, adicionadas)):
+        for transacao in transacoes:
+            chave = (_campo(transacao, "cliente_id") or "", _mes(_campo(transacao, "data")))
+            alteracoes.setdefault(chave, []).append((sinal, transacao))
+
+    for chave, itens in alteracoes.items():
+        for _ in range(MAX_TENTATIVAS):
+            resumo = _ler(db, *chave)
+            if resumo is None:
+                # Reconstruído depois do flush: já reflete esta alteração. Se outra
+                # escrita criar o resumo antes, a próxima volta aplica as diferenças
+                # sobre ele (as linhas desta transação ainda não são visíveis a ela).
+                resumo = _reconstruir(db, *chave)
+                if resumo is None:
+                    break
+            else:
+                for sinal, transacao in itens:
+                    resumo.aplicar(db, transacao, sinal)
+            if resumo.gravar(db):
+                break
+        else:
+            raise RuntimeError(f"Resumo mensal {chave} alterado concorrentemente; tente novamente.")
+
+
+def obter_resumo(db: Session, cliente_id: Optional[str], mes: str) -> Optional[database.ResumoMensal]:
+    """Retorna o resumo do mês; se ainda não existir, monta-o em memória sem gravar."""
+
+    chave = (cliente_id or "", mes)
+    registro = db.get(database.ResumoMensal, chave)
+    if registro is None:
+        resumo = _reconstruir(db, *chave)
+        if resumo is None:
+            return None
+        registro = resumo.registro()
+    return registro
+
+
+def _linhas_mes(registro: database.ResumoMensal, anterior: Optional[database.ResumoMensal]) -> List[str]:
+    categorias = json.loads(registro.categorias)
+    categorias_anteriores = json.loads(anterior.categorias) if anterior else {}
+    empresas = json.loads(registro.empresas)
+    anomalias = json.loads(registro.anomalias)
+
+    linhas = [
+        f"{registro.mes}: gastos {_moeda(registro.total_gasto)}"
+        f"{_variacao(registro.total_gasto, anterior.total_gasto if anterior else None)}, "
+        f"entradas {_moeda(registro.total_entradas)}, {registro.quantidade} transações."
+    ]
+    if categorias:
+        maiores = sorted(categorias.items(), key=lambda item: item[1][0], reverse=True)
+        linhas.append(
+            "Categorias: "
+            + "; ".join(
+                f"{nome} {_moeda(gasto)}"
+                f"{_variacao(gasto, categorias_anteriores.get(nome, [None])[0])}"
+                for nome, (gasto, _) in maiores[:MAX_CATEGORIAS_CONTEXTO]
+            )
+        )
+    if empresas:
+        maiores = sorted(empresas.items(), key=lambda item: item[1][0], reverse=True)
+        linhas.append(
+            "Empresas: "
+            + "; ".join(
+                f"{nome} {_moeda(gasto)} ({quantidade}x)"
+                for nome, (gasto, quantidade) in maiores[:MAX_EMPRESAS_CONTEXTO]
+            )
+        )
+    if anomalias:
+        linhas.append(
+            "Gastos atípicos: "
+            + "; ".join(f"{a['empresa']} {_moeda(a['valor'])} em {a['data']}" for a in anomalias)
+        )
+    return linhas
+
+
+def contexto_coach(db: Session, cliente_id: Optional[str] = None, hoje: Optional[date] = None) -> Optional[str]:
+    """Texto compacto com o mês corrente e o anterior para o prompt do coach."""
+
+    mes = _mes(hoje or date.today())
+    atual = obter_resumo(db, cliente_id, mes)
+    anterior = obter_resumo(db, cliente_id, _mes_anterior(mes))
+    if atual is None and anterior is None:
+        return None
+
+    linhas = []
+    if atual is not None:
+        linhas += _linhas_mes(atual, anterior)
+    else:
+        linhas.append(f"{mes}: nenhuma transação registrada até agora.")
+    if anterior is not None:
+        # Do mês anterior bastam os totais e as categorias.
+        linhas += _linhas_mes(anterior, None)[:2]
+    versao = "/".join(str(r.versao) for r in (atual, anterior) if r is not None)
+    return f"Resumo dos dados (versão {versao}):\n" + "\n".join(linhas)
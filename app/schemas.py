@@ -1,6 +1,6 @@
 """Modelos Pydantic utilizados pelos endpoints da API."""
 from datetime import date, datetime
-from typing import Optional
+from typing import Any, Dict, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict
 
@@ -10,6 +10,8 @@ class TransacaoBase(BaseModel):
     empresa: str
     data: date
     categoria: str
+    cliente_id: Optional[str] = None
+    fitid: Optional[str] = None
 
 
 class TransacaoCreate(TransacaoBase):
@@ -32,12 +34,39 @@ class TransacaoSchema(TransacaoBase):
 
 class ProcessarTextoRequest(BaseModel):
     texto: str
+    # Extrai todas as transações do texto (extratos colados, resumos de SMS, recibos).
+    multiplas: bool = False
+    cliente_id: Optional[str] = None
 
 
 class ChatRequest(BaseModel):
     pergunta: str
+    cliente_id: Optional[str] = None
 
 
 class GastoPorCategoria(BaseModel):
     categoria: str
     total: float
+
+
+class RelatorioRequest(BaseModel):
+    start_date: str
+    end_date: str
+    cliente_id: Optional[str] = None
+
+
+class RelatorioLoteRequest(BaseModel):
+    start_date: str
+    end_date: str
+    formato: Literal["pdf", "html"] = "pdf"
+
+
+class RelatorioJobSchema(BaseModel):
+    id: str
+    status: str
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    concluido_em: Optional[datetime] = None
+    erro: Optional[str] = None
+    resultado: Optional[Dict[str, Any]] = None
+    pdf_url: Optional[str] = None
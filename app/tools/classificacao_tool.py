@@ -1,7 +1,10 @@
 """Ferramentas auxiliares utilizadas pelos agentes do Moneytora."""
+from typing import Dict, Iterable, Optional
+
 from langchain.tools import tool
+from sqlalchemy import insert
 
-from app.database import EmpresaClassificacao, session_scope
+from app.database import EmpresaClassificacao, EmpresaClassificacaoCliente, session_scope
 
 CATEGORIAS_MOCK = {
     "ifood": "Alimentação",
@@ -14,6 +17,39 @@ CATEGORIAS_MOCK = {
 }
 
 
+# Categorias aceitas como sugestão do extrator (modo de extração com categoria).
+CATEGORIAS_CONHECIDAS = (
+    "Alimentação",
+    "Supermercado",
+    "Transporte",
+    "Combustível",
+    "Moradia",
+    "Saúde",
+    "Educação",
+    "Lazer",
+    "Compras",
+    "Serviços",
+    "Salário",
+    "Transferências",
+    "Outros",
+)
+
+
+def classificar_empresa(
+    empresa: str, categoria_sugerida: Optional[str] = None, cliente_id: Optional[str] = None
+) -> str:
+    """Classifica a empresa, aceitando opcionalmente a sugestão do extrator.
+
+    A ordem de precedência é: categoria escolhida pelo próprio cliente, histórico do
+    banco, mapeamento mockado, sugestão do extrator (se for uma das
+    ``CATEGORIAS_CONHECIDAS``) e, por fim, "Outros". Um histórico "Outros" não
+    bloqueia uma sugestão melhor. O resultado é registrado para aprendizados futuros
+    (ver ``classificar_empresas_em_lote``, que aplica as mesmas regras).
+    """
+
+    return classificar_empresas_em_lote([empresa], {empresa: categoria_sugerida}, cliente_id)[empresa]
+
+
 @tool
 def classificar_empresa_por_categoria(empresa: str) -> str:
     """Classifica a empresa consultando o histórico e aplicando um fallback.
@@ -24,46 +60,107 @@ def classificar_empresa_por_categoria(empresa: str) -> str:
     resultado encontrado para aprendizados futuros.
     """
 
-    empresa_lower = empresa.lower()
+    return classificar_empresa(empresa)
 
-    with session_scope() as db:
-        classificacao = (
-            db.query(EmpresaClassificacao)
-            .filter(EmpresaClassificacao.nome_empresa == empresa_lower)
-            .first()
-        )
-        if classificacao:
-            return classificacao.categoria
 
+def _categoria_mock(empresa_lower: str) -> str:
     for key, categoria in CATEGORIAS_MOCK.items():
         if key in empresa_lower:
-            with session_scope() as db:
-                existente = (
-                    db.query(EmpresaClassificacao)
-                    .filter(EmpresaClassificacao.nome_empresa == empresa_lower)
-                    .first()
-                )
-                if existente is None:
-                    db.add(
-                        EmpresaClassificacao(
-                            nome_empresa=empresa_lower,
-                            categoria=categoria,
-                        )
-                    )
             return categoria
+    return "Outros"
+
+
+def _resolver(
+    nome: str, preferida: Optional[str], conhecida: Optional[str], sugerida: Optional[str]
+) -> str:
+    """Precedência comum às classificações individual e em lote."""
 
+    if preferida is not None:
+        return preferida
+    if conhecida is not None and not (conhecida == "Outros" and sugerida not in (None, "Outros")):
+        return conhecida
+    categoria = _categoria_mock(nome)
+    if categoria == "Outros" and sugerida:
+        categoria = sugerida
+    return categoria
+
+
+def classificar_empresas_em_lote(
+    empresas: Iterable[str],
+    sugestoes: Optional[Dict[str, Optional[str]]] = None,
+    cliente_id: Optional[str] = None,
+) -> Dict[str, str]:
+    """Classifica várias empresas com uma única consulta ao histórico.
+
+    Segue as regras de ``classificar_empresa``, com as sugestões do extrator em
+    ``sugestoes`` (``empresa -> categoria``), e registra de uma vez o que aprendeu.
+    O histórico global só é preenchido para empresas ainda sem registro; quando uma
+    sugestão substitui um "Outros" já registrado, a troca fica no histórico do
+    cliente, para que a sugestão de um cliente não mude a categoria dos demais.
+    Retorna o mapeamento ``empresa -> categoria``.
+    """
+
+    empresas = set(empresas)
+    nomes = {empresa: empresa.lower() for empresa in empresas}
+    if not nomes:
+        return {}
+    sugeridas = {
+        nomes[empresa]: categoria
+        for empresa, categoria in (sugestoes or {}).items()
+        if empresa in nomes and categoria in CATEGORIAS_CONHECIDAS
+    }
+
+    preferidas: Dict[str, str] = {}
+    if cliente_id:
+        # As categorias do cliente ficam no banco dele (ver ``RoteadorBanco``).
+        with session_scope(cliente_id) as db:
+            preferidas = dict(
+                db.query(
+                    EmpresaClassificacaoCliente.nome_empresa,
+                    EmpresaClassificacaoCliente.categoria,
+                )
+                .filter(
+                    EmpresaClassificacaoCliente.cliente_id == cliente_id,
+                    EmpresaClassificacaoCliente.nome_empresa.in_(set(nomes.values())),
+                )
+                .all()
+            )
+
+    categorias: Dict[str, str] = {}
+    trocas: Dict[str, str] = {}
     with session_scope() as db:
-        existente = (
-            db.query(EmpresaClassificacao)
-            .filter(EmpresaClassificacao.nome_empresa == empresa_lower)
-            .first()
+        conhecidas = dict(
+            db.query(EmpresaClassificacao.nome_empresa, EmpresaClassificacao.categoria)
+            .filter(EmpresaClassificacao.nome_empresa.in_(set(nomes.values())))
+            .all()
         )
-        if existente is None:
-            db.add(
-                EmpresaClassificacao(
-                    nome_empresa=empresa_lower,
-                    categoria="Outros",
-                )
+        novas = []
+        for nome in set(nomes.values()):
+            conhecida = conhecidas.get(nome)
+            categoria = categorias[nome] = _resolver(
+                nome, preferidas.get(nome), conhecida, sugeridas.get(nome)
             )
+            if nome in preferidas or categoria == conhecida:
+                continue
+            if conhecida is None:
+                novas.append({"nome_empresa": nome, "categoria": categoria})
+            elif cliente_id:
+                trocas[nome] = categoria
+            else:
+                db.query(EmpresaClassificacao).filter(
+                    EmpresaClassificacao.nome_empresa == nome
+                ).update({"categoria": categoria}, synchronize_session=False)
+        if novas:
+            # ``OR IGNORE``: outra classificação simultânea pode ter registrado a empresa.
+            db.execute(insert(EmpresaClassificacao.__table__).prefix_with("OR IGNORE"), novas)
 
-    return "Outros"
+    if trocas:
+        with session_scope(cliente_id) as db:
+            for nome, categoria in trocas.items():
+                db.merge(
+                    EmpresaClassificacaoCliente(
+                        cliente_id=cliente_id, nome_empresa=nome, categoria=categoria
+                    )
+                )
+
+    return {empresa: categorias[nome] for empresa, nome in nomes.items()}
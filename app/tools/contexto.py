@@ -0,0 +1,20 @@
+"""Acesso ao contexto da execução do coach a partir das tools.
+
+O ``cliente_id`` chega às tools pelo contexto do agente (``ToolRuntime``), nunca
+como argumento visível ao LLM: assim o modelo não consegue consultar os dados de
+outro cliente, nem por engano nem por instrução do usuário.
+
+Sem cliente no contexto, as tools (fatos, relatórios e agente SQL) enxergam apenas
+as transações sem cliente (``cliente_id`` nulo), a mesma regra do resumo mensal.
+"""
+
+from typing import Optional
+
+from langchain.tools import ToolRuntime
+
+
+def cliente_do_contexto(runtime: Optional[ToolRuntime]) -> Optional[str]:
+    """``cliente_id`` da execução corrente; ``None`` fora do agente ou sem cliente."""
+
+    contexto = getattr(runtime, "context", None) or {}
+    return contexto.get("cliente_id")
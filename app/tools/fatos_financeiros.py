@@ -0,0 +1,289 @@
+"""
+Tools: Fatos Financeiros
+
+Consultas SQL parametrizadas e determinísticas para as perguntas mais comuns do
+coach (totais por categoria, maiores despesas, comparação entre meses, histórico
+de uma empresa e contagem de transações). Cada pergunta é respondida com uma
+única chamada de ferramenta, sem o agente SQL aninhado, que continua disponível
+em ``consultar_dados_financeiros`` para o que estas ferramentas não cobrem.
+
+As consultas se restringem ao cliente do contexto da execução (ver
+``app.tools.contexto``) e usam os índices que começam por ``cliente_id``;
+sem cliente, às transações sem cliente.
+
+Gastos são as transações de valor negativo; os totais de gasto são devolvidos
+em valor absoluto.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from langchain.tools import ToolRuntime, tool
+from sqlalchemy import func
+
+from app import database
+from app.tools.contexto import cliente_do_contexto
+from app.tools.orcamento_saida import limitar_resultado
+
+Transacao = database.Transacao
+
+
+def _parse_data(valor: str) -> date:
+    # aceita '2025-11-09' ou '09/11/2025'
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        return datetime.strptime(valor, "%d/%m/%Y").date()
+
+
+def _periodo(data_inicio: Optional[str], data_fim: Optional[str]) -> Tuple[date, date]:
+    """Converte o período informado; sem datas, usa o mês corrente até hoje."""
+
+    hoje = date.today()
+    inicio = _parse_data(data_inicio) if data_inicio else hoje.replace(day=1)
+    fim = _parse_data(data_fim) if data_fim else hoje
+    return inicio, fim
+
+
+def _mes(referencia: str) -> Tuple[date, date]:
+    inicio = datetime.strptime(referencia, "%Y-%m").date()
+    proximo = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, proximo - timedelta(days=1)
+
+
+def _filtro_cliente(cliente_id: Optional[str]) -> list:
+    # Sem cliente, apenas as transações sem cliente (nunca as de todos os clientes).
+    return [Transacao.cliente_id == cliente_id if cliente_id else Transacao.cliente_id.is_(None)]
+
+
+def _filtros(
+    inicio: date, fim: date, categoria: Optional[str] = None, cliente_id: Optional[str] = None
+) -> list:
+    filtros = [*_filtro_cliente(cliente_id), Transacao.data >= inicio, Transacao.data <= fim]
+    if categoria:
+        filtros.append(func.lower(Transacao.categoria) == categoria.lower())
+    return filtros
+
+
+def _resumo_mes(
+    session, inicio: date, fim: date, categoria: Optional[str], cliente_id: Optional[str]
+) -> Dict[str, Any]:
+    gastos, entradas, quantidade = session.query(
+        func.coalesce(func.sum(Transacao.valor).filter(Transacao.valor < 0), 0.0),
+        func.coalesce(func.sum(Transacao.valor).filter(Transacao.valor > 0), 0.0),
+        func.count(Transacao.id),
+    ).filter(*_filtros(inicio, fim, categoria, cliente_id)).one()
+    return {
+        "mes": inicio.strftime("%Y-%m"),
+        "total_gasto": round(abs(gastos), 2),
+        "total_entradas": round(entradas, 2),
+        "quantidade": quantidade,
+    }
+
+
+@tool
+def total_por_categoria(
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    categoria: Optional[str] = None,
+    runtime: ToolRuntime = None,
+) -> Dict[str, Any]:
+    """Total gasto por categoria em um período (ex.: "quanto gastei com alimentação este mês?").
+
+    Sem ``categoria``, devolve todas as categorias ordenadas pelo total gasto.
+
+    Args:
+        data_inicio: Início do período 'YYYY-MM-DD' (padrão: primeiro dia do mês corrente)
+        data_fim: Fim do período 'YYYY-MM-DD' (padrão: hoje)
+        categoria: Categoria a filtrar (ex.: 'Alimentação'); opcional
+    """
+    inicio, fim = _periodo(data_inicio, data_fim)
+    cliente_id = cliente_do_contexto(runtime)
+    filtros = _filtros(inicio, fim, categoria, cliente_id)
+    with database.session_scope(cliente_id) as session:
+        linhas = (
+            session.query(
+                Transacao.categoria,
+                func.sum(Transacao.valor).label("total"),
+                func.count(Transacao.id),
+            )
+            .filter(*filtros, Transacao.valor < 0)
+            .group_by(Transacao.categoria)
+            .order_by(func.sum(Transacao.valor))
+            .all()
+        )
+    categorias = [
+        {"categoria": nome, "total_gasto": round(abs(total), 2), "quantidade": quantidade}
+        for nome, total, quantidade in linhas
+    ]
+    return limitar_resultado(
+        {
+            "periodo": {"inicio": inicio.isoformat(), "fim": fim.isoformat()},
+            "categorias": categorias,
+            "total_gasto": round(sum(item["total_gasto"] for item in categorias), 2),
+        },
+        cliente_id=cliente_id,
+    )
+
+
+@tool
+def maiores_despesas(
+    n: int = 5,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    categoria: Optional[str] = None,
+    runtime: ToolRuntime = None,
+) -> Dict[str, Any]:
+    """As N maiores despesas de um período (ex.: "quais foram minhas 5 maiores compras?").
+
+    Args:
+        n: Quantidade de despesas (padrão 5, máximo 50)
+        data_inicio: Início do período 'YYYY-MM-DD' (padrão: primeiro dia do mês corrente)
+        data_fim: Fim do período 'YYYY-MM-DD' (padrão: hoje)
+        categoria: Categoria a filtrar; opcional
+    """
+    inicio, fim = _periodo(data_inicio, data_fim)
+    cliente_id = cliente_do_contexto(runtime)
+    filtros = _filtros(inicio, fim, categoria, cliente_id)
+    with database.session_scope(cliente_id) as session:
+        linhas = (
+            session.query(Transacao.data, Transacao.empresa, Transacao.categoria, Transacao.valor)
+            .filter(*filtros, Transacao.valor < 0)
+            .order_by(Transacao.valor, Transacao.data.desc())
+            .limit(max(1, min(n, 50)))
+            .all()
+        )
+    return limitar_resultado(
+        {
+            "periodo": {"inicio": inicio.isoformat(), "fim": fim.isoformat()},
+            "despesas": [
+                {
+                    "data": data_transacao.isoformat(),
+                    "empresa": empresa,
+                    "categoria": nome_categoria,
+                    "valor": round(abs(valor), 2),
+                }
+                for data_transacao, empresa, nome_categoria, valor in linhas
+            ],
+        },
+        cliente_id=cliente_id,
+    )
+
+
+@tool
+def comparar_meses(
+    mes: Optional[str] = None, categoria: Optional[str] = None, runtime: ToolRuntime = None
+) -> Dict[str, Any]:
+    """Compara gastos e entradas de um mês com o mês anterior (ex.: "gastei mais este mês?").
+
+    Args:
+        mes: Mês de referência 'YYYY-MM' (padrão: mês corrente)
+        categoria: Categoria a comparar; opcional
+    """
+    inicio, fim = _mes(mes or date.today().strftime("%Y-%m"))
+    inicio_anterior, fim_anterior = _mes((inicio - timedelta(days=1)).strftime("%Y-%m"))
+    cliente_id = cliente_do_contexto(runtime)
+    with database.session_scope(cliente_id) as session:
+        atual = _resumo_mes(session, inicio, fim, categoria, cliente_id)
+        anterior = _resumo_mes(session, inicio_anterior, fim_anterior, categoria, cliente_id)
+    diferenca = round(atual["total_gasto"] - anterior["total_gasto"], 2)
+    return {
+        "categoria": categoria,
+        "mes_atual": atual,
+        "mes_anterior": anterior,
+        "diferenca_gasto": diferenca,
+        "variacao_percentual": round(100 * diferenca / anterior["total_gasto"], 1)
+        if anterior["total_gasto"]
+        else None,
+    }
+
+
+@tool
+def historico_empresa(empresa: str, limite: int = 10, runtime: ToolRuntime = None) -> Dict[str, Any]:
+    """Histórico de transações com uma empresa (ex.: "liste minhas compras no iFood").
+
+    A busca ignora maiúsculas e aceita parte do nome.
+
+    Args:
+        empresa: Nome (ou parte do nome) da empresa
+        limite: Quantidade de transações mais recentes a listar (padrão 10, máximo 50)
+    """
+    cliente_id = cliente_do_contexto(runtime)
+    filtros = [
+        *_filtro_cliente(cliente_id),
+        func.lower(Transacao.empresa).contains(empresa.strip().lower(), autoescape=True),
+    ]
+    with database.session_scope(cliente_id) as session:
+        quantidade, total, primeira, ultima = session.query(
+            func.count(Transacao.id),
+            func.coalesce(func.sum(Transacao.valor), 0.0),
+            func.min(Transacao.data),
+            func.max(Transacao.data),
+        ).filter(*filtros).one()
+        recentes = (
+            session.query(Transacao.data, Transacao.empresa, Transacao.categoria, Transacao.valor)
+            .filter(*filtros)
+            .order_by(Transacao.data.desc(), Transacao.id.desc())
+            .limit(max(1, min(limite, 50)))
+            .all()
+        )
+    return limitar_resultado(
+        {
+            "empresa": empresa,
+            "quantidade": quantidade,
+            "total": round(total, 2),
+            "primeira_data": primeira.isoformat() if primeira else None,
+            "ultima_data": ultima.isoformat() if ultima else None,
+            "recentes": [
+                {"data": d.isoformat(), "empresa": nome, "categoria": cat, "valor": round(valor, 2)}
+                for d, nome, cat, valor in recentes
+            ],
+        },
+        cliente_id=cliente_id,
+    )
+
+
+@tool
+def contar_transacoes(
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    categoria: Optional[str] = None,
+    empresa: Optional[str] = None,
+    runtime: ToolRuntime = None,
+) -> Dict[str, Any]:
+    """Quantidade de transações (gastos e entradas) em um período, com filtros opcionais.
+
+    Args:
+        data_inicio: Início do período 'YYYY-MM-DD' (padrão: primeiro dia do mês corrente)
+        data_fim: Fim do período 'YYYY-MM-DD' (padrão: hoje)
+        categoria: Categoria a filtrar; opcional
+        empresa: Nome (ou parte do nome) da empresa; opcional
+    """
+    inicio, fim = _periodo(data_inicio, data_fim)
+    cliente_id = cliente_do_contexto(runtime)
+    filtros = _filtros(inicio, fim, categoria, cliente_id)
+    if empresa:
+        filtros.append(
+            func.lower(Transacao.empresa).contains(empresa.strip().lower(), autoescape=True)
+        )
+    with database.session_scope(cliente_id) as session:
+        total, gastos, entradas = session.query(
+            func.count(Transacao.id),
+            func.count(Transacao.id).filter(Transacao.valor < 0),
+            func.count(Transacao.id).filter(Transacao.valor > 0),
+        ).filter(*filtros).one()
+    return {
+        "periodo": {"inicio": inicio.isoformat(), "fim": fim.isoformat()},
+        "quantidade": total,
+        "gastos": gastos,
+        "entradas": entradas,
+    }
+
+
+FERRAMENTAS_FATOS = [
+    total_por_categoria,
+    maiores_despesas,
+    comparar_meses,
+    historico_empresa,
+    contar_transacoes,
+]
@@ -0,0 +1,146 @@
+"""
+Orçamento de tamanho para os resultados das tools do coach.
+
+Tudo o que uma tool devolve vai para o contexto do LLM. Para que o tamanho do
+prompt (e a latência) não cresça com o histórico do usuário, os resultados passam
+por aqui antes de voltar ao agente:
+
+- listas longas são cortadas nas N primeiras linhas (já vêm ordenadas por
+  relevância), com a contagem total e um agregado (soma e divisão por categoria)
+  das linhas omitidas;
+- textos longos (respostas do agente SQL) são cortados em um limite de caracteres;
+- o conteúdo completo fica guardado no cache compartilhado sob um ``handle``, que
+  o agente pode paginar com a tool ``buscar_mais_resultados``. O handle pertence
+  ao cliente que o criou: outro cliente recebe "inexistente" ao usá-lo.
+
+Os limites vêm de ``MONEYTORA_TOOL_MAX_ROWS`` e ``MONEYTORA_TOOL_MAX_CHARS``; os
+conteúdos guardados expiram após ``MONEYTORA_TOOL_HANDLE_TTL_SECONDS`` e ocupam no
+máximo ``MONEYTORA_TOOL_HANDLE_MAX_MB`` (os menos usados saem primeiro).
+"""
+
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain.tools import ToolRuntime, tool
+
+from app.cache import CacheSQLite
+from app.tools.contexto import cliente_do_contexto
+
+MAX_LINHAS = int(os.getenv("MONEYTORA_TOOL_MAX_ROWS", "10"))
+# ~4 caracteres por token: 4000 caracteres ficam perto de mil tokens.
+MAX_CARACTERES = int(os.getenv("MONEYTORA_TOOL_MAX_CHARS", "4000"))
+HANDLE_TTL = float(os.getenv("MONEYTORA_TOOL_HANDLE_TTL_SECONDS", str(60 * 60)))
+HANDLE_MAX_BYTES = int(float(os.getenv("MONEYTORA_TOOL_HANDLE_MAX_MB", "50")) * 1024 * 1024)
+
+_resultados_completos = CacheSQLite("resultados_tools", max_bytes=HANDLE_MAX_BYTES, ttl=HANDLE_TTL)
+
+
+def _guardar(conteudo: Any, cliente_id: Optional[str]) -> str:
+    handle = uuid.uuid4().hex
+    _resultados_completos.gravar_json(handle, {"cliente_id": cliente_id, "conteudo": conteudo})
+    return handle
+
+
+def _agregado(linhas: List[Any]) -> Optional[Dict[str, Any]]:
+    """Soma e divisão por categoria das linhas omitidas, quando têm ``valor``."""
+
+    valores = [linha for linha in linhas if isinstance(linha, dict) and "valor" in linha]
+    if not valores:
+        return None
+    agregado: Dict[str, Any] = {"soma": round(sum(linha["valor"] for linha in valores), 2)}
+    por_categoria: Dict[str, float] = {}
+    for linha in valores:
+        if "categoria" in linha:
+            categoria = linha["categoria"]
+            por_categoria[categoria] = round(por_categoria.get(categoria, 0.0) + linha["valor"], 2)
+    if por_categoria:
+        agregado["por_categoria"] = por_categoria
+    return agregado
+
+
+def limitar_lista(
+    linhas: List[Any], max_linhas: int = MAX_LINHAS, cliente_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Corta ``linhas`` nas primeiras ``max_linhas`` e descreve o restante."""
+
+    omitidas = linhas[max_linhas:]
+    return {
+        "total": len(linhas),
+        "exibidos": len(linhas) - len(omitidas),
+        "handle": _guardar(linhas, cliente_id),
+        "agregado_omitidos": _agregado(omitidas),
+    }
+
+
+def limitar_resultado(
+    resultado: Dict[str, Any], max_linhas: int = MAX_LINHAS, cliente_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Aplica o orçamento às listas de um resultado de tool (no primeiro nível).
+
+    ``cliente_id`` é o cliente da execução: só ele pode paginar os handles gerados.
+    """
+
+    limitado = dict(resultado)
+    mais: Dict[str, Any] = {}
+    for campo, valor in resultado.items():
+        if isinstance(valor, list) and len(valor) > max_linhas:
+            mais[campo] = limitar_lista(valor, max_linhas, cliente_id)
+            limitado[campo] = valor[:max_linhas]
+    if mais:
+        limitado["mais_resultados"] = mais
+    return limitado
+
+
+def limitar_texto(
+    texto: str, max_caracteres: int = MAX_CARACTERES, cliente_id: Optional[str] = None
+) -> str:
+    """Corta o texto em uma quebra de linha dentro do limite e indica como ler o resto."""
+
+    if len(texto) <= max_caracteres:
+        return texto
+    corte = texto.rfind("\n", 0, max_caracteres)
+    corte = corte if corte > max_caracteres // 2 else max_caracteres
+    handle = _guardar(texto, cliente_id)
+    return (
+        f"{texto[:corte].rstrip()}\n"
+        f"[... {len(texto) - corte} caracteres omitidos; "
+        f"use buscar_mais_resultados(handle='{handle}', inicio={corte}) para continuar]"
+    )
+
+
+@tool
+def buscar_mais_resultados(
+    handle: str, inicio: int = 0, quantidade: Optional[int] = None, runtime: ToolRuntime = None
+) -> Dict[str, Any]:
+    """Busca a continuação de um resultado que foi resumido ("mais_resultados" ou texto cortado).
+
+    Use apenas quando o usuário precisar de itens além dos exibidos.
+
+    Args:
+        handle: Identificador informado no resultado resumido
+        inicio: Posição (linha ou caractere) a partir da qual continuar
+        quantidade: Quantas linhas trazer (no máximo o limite de linhas por resultado)
+    """
+    guardado = _resultados_completos.obter_json(handle)
+    # O handle de outro cliente responde como inexistente.
+    if guardado is None or guardado["cliente_id"] != cliente_do_contexto(runtime):
+        return {"ok": False, "mensagem": "Resultado expirado ou inexistente; refaça a consulta."}
+    conteudo = guardado["conteudo"]
+
+    if isinstance(conteudo, str):
+        fim = inicio + MAX_CARACTERES
+        return {
+            "ok": True,
+            "texto": conteudo[inicio:fim],
+            "total_caracteres": len(conteudo),
+            "proximo_inicio": fim if fim < len(conteudo) else None,
+        }
+
+    fim = inicio + min(quantidade or MAX_LINHAS, MAX_LINHAS)
+    return {
+        "ok": True,
+        "itens": conteudo[inicio:fim],
+        "total": len(conteudo),
+        "proximo_inicio": fim if fim < len(conteudo) else None,
+    }
@@ -1,24 +1,53 @@
+import hashlib
+import io
+import json
 import os
 import sqlite3
+import tempfile
 from datetime import date, datetime
-from typing import Optional, List, Dict, Any, Tuple
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Literal, Tuple
+from urllib.parse import quote
 
 import matplotlib
 matplotlib.use('Agg')
 
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from langchain.tools import tool
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
+from langchain.tools import ToolRuntime, tool
+
+from app import database
+from app.cache import CacheSQLite
+from app.jobs import FilaCheiaError, Job, fila_relatorios
+from app.tools.contexto import cliente_do_contexto
+from app.tools.orcamento_saida import limitar_resultado
+from app.tools.reports_html import renderizar_html
 
 
 # Caminho padrão do banco (ajuste conforme seu projeto)
 DEFAULT_DB_PATH = os.getenv("MONEYTORA_DB_PATH", "moneytora.db")
 
-# Pasta de saída para relatórios
+# Pasta de saída para relatórios. A gravação em disco é opcional: por padrão o PDF
+# é gerado em memória e servido diretamente (HTTP/Streamlit) ou a partir do cache.
 REPORTS_DIR = os.getenv("MONEYTORA_REPORTS_DIR", "reports")
-os.makedirs(REPORTS_DIR, exist_ok=True)
+REPORTS_PERSIST = os.getenv("MONEYTORA_REPORTS_PERSIST", "false").lower() in ("1", "true", "sim")
+
+LOGO_PATH = os.getenv(
+    "MONEYTORA_LOGO_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "moneytora_1.jpg"),
+)
+PRIMARY_COLOR = "#1E90FF"
+
+# Artefatos (PDF + resumo) ficam no cache compartilhado, indexados pela impressão
+# digital dos dados do período. Versão do layout entra na chave para invalidar PDFs antigos.
+REPORTS_CACHE_MAX_MB = int(os.getenv("MONEYTORA_REPORTS_CACHE_MAX_MB", "200"))
+REPORT_LAYOUT_VERSION = 2
+_cache_relatorios = CacheSQLite("relatorios", max_bytes=REPORTS_CACHE_MAX_MB * 1024 * 1024)
 
 
 def _parse_date(value: str) -> date:
@@ -33,6 +62,14 @@ def _get_connection(db_path: str):
     return sqlite3.connect(db_path)
 
 
+def _caminho_banco(db_path: str, cliente_id: Optional[str]) -> str:
+    """Com o banco fragmentado, o banco padrão dá lugar ao arquivo do cliente."""
+    if db_path == DEFAULT_DB_PATH and cliente_id and database.roteador.fragmentado:
+        database.roteador.engine(cliente_id)  # cria o arquivo e o esquema, se preciso
+        return database.roteador.caminho(cliente_id)
+    return db_path
+
+
 def _fetch_transactions(
     start_date: date,
     end_date: date,
@@ -43,35 +80,64 @@ def _fetch_transactions(
     Busca transações no SQLite.
     Assumo que a tabela se chame 'transacoes' e tenha:
     id, valor, empresa, data, categoria
-    Se você tiver um campo de dono/usuário, filtre por ele também.
+    Com ``cliente_id``, apenas as transações do cliente; sem ele, as sem cliente.
     """
-    conn = _get_connection(db_path)
+    conn = _get_connection(_caminho_banco(db_path, cliente_id))
     cursor = conn.cursor()
 
-    # Ajuste aqui se tiver coluna de usuário, ex: WHERE cliente_id = ?
-    if cliente_id:
-        query = """
-            SELECT id, valor, empresa, data, categoria
-            FROM transacoes
-            WHERE date(data) BETWEEN ? AND ?
-              AND cliente_id = ?
-            ORDER BY date(data) ASC
-        """
-        cursor.execute(query, (start_date.isoformat(), end_date.isoformat(), cliente_id))
-    else:
-        query = """
-            SELECT id, valor, empresa, data, categoria
-            FROM transacoes
-            WHERE date(data) BETWEEN ? AND ?
-            ORDER BY date(data) ASC
-        """
-        cursor.execute(query, (start_date.isoformat(), end_date.isoformat()))
+    # Mesmo predicado de ``_fingerprint_periodo``: ``data`` comparada sem ``date()``,
+    # pelo índice ``ix_transacoes_cliente_data_cobertura`` (``IS`` também casa o NULL).
+    query = """
+        SELECT id, valor, empresa, data, categoria
+        FROM transacoes
+        WHERE data BETWEEN ? AND ?
+          AND cliente_id IS ?
+    """
+    params: Tuple = (start_date.isoformat(), end_date.isoformat(), cliente_id or None)
+    cursor.execute(query + " ORDER BY data ASC", params)
 
     rows = cursor.fetchall()
     conn.close()
     return rows
 
 
+def _fingerprint_periodo(
+    start_date: date,
+    end_date: date,
+    cliente_id: Optional[str] = None,
+    db_path: str = DEFAULT_DB_PATH,
+) -> Tuple:
+    """
+    Impressão digital barata dos dados do período: contagem, soma, maior id e
+    maior carimbo de modificação. A consulta é resolvida apenas pelo índice
+    ``ix_transacoes_cliente_data_cobertura`` (a coluna ``data`` é comparada sem
+    ``date()`` justamente para permitir o uso do índice).
+    """
+    conn = _get_connection(_caminho_banco(db_path, cliente_id))
+    try:
+        query = """
+            SELECT COUNT(*), COALESCE(SUM(valor), 0), MAX(id), MAX(data_atualizacao)
+            FROM transacoes
+            WHERE data BETWEEN ? AND ?
+              AND cliente_id IS ?
+        """
+        params = (start_date.isoformat(), end_date.isoformat(), cliente_id or None)
+        return tuple(conn.execute(query, params).fetchone())
+    finally:
+        conn.close()
+
+
+def _chave_cache(sd: date, ed: date, cliente_id: Optional[str], db_path: str) -> str:
+    """Chave do período no cache: o banco (ou shard) de origem e a impressão digital dos dados."""
+    fingerprint = _fingerprint_periodo(sd, ed, cliente_id, db_path)
+    banco = os.path.abspath(_caminho_banco(db_path, cliente_id))
+    bruto = json.dumps(
+        [REPORT_LAYOUT_VERSION, banco, sd.isoformat(), ed.isoformat(), cliente_id, list(fingerprint)],
+        default=str,
+    )
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
 def _separate_in_out(rows: List[Tuple]) -> Dict[str, List[Dict[str, Any]]]:
     """
     Dependendo do teu modelo, pode ser que 'valor' seja sempre positivo
@@ -137,155 +203,195 @@ def _detect_outliers(transacoes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return outliers
 
 
-def _plot_pie_by_category(saidas_by_cat: Dict[str, float], out_path: str):
+def _figura_para_png(fig: Figure) -> io.BytesIO:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    return buffer
+
+
+def _plot_pie_by_category(saidas_by_cat: Dict[str, float]) -> Optional[io.BytesIO]:
     if not saidas_by_cat:
-        return
+        return None
     labels = list(saidas_by_cat.keys())
     # converter para positivo
     sizes = [abs(v) for v in saidas_by_cat.values()]
 
-    plt.figure()
-    plt.pie(sizes, labels=labels, autopct="%1.1f%%")
-    plt.title("Distribuição de despesas por categoria")
-    plt.tight_layout()
-    plt.savefig(out_path)
-    plt.close()
+    # Usamos ``Figure`` diretamente (e não o estado global do pyplot) porque os
+    # relatórios são renderizados em paralelo pelos workers da fila de jobs.
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.pie(sizes, labels=labels, autopct="%1.1f%%")
+    ax.set_title("Distribuição de despesas por categoria")
+    fig.tight_layout()
+    return _figura_para_png(fig)
 
 
-def _plot_bar_cashflow(dias: List[str], entradas: List[float], saidas: List[float], out_path: str):
+def _plot_bar_cashflow(
+    dias: List[str], entradas: List[float], saidas: List[float]
+) -> Optional[io.BytesIO]:
     if not dias:
-        return
+        return None
     x = range(len(dias))
-    plt.figure()
-    plt.bar(x, entradas, label="Entradas")
-    plt.bar(x, [-s for s in saidas], bottom=entradas, label="Saídas")  # empilhado simples
-    plt.xticks(x, dias, rotation=45)
-    plt.legend()
-    plt.title("Fluxo diário de caixa")
-    plt.tight_layout()
-    plt.savefig(out_path)
-    plt.close()
-
-
-def _build_pdf(
-    output_path: str,
-    periodo: str,
-    resumo: Dict[str, Any],
-    pie_path: Optional[str] = None,
-    cashflow_path: Optional[str] = None,
-):
-    c = canvas.Canvas(output_path, pagesize=A4)
-    width, height = A4
-
-    # Cabeçalho
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(40, height - 40, "Relatório Financeiro")
-    c.setFont("Helvetica", 10)
-    c.drawString(40, height - 55, f"Período: {periodo}")
-    c.drawString(40, height - 70, f"Total de entradas: R$ {resumo['total_entradas']:.2f}")
-    c.drawString(40, height - 85, f"Total de saídas: R$ {resumo['total_saidas']:.2f}")
-    c.drawString(40, height - 100, f"Saldo do período: R$ {resumo['saldo']:.2f}")
-
-    y = height - 120
-
-    # Maiores despesas
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, "Maiores despesas:")
-    y -= 15
-    c.setFont("Helvetica", 10)
-    for item in resumo["top_saidas"][:5]:
-        c.drawString(
-            50,
-            y,
-            f"- {item['empresa']} ({item['categoria']}) R$ {abs(item['valor']):.2f} em {item['data']}",
-        )
-        y -= 12
-
-    y -= 10
-
-    # Maiores entradas
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, "Maiores entradas:")
-    y -= 15
-    c.setFont("Helvetica", 10)
-    for item in resumo["top_entradas"][:5]:
-        c.drawString(
-            50,
-            y,
-            f"- {item['empresa']} R$ {item['valor']:.2f} em {item['data']}",
-        )
-        y -= 12
-
-    y -= 10
-
-    # Outliers
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, "Transações atípicas (outliers):")
-    y -= 15
-    c.setFont("Helvetica", 10)
-    if resumo["outliers"]:
-        for item in resumo["outliers"]:
-            c.drawString(
-                50,
-                y,
-                f"- {item['empresa']} ({item['categoria']}) R$ {abs(item['valor']):.2f} em {item['data']}",
-            )
-            y -= 12
-    else:
-        c.drawString(50, y, "- Nenhuma transação atípica identificada.")
-        y -= 12
-
-    # Nova página para gráficos
-    c.showPage()
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, height - 40, "Gráficos")
-
-    graph_y = height - 80
-
-    if pie_path and os.path.exists(pie_path):
-        img = ImageReader(pie_path)
-        c.drawImage(img, 40, graph_y - 200, width=250, height=200, preserveAspectRatio=True)
-
-    if cashflow_path and os.path.exists(cashflow_path):
-        img2 = ImageReader(cashflow_path)
-        c.drawImage(img2, 300, graph_y - 200, width=250, height=200, preserveAspectRatio=True)
-
-    c.save()
-
-from typing import Optional, Dict, Any
-import os
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-
-@tool
-def gerar_relatorio_financeiro(
-    start_date: str,
-    end_date: str,
-    cliente_id: Optional[str] = None,
-    db_path: str = DEFAULT_DB_PATH,
-) -> Dict[str, Any]:
-    """Gera um relatório financeiro em PDF para o período especificado.
-    
-    Args:
-        start_date: Data de início no formato 'YYYY-MM-DD'
-        end_date: Data de fim no formato 'YYYY-MM-DD'
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.bar(x, entradas, label="Entradas")
+    ax.bar(x, [-s for s in saidas], bottom=entradas, label="Saídas")  # empilhado simples
+    ax.set_xticks(list(x), dias, rotation=45)
+    ax.legend()
+    ax.set_title("Fluxo diário de caixa")
+    fig.tight_layout()
+    return _figura_para_png(fig)
+
+
+# Folha de estilos e logo são montados uma única vez por processo e reaproveitados
+# por todos os PDFs (inclusive pelos workers da geração em lote).
+@lru_cache(maxsize=1)
+def _estilos_pdf():
+    styles = getSampleStyleSheet()
+    # Usar nomes exclusivos para evitar conflito com estilos existentes
+    styles.add(ParagraphStyle(
+        name="MTitle",
+        fontSize=20,
+        leading=24,
+        textColor=colors.HexColor(PRIMARY_COLOR),
+        spaceAfter=12,
+        alignment=1,
+    ))
+    styles.add(ParagraphStyle(
+        name="MSubTitle",
+        fontSize=12,
+        leading=14,
+        textColor=colors.grey,
+        spaceAfter=8,
+        alignment=1,
+    ))
+    styles.add(ParagraphStyle(
+        name="MHeading",
+        fontSize=14,
+        leading=18,
+        textColor=colors.HexColor(PRIMARY_COLOR),
+        spaceBefore=12,
+        spaceAfter=6,
+    ))
+    styles.add(ParagraphStyle(
+        name="MNormal",
+        fontSize=11,
+        leading=15,
+        textColor=colors.black,
+    ))
+    return styles
+
+
+@lru_cache(maxsize=1)
+def _logo_bytes() -> Optional[bytes]:
+    if not os.path.exists(LOGO_PATH):
+        return None
+    with open(LOGO_PATH, "rb") as f:
+        return f.read()
+
+
+# ==========================================================
+# PDF ESTILIZADO - MONEYTORA (com nomes de estilo únicos)
+# ==========================================================
+def _build_pdf(destino, periodo_label, resumo, pie=None, cashflow=None):
+    """Gera PDF estilizado com a identidade visual da Moneytora.
+
+    ``destino`` pode ser um caminho ou um objeto arquivo (ex.: ``BytesIO``); os
+    gráficos também são recebidos como buffers PNG em memória.
     """
-    sd = _parse_date(start_date)
-    ed = _parse_date(end_date)
+    doc = SimpleDocTemplate(
+        destino,
+        pagesize=A4,
+        rightMargin=2*cm,
+        leftMargin=2*cm,
+        topMargin=2*cm,
+        bottomMargin=2*cm,
+        title="Relatório Financeiro - Moneytora",
+    )
 
-    rows = _fetch_transactions(sd, ed, cliente_id=cliente_id, db_path=db_path)
+    styles = _estilos_pdf()
+    elementos = []
+
+    # Cabeçalho: logo (se existir) + títulos
+    logo = _logo_bytes()
+    if logo is not None:
+        try:
+            elementos.append(Image(io.BytesIO(logo), width=120, height=60))
+        except Exception:
+            # caso o arquivo exista mas não seja legível, ignore o logo
+            pass
+
+    elementos.append(Spacer(1, 6))
+    elementos.append(Paragraph("Relatório Financeiro", styles["MTitle"]))
+    elementos.append(Paragraph("Moneytora", styles["MSubTitle"]))
+    elementos.append(Paragraph(f"Período: {periodo_label}", styles["MNormal"]))
+    elementos.append(Spacer(1, 12))
+
+    # Resumo financeiro
+    elementos.append(Paragraph("Resumo Financeiro", styles["MHeading"]))
+    data_resumo = [
+        ["Entradas", f"R$ {resumo['total_entradas']:.2f}"],
+        ["Saídas", f"R$ {resumo['total_saidas']:.2f}"],
+        ["Saldo", f"R$ {resumo['saldo']:.2f}"],
+    ]
+
+    tabela = Table(data_resumo, colWidths=[6*cm, 6*cm])
+    tabela.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(PRIMARY_COLOR)),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 11),
+        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+        ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
+        ("BOX", (0, 0), (-1, -1), 1, colors.HexColor(PRIMARY_COLOR)),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ]))
+    elementos.append(tabela)
+    elementos.append(Spacer(1, 12))
+
+    # Gráficos
+    if pie is not None:
+        elementos.append(Paragraph("Distribuição de Despesas por Categoria", styles["MHeading"]))
+        elementos.append(Image(pie, width=400, height=250))
+        elementos.append(Spacer(1, 12))
+
+    if cashflow is not None:
+        elementos.append(Paragraph("Fluxo de Caixa Diário", styles["MHeading"]))
+        elementos.append(Image(cashflow, width=400, height=250))
+        elementos.append(Spacer(1, 12))
+
+    # Principais despesas
+    if resumo.get("top_saidas"):
+        elementos.append(Paragraph("Principais Despesas", styles["MHeading"]))
+        top_data = [["Empresa", "Valor (R$)", "Data"]]
+        for t in resumo["top_saidas"][:5]:
+            top_data.append([t.get("empresa", ""), f"{abs(t['valor']):.2f}", t.get("data", "")])
+
+        tabela_top = Table(top_data, colWidths=[6*cm, 3*cm, 3*cm])
+        tabela_top.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(PRIMARY_COLOR)),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("ALIGN", (1, 1), (-1, -1), "CENTER"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ]))
+        elementos.append(tabela_top)
+        elementos.append(Spacer(1, 20))
+
+    # Rodapé
+    elementos.append(Paragraph("<b>Moneytora</b> © 2025 - Inteligência Financeira", styles["MNormal"]))
+
+    # Gera PDF
+    doc.build(elementos)
 
-    if not rows:
-        return {
-            "ok": False,
-            "mensagem": "Não há transações no período informado.",
-            "pdf_path": None,
-        }
 
+
+def _montar_resumo(rows: List[Tuple], sd: date, ed: date) -> Dict[str, Any]:
+    """Calcula totais, rankings, outliers e séries diárias a partir das linhas do período."""
     sep = _separate_in_out(rows)
     entradas = sep["entradas"]
     saidas = sep["saidas"]
@@ -299,13 +405,6 @@ def gerar_relatorio_financeiro(
     top_entradas = sorted(entradas, key=lambda x: x["valor"], reverse=True)
     outliers = _detect_outliers(saidas)
 
-    # Caminhos para salvar gráficos e PDF
-    REPORTS_DIR = r"C:\Users\pedro\OneDrive\hack_akcit\moneytora\reports"
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-
-    pie_path = os.path.join(REPORTS_DIR, f"pie_{sd}_{ed}.png")
-    _plot_pie_by_category(saidas_by_cat, pie_path)
-
     daily = {}
     for t in entradas + saidas:
         d = t["data"]
@@ -321,172 +420,242 @@ def gerar_relatorio_financeiro(
     entradas_diarias = [daily[d]["entradas"] for d in dias]
     saidas_diarias = [daily[d]["saidas"] for d in dias]
 
-    cashflow_path = os.path.join(REPORTS_DIR, f"cashflow_{sd}_{ed}.png")
-    _plot_bar_cashflow(dias, entradas_diarias, saidas_diarias, cashflow_path)
+    periodo_label = f"{sd.strftime('%d/%m/%Y')} a {ed.strftime('%d/%m/%Y')}"
 
-    pdf_name = f"relatorio_financeiro_{sd}_{ed}.pdf"
-    pdf_path = os.path.join(REPORTS_DIR, pdf_name)
+    texto_resumo = (
+        f"Análise do período {periodo_label}:\n"
+        f"- Entradas: R$ {total_entradas:.2f}\n"
+        f"- Saídas: R$ {total_saidas:.2f}\n"
+        f"- Saldo: R$ {saldo:.2f}\n"
+        f"- Maior despesa: "
+        f"{top_saidas[0]['empresa']} (R$ {abs(top_saidas[0]['valor']):.2f}) em {top_saidas[0]['data']}"
+        if top_saidas else ""
+    )
 
-    resumo = {
+    return {
+        "periodo_label": periodo_label,
+        "texto_resumo": texto_resumo,
         "total_entradas": total_entradas,
         "total_saidas": total_saidas,
         "saldo": saldo,
+        "saidas_by_cat": saidas_by_cat,
+        "dias": dias,
+        "entradas_diarias": entradas_diarias,
+        "saidas_diarias": saidas_diarias,
         "top_saidas": top_saidas,
         "top_entradas": top_entradas,
         "outliers": outliers,
     }
 
-    periodo_label = f"{sd.strftime('%d/%m/%Y')} a {ed.strftime('%d/%m/%Y')}"
 
-    # ==========================================================
-    # PDF ESTILIZADO - MONEYTORA (com nomes de estilo únicos)
-    # ==========================================================
-    LOGO_PATH = r"C:\Users\pedro\OneDrive\hack_akcit\moneytora\moneytora_1.jpg"
-    PRIMARY_COLOR = "#1E90FF"
-
-    def _build_pdf(pdf_path, periodo_label, resumo, pie_path=None, cashflow_path=None):
-        """Gera PDF estilizado com a identidade visual da Moneytora."""
-        doc = SimpleDocTemplate(
-            pdf_path,
-            pagesize=A4,
-            rightMargin=2*cm,
-            leftMargin=2*cm,
-            topMargin=2*cm,
-            bottomMargin=2*cm,
-            title="Relatório Financeiro - Moneytora",
-        )
-
-        styles = getSampleStyleSheet()
-        # Usar nomes exclusivos para evitar conflito com estilos existentes
-        styles.add(ParagraphStyle(
-            name="MTitle",
-            fontSize=20,
-            leading=24,
-            textColor=colors.HexColor(PRIMARY_COLOR),
-            spaceAfter=12,
-            alignment=1,
-        ))
-        styles.add(ParagraphStyle(
-            name="MSubTitle",
-            fontSize=12,
-            leading=14,
-            textColor=colors.grey,
-            spaceAfter=8,
-            alignment=1,
-        ))
-        styles.add(ParagraphStyle(
-            name="MHeading",
-            fontSize=14,
-            leading=18,
-            textColor=colors.HexColor(PRIMARY_COLOR),
-            spaceBefore=12,
-            spaceAfter=6,
-        ))
-        styles.add(ParagraphStyle(
-            name="MNormal",
-            fontSize=11,
-            leading=15,
-            textColor=colors.black,
-        ))
-
-        elementos = []
-
-        # Cabeçalho: logo (se existir) + títulos
-        if os.path.exists(LOGO_PATH):
-            try:
-                elementos.append(Image(LOGO_PATH, width=120, height=60))
-            except Exception:
-                # caso o arquivo exista mas não seja legível, ignore o logo
-                pass
-
-        elementos.append(Spacer(1, 6))
-        elementos.append(Paragraph("Relatório Financeiro", styles["MTitle"]))
-        elementos.append(Paragraph("Moneytora", styles["MSubTitle"]))
-        elementos.append(Paragraph(f"Período: {periodo_label}", styles["MNormal"]))
-        elementos.append(Spacer(1, 12))
+def _renderizar_pdf(resumo: Dict[str, Any]) -> bytes:
+    """Gera os gráficos e o PDF estilizado inteiramente em memória."""
 
-        # Resumo financeiro
-        elementos.append(Paragraph("Resumo Financeiro", styles["MHeading"]))
-        data_resumo = [
-            ["Entradas", f"R$ {resumo['total_entradas']:.2f}"],
-            ["Saídas", f"R$ {resumo['total_saidas']:.2f}"],
-            ["Saldo", f"R$ {resumo['saldo']:.2f}"],
-        ]
+    pie = _plot_pie_by_category(resumo["saidas_by_cat"])
+    cashflow = _plot_bar_cashflow(
+        resumo["dias"], resumo["entradas_diarias"], resumo["saidas_diarias"]
+    )
+    buffer = io.BytesIO()
+    _build_pdf(buffer, resumo["periodo_label"], resumo, pie=pie, cashflow=cashflow)
+    return buffer.getvalue()
 
-        tabela = Table(data_resumo, colWidths=[6*cm, 6*cm])
-        tabela.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(PRIMARY_COLOR)),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-            ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("FONTSIZE", (0, 0), (-1, -1), 11),
-            ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
-            ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
-            ("BOX", (0, 0), (-1, -1), 1, colors.HexColor(PRIMARY_COLOR)),
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ]))
-        elementos.append(tabela)
-        elementos.append(Spacer(1, 12))
 
-        # Gráficos
-        if pie_path and os.path.exists(pie_path):
-            elementos.append(Paragraph("Distribuição de Despesas por Categoria", styles["MHeading"]))
-            elementos.append(Image(pie_path, width=400, height=250))
-            elementos.append(Spacer(1, 12))
-
-        if cashflow_path and os.path.exists(cashflow_path):
-            elementos.append(Paragraph("Fluxo de Caixa Diário", styles["MHeading"]))
-            elementos.append(Image(cashflow_path, width=400, height=250))
-            elementos.append(Spacer(1, 12))
-
-        # Principais despesas
-        if resumo.get("top_saidas"):
-            elementos.append(Paragraph("Principais Despesas", styles["MHeading"]))
-            top_data = [["Empresa", "Valor (R$)", "Data"]]
-            for t in resumo["top_saidas"][:5]:
-                top_data.append([t.get("empresa", ""), f"{abs(t['valor']):.2f}", t.get("data", "")])
-
-            tabela_top = Table(top_data, colWidths=[6*cm, 3*cm, 3*cm])
-            tabela_top.setStyle(TableStyle([
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(PRIMARY_COLOR)),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("ALIGN", (1, 1), (-1, -1), "CENTER"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-            ]))
-            elementos.append(tabela_top)
-            elementos.append(Spacer(1, 20))
-
-        # Rodapé
-        elementos.append(Paragraph("<b>Moneytora</b> © 2025 - Inteligência Financeira", styles["MNormal"]))
-
-        # Gera PDF
-        doc.build(elementos)
-
-    # Chama o builder de PDF estilizado
-    _build_pdf(pdf_path, periodo_label, resumo, pie_path=pie_path, cashflow_path=cashflow_path)
+def _persistir_pdf(pdf_bytes: bytes, sd: date, ed: date, chave: str) -> str:
+    """Grava o PDF em ``REPORTS_DIR`` de forma atômica.
+
+    O nome inclui a chave do cache, então pedidos concorrentes do mesmo período
+    com dados diferentes não sobrescrevem o arquivo um do outro.
+    """
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    pdf_path = os.path.join(REPORTS_DIR, f"relatorio_financeiro_{sd}_{ed}_{chave[:12]}.pdf")
+    if not os.path.exists(pdf_path):
+        fd, temporario = tempfile.mkstemp(dir=REPORTS_DIR, suffix=".pdf.tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(temporario, pdf_path)
+    return pdf_path
 
-    texto_resumo = (
-        f"Análise do período {periodo_label}:\n"
-        f"- Entradas: R$ {total_entradas:.2f}\n"
-        f"- Saídas: R$ {total_saidas:.2f}\n"
-        f"- Saldo: R$ {saldo:.2f}\n"
-        f"- Maior despesa: "
-        f"{top_saidas[0]['empresa']} (R$ {abs(top_saidas[0]['valor']):.2f}) em {top_saidas[0]['data']}"
-        if top_saidas else ""
-    )
 
+def _formatar_resultado(resumo: Dict[str, Any], pdf_path: Optional[str]) -> Dict[str, Any]:
     return {
         "ok": True,
-        "mensagem": texto_resumo,
+        "mensagem": resumo["texto_resumo"],
         "pdf_path": pdf_path,
-        "periodo": periodo_label,
+        "periodo": resumo["periodo_label"],
         "totais": {
-            "entradas": total_entradas,
-            "saidas": total_saidas,
-            "saldo": saldo,
+            "entradas": resumo["total_entradas"],
+            "saidas": resumo["total_saidas"],
+            "saldo": resumo["saldo"],
         },
-        "top_saidas": top_saidas,
-        "top_entradas": top_entradas,
-        "outliers": outliers,
+        "top_saidas": resumo["top_saidas"],
+        "top_entradas": resumo["top_entradas"],
+        "outliers": resumo["outliers"],
+    }
+
+
+_SEM_TRANSACOES = {
+    "ok": False,
+    "mensagem": "Não há transações no período informado.",
+    "pdf_path": None,
+}
+
+
+def gerar_relatorio(
+    start_date: str,
+    end_date: str,
+    cliente_id: Optional[str] = None,
+    db_path: str = DEFAULT_DB_PATH,
+    persistir: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Gera o relatório em PDF de forma síncrona (usado pelos workers e pela API).
+
+    O PDF é devolvido em ``pdf_bytes``; só é gravado em disco (``pdf_path``) quando
+    ``persistir`` for verdadeiro ou, se omitido, quando ``MONEYTORA_REPORTS_PERSIST``
+    estiver habilitado.
+    """
+    sd = _parse_date(start_date)
+    ed = _parse_date(end_date)
+    persistir = REPORTS_PERSIST if persistir is None else persistir
+
+    # Se os dados do período não mudaram desde a última geração, reaproveitamos o PDF.
+    chave = _chave_cache(sd, ed, cliente_id, db_path)
+    resultado = _cache_relatorios.obter_json(f"{chave}:resumo")
+    pdf_bytes = _cache_relatorios.obter(f"{chave}:pdf") if resultado else None
+    cache = resultado is not None and pdf_bytes is not None
+
+    if not cache:
+        rows = _fetch_transactions(sd, ed, cliente_id=cliente_id, db_path=db_path)
+        if not rows:
+            return dict(_SEM_TRANSACOES)
+
+        resumo = _montar_resumo(rows, sd, ed)
+        pdf_bytes = _renderizar_pdf(resumo)
+        resultado = _formatar_resultado(resumo, pdf_path=None)
+        _cache_relatorios.gravar(f"{chave}:pdf", pdf_bytes)
+        _cache_relatorios.gravar_json(f"{chave}:resumo", resultado)
+
+    pdf_path = _persistir_pdf(pdf_bytes, sd, ed, chave) if persistir else None
+    return {
+        **resultado,
+        "pdf_path": pdf_path,
+        "pdf_bytes": pdf_bytes,
+        "nome_arquivo": f"relatorio_financeiro_{sd}_{ed}.pdf",
+        "cache": cache,
+    }
+
+
+def gerar_relatorio_html(
+    start_date: str,
+    end_date: str,
+    cliente_id: Optional[str] = None,
+    db_path: str = DEFAULT_DB_PATH,
+) -> Dict[str, Any]:
+    """Gera o relatório como página HTML com gráficos SVG (formato interativo rápido)."""
+    sd = _parse_date(start_date)
+    ed = _parse_date(end_date)
+
+    chave = _chave_cache(sd, ed, cliente_id, db_path)
+    resultado = _cache_relatorios.obter_json(f"{chave}:html")
+    if resultado is not None:
+        return {**resultado, "cache": True}
+
+    rows = _fetch_transactions(sd, ed, cliente_id=cliente_id, db_path=db_path)
+    if not rows:
+        return dict(_SEM_TRANSACOES)
+
+    resumo = _montar_resumo(rows, sd, ed)
+    resultado = {**_formatar_resultado(resumo, pdf_path=None), "html": renderizar_html(resumo)}
+    _cache_relatorios.gravar_json(f"{chave}:html", resultado)
+    return {**resultado, "cache": False}
+
+
+def enfileirar_relatorio(
+    start_date: str,
+    end_date: str,
+    cliente_id: Optional[str] = None,
+    db_path: str = DEFAULT_DB_PATH,
+) -> Job:
+    """Enfileira a geração do PDF; pedidos idênticos em andamento são reaproveitados.
+
+    Levanta ``FilaCheiaError`` quando a fila de relatórios está cheia.
+    """
+    sd = _parse_date(start_date)
+    ed = _parse_date(end_date)
+    return fila_relatorios.enfileirar(
+        "relatorio_pdf",
+        gerar_relatorio,
+        chave=f"{sd}|{ed}|{cliente_id}|{db_path}",
+        start_date=sd.isoformat(),
+        end_date=ed.isoformat(),
+        cliente_id=cliente_id,
+        db_path=db_path,
+    )
+
+
+def url_job_relatorio(job: Job, sufixo: str = "") -> str:
+    """Link do job de relatório; o ``cliente_id`` do dono vai na query, como exige a rota."""
+
+    url = f"/api/relatorios/{job.id}{sufixo}"
+    return f"{url}?cliente_id={quote(job.cliente_id, safe='')}" if job.cliente_id else url
+
+
+@tool
+def gerar_relatorio_financeiro(
+    start_date: str,
+    end_date: str,
+    formato: Literal["html", "pdf"] = "html",
+    runtime: ToolRuntime = None,
+) -> Dict[str, Any]:
+    """Gera um relatório financeiro para o período especificado.
+
+    Por padrão o relatório é uma página HTML leve, pronta na hora (``html_url``).
+    Use ``formato="pdf"`` apenas quando o usuário pedir explicitamente um PDF ou
+    documento para download: o PDF é renderizado em segundo plano e fica
+    disponível no link ``pdf_url``.
+
+    Args:
+        start_date: Data de início no formato 'YYYY-MM-DD'
+        end_date: Data de fim no formato 'YYYY-MM-DD'
+        formato: 'html' (padrão, rápido) ou 'pdf' (download)
+    """
+    # O cliente vem do contexto da execução, nunca de um argumento escolhido pelo LLM.
+    cliente_id = cliente_do_contexto(runtime)
+    # O banco também é resolvido aqui (shard do cliente), e não escolhido pelo LLM.
+    db_path = _caminho_banco(DEFAULT_DB_PATH, cliente_id)
+    sd = _parse_date(start_date)
+    ed = _parse_date(end_date)
+
+    # O resumo sai do cache do relatório HTML (mesma impressão digital), que ainda
+    # deixa a página do link ``html_url`` pronta para quando o usuário abri-la.
+    relatorio = gerar_relatorio_html(start_date, end_date, cliente_id=cliente_id, db_path=db_path)
+    if not relatorio["ok"]:
+        return dict(_SEM_TRANSACOES)
+
+    # Só as maiores linhas vão para o contexto do coach; o restante fica sob um handle.
+    resultado = limitar_resultado(
+        {chave: valor for chave, valor in relatorio.items() if chave not in ("html", "cache")},
+        cliente_id=cliente_id,
+    )
+
+    if formato != "pdf":
+        html_url = f"/api/relatorios/html?start_date={sd}&end_date={ed}"
+        if cliente_id:
+            html_url += f"&cliente_id={cliente_id}"
+        resultado["mensagem"] += f"\nRelatório completo disponível em {html_url}"
+        return {**resultado, "html_url": html_url}
+
+    try:
+        job = enfileirar_relatorio(start_date, end_date, cliente_id=cliente_id, db_path=db_path)
+    except FilaCheiaError as exc:
+        resultado["mensagem"] += f"\nO PDF não pôde ser gerado agora: {exc}"
+        return {**resultado, "job_id": None}
+
+    pdf_url = url_job_relatorio(job, "/pdf")
+    resultado["mensagem"] += f"\nO PDF está sendo gerado e ficará disponível em {pdf_url}"
+    return {
+        **resultado,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_job_relatorio(job),
+        "pdf_url": pdf_url,
     }
@@ -0,0 +1,169 @@
+"""Renderização do relatório financeiro em HTML autocontido com gráficos SVG.
+
+Alternativa leve ao PDF: os gráficos são desenhados diretamente a partir das séries
+agregadas do resumo, sem matplotlib nem reportlab, então a página fica pronta em
+poucos milissegundos.
+"""
+from __future__ import annotations
+
+import math
+from html import escape
+from typing import Any, Dict, List
+
+PRIMARY_COLOR = "#1E90FF"
+_PALETA = [
+    "#1E90FF", "#FF7F50", "#3CB371", "#FFB000", "#9370DB",
+    "#20B2AA", "#DC143C", "#8B4513", "#FF69B4", "#708090",
+]
+
+
+def _moeda(valor: float) -> str:
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _svg_pizza(saidas_by_cat: Dict[str, float], raio: int = 90) -> str:
+    """Gráfico de pizza das despesas por categoria."""
+
+    fatias = sorted(
+        ((cat, abs(valor)) for cat, valor in saidas_by_cat.items() if valor),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    total = sum(valor for _, valor in fatias)
+    if not total:
+        return "<p>Nenhuma despesa no período.</p>"
+
+    cx = cy = raio + 10
+    partes: List[str] = []
+    legenda: List[str] = []
+    angulo = -math.pi / 2
+    for indice, (categoria, valor) in enumerate(fatias):
+        cor = _PALETA[indice % len(_PALETA)]
+        fracao = valor / total
+        if fracao >= 0.9999:
+            partes.append(f'<circle cx="{cx}" cy="{cy}" r="{raio}" fill="{cor}"/>')
+        else:
+            fim = angulo + fracao * 2 * math.pi
+            x1, y1 = cx + raio * math.cos(angulo), cy + raio * math.sin(angulo)
+            x2, y2 = cx + raio * math.cos(fim), cy + raio * math.sin(fim)
+            arco_grande = 1 if fracao > 0.5 else 0
+            partes.append(
+                f'<path d="M{cx},{cy} L{x1:.2f},{y1:.2f} '
+                f'A{raio},{raio} 0 {arco_grande} 1 {x2:.2f},{y2:.2f} Z" fill="{cor}"/>'
+            )
+            angulo = fim
+        y_legenda = 20 + indice * 20
+        legenda.append(
+            f'<rect x="{2 * cx + 10}" y="{y_legenda - 10}" width="12" height="12" fill="{cor}"/>'
+            f'<text x="{2 * cx + 28}" y="{y_legenda}" font-size="12">'
+            f"{escape(categoria)} ({fracao * 100:.1f}%)</text>"
+        )
+
+    altura = max(2 * cy, 30 + len(fatias) * 20)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{2 * cx + 260}" height="{altura}" '
+        f'role="img" aria-label="Distribuição de despesas por categoria">'
+        + "".join(partes)
+        + "".join(legenda)
+        + "</svg>"
+    )
+
+
+def _svg_fluxo(dias: List[str], entradas: List[float], saidas: List[float]) -> str:
+    """Barras diárias de entradas e saídas lado a lado."""
+
+    if not dias:
+        return "<p>Sem movimentações no período.</p>"
+
+    altura_util, margem_base, margem_esq = 180, 60, 50
+    largura_dia = max(18, min(40, 720 // len(dias)))
+    largura = margem_esq + largura_dia * len(dias) + 10
+    maximo = max(max(entradas, default=0), max(saidas, default=0)) or 1.0
+    barra = (largura_dia - 4) / 2
+
+    partes = [
+        f'<line x1="{margem_esq}" y1="{altura_util + 10}" x2="{largura}" '
+        f'y2="{altura_util + 10}" stroke="#999"/>',
+        f'<text x="4" y="20" font-size="10">{escape(_moeda(maximo))}</text>',
+    ]
+    for indice, dia in enumerate(dias):
+        x = margem_esq + indice * largura_dia + 2
+        for deslocamento, valor, cor in ((0, entradas[indice], "#3CB371"), (barra, saidas[indice], "#DC143C")):
+            h = altura_util * valor / maximo
+            partes.append(
+                f'<rect x="{x + deslocamento:.1f}" y="{altura_util + 10 - h:.1f}" '
+                f'width="{barra:.1f}" height="{h:.1f}" fill="{cor}">'
+                f"<title>{escape(str(dia))}: {escape(_moeda(valor))}</title></rect>"
+            )
+        tx, ty = x + barra, altura_util + 16
+        partes.append(
+            f'<text x="{tx:.1f}" y="{ty}" font-size="9" text-anchor="end" '
+            f'transform="rotate(-45 {tx:.1f} {ty})">{escape(str(dia)[5:])}</text>'
+        )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{largura}" '
+        f'height="{altura_util + margem_base}" role="img" aria-label="Fluxo diário de caixa">'
+        + "".join(partes)
+        + "</svg>"
+    )
+
+
+def _tabela(cabecalho: List[str], linhas: List[List[str]]) -> str:
+    th = "".join(f"<th>{escape(coluna)}</th>" for coluna in cabecalho)
+    trs = "".join(
+        "<tr>" + "".join(f"<td>{escape(str(celula))}</td>" for celula in linha) + "</tr>"
+        for linha in linhas
+    )
+    return f"<table><thead><tr>{th}</tr></thead><tbody>{trs}</tbody></table>"
+
+
+def renderizar_html(resumo: Dict[str, Any], limite_itens: int = 5) -> str:
+    """Monta a página HTML completa a partir do resumo calculado em ``reports``."""
+
+    categorias = sorted(resumo["saidas_by_cat"].items(), key=lambda item: abs(item[1]), reverse=True)
+    top_saidas = [
+        [t["empresa"], t.get("categoria") or "", _moeda(abs(t["valor"])), t["data"]]
+        for t in resumo["top_saidas"][:limite_itens]
+    ]
+    outliers = [
+        [t["empresa"], t.get("categoria") or "", _moeda(abs(t["valor"])), t["data"]]
+        for t in resumo["outliers"]
+    ]
+
+    secoes = [
+        "<h2>Resumo Financeiro</h2>",
+        _tabela(
+            ["Entradas", "Saídas", "Saldo"],
+            [[_moeda(resumo["total_entradas"]), _moeda(resumo["total_saidas"]), _moeda(resumo["saldo"])]],
+        ),
+        "<h2>Distribuição de Despesas por Categoria</h2>",
+        _svg_pizza(resumo["saidas_by_cat"]),
+        _tabela(["Categoria", "Total"], [[cat, _moeda(abs(valor))] for cat, valor in categorias]),
+        "<h2>Fluxo de Caixa Diário</h2>",
+        _svg_fluxo(resumo["dias"], resumo["entradas_diarias"], resumo["saidas_diarias"]),
+        "<h2>Principais Despesas</h2>",
+        _tabela(["Empresa", "Categoria", "Valor", "Data"], top_saidas)
+        if top_saidas
+        else "<p>Nenhuma despesa no período.</p>",
+        "<h2>Transações atípicas (outliers)</h2>",
+        _tabela(["Empresa", "Categoria", "Valor", "Data"], outliers)
+        if outliers
+        else "<p>Nenhuma transação atípica identificada.</p>",
+    ]
+
+    return (
+        "<!DOCTYPE html><html lang=\"pt-BR\"><head><meta charset=\"utf-8\">"
+        "<title>Relatório Financeiro - Moneytora</title><style>"
+        "body{font-family:sans-serif;margin:2rem;color:#1C1C1C}"
+        f"h1,h2{{color:{PRIMARY_COLOR}}}h1{{text-align:center;margin-bottom:0}}"
+        ".sub{text-align:center;color:grey}"
+        "table{border-collapse:collapse;margin:.5rem 0 1rem}"
+        f"th{{background:{PRIMARY_COLOR};color:#fff}}"
+        "th,td{border:1px solid #ddd;padding:4px 10px;text-align:left}"
+        "</style></head><body>"
+        "<h1>Relatório Financeiro</h1><p class=\"sub\">Moneytora</p>"
+        f"<p>Período: {escape(resumo['periodo_label'])}</p>"
+        + "".join(secoes)
+        + "<p><b>Moneytora</b> © 2025 - Inteligência Financeira</p></body></html>"
+    )
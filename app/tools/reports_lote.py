@@ -0,0 +1,191 @@
+"""Geração em lote dos relatórios de fechamento do mês para todos os clientes.
+
+Os dados de todos os clientes são lidos numa única varredura agrupada por
+``cliente_id`` (uma por arquivo, com o banco fragmentado) e a renderização é distribuída em um pool de processos. Cada worker
+inicializa a folha de estilos e o logo uma única vez e os reaproveita em todos os
+relatórios que gerar. Ao final é gravado um ``manifest.json`` com os arquivos e os
+tempos de cada cliente.
+
+Uso via linha de comando::
+
+    python -m app.tools.reports_lote 2024-10-01 2024-10-31 --destino reports/lote
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from itertools import groupby
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from app import database
+from app.tools import reports
+from app.tools.reports_html import renderizar_html
+
+
+def _fetch_por_cliente(
+    sd: date, ed: date, db_path: str
+) -> List[Tuple[Optional[str], List[Tuple]]]:
+    """Lê o período de todos os clientes em uma única consulta ordenada por cliente."""
+
+    conn = reports._get_connection(db_path)
+    try:
+        cursor = conn.execute(
+            """
+            SELECT cliente_id, id, valor, empresa, data, categoria
+            FROM transacoes
+            WHERE data BETWEEN ? AND ?
+            ORDER BY cliente_id, data
+            """,
+            (sd.isoformat(), ed.isoformat()),
+        )
+        return [
+            (cliente_id, [linha[1:] for linha in linhas])
+            for cliente_id, linhas in groupby(cursor, key=lambda linha: linha[0])
+        ]
+    finally:
+        conn.close()
+
+
+def _nome_arquivo(cliente_id: Optional[str], sd: date, ed: date, formato: str) -> str:
+    if not cliente_id:
+        return f"relatorio_sem_cliente_{sd}_{ed}.{formato}"
+    # A limpeza pode igualar ids diferentes ("a/b" e "a_b"): o hash do id original desempata.
+    cliente = re.sub(r"[^A-Za-z0-9_.-]", "_", cliente_id)
+    sufixo = hashlib.sha256(cliente_id.encode("utf-8")).hexdigest()[:8]
+    return f"relatorio_{cliente}_{sufixo}_{sd}_{ed}.{formato}"
+
+
+def _inicializar_worker() -> None:
+    """Pré-aquece estilos e logo no início de cada processo do pool."""
+
+    reports._estilos_pdf()
+    reports._logo_bytes()
+
+
+def _renderizar_cliente(
+    cliente_id: Optional[str],
+    rows: List[Tuple],
+    sd: date,
+    ed: date,
+    formato: str,
+    destino: str,
+) -> Dict[str, Any]:
+    inicio = time.perf_counter()
+    arquivo = os.path.join(destino, _nome_arquivo(cliente_id, sd, ed, formato))
+    try:
+        resumo = reports._montar_resumo(rows, sd, ed)
+        if formato == "pdf":
+            conteudo = reports._renderizar_pdf(resumo)
+        else:
+            conteudo = renderizar_html(resumo).encode("utf-8")
+        with open(arquivo, "wb") as f:
+            f.write(conteudo)
+    except Exception as exc:  # pragma: no cover - defensivo
+        return {
+            "cliente_id": cliente_id,
+            "ok": False,
+            "erro": str(exc),
+            "transacoes": len(rows),
+            "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        }
+    return {
+        "cliente_id": cliente_id,
+        "ok": True,
+        "arquivo": arquivo,
+        "bytes": len(conteudo),
+        "transacoes": len(rows),
+        "saldo": resumo["saldo"],
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+def gerar_relatorios_em_lote(
+    start_date: str,
+    end_date: str,
+    destino: Optional[str] = None,
+    formato: Literal["pdf", "html"] = "pdf",
+    max_workers: Optional[int] = None,
+    db_path: str = reports.DEFAULT_DB_PATH,
+) -> Dict[str, Any]:
+    """Gera um relatório por cliente com movimentação no período e retorna o manifesto."""
+
+    inicio = time.perf_counter()
+    sd = reports._parse_date(start_date)
+    ed = reports._parse_date(end_date)
+    destino = destino or os.path.join(reports.REPORTS_DIR, f"lote_{sd}_{ed}")
+    os.makedirs(destino, exist_ok=True)
+
+    caminhos = [db_path]
+    if db_path == reports.DEFAULT_DB_PATH and database.roteador.fragmentado:
+        caminhos += [database.roteador.caminho_do_shard(nome) for nome in database.roteador.shards()]
+    grupos = [grupo for caminho in caminhos for grupo in _fetch_por_cliente(sd, ed, caminho)]
+    tempo_consulta_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    workers = max_workers or os.cpu_count() or 1
+
+    resultados: List[Dict[str, Any]] = []
+    if grupos:
+        # ``spawn``: os workers não herdam por ``fork`` as threads e conexões abertas
+        # do processo pai (filas, pools do SQLite, clientes HTTP).
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(grupos)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_worker,
+        ) as executor:
+            futuros = [
+                executor.submit(_renderizar_cliente, cliente_id, rows, sd, ed, formato, destino)
+                for cliente_id, rows in grupos
+            ]
+            for futuro in as_completed(futuros):
+                resultados.append(futuro.result())
+    resultados.sort(key=lambda item: item["cliente_id"] or "")
+
+    manifesto = {
+        "periodo": {"inicio": sd.isoformat(), "fim": ed.isoformat()},
+        "formato": formato,
+        "gerado_em": datetime.utcnow().isoformat(),
+        "workers": workers,
+        "clientes": len(resultados),
+        "falhas": sum(1 for item in resultados if not item["ok"]),
+        "tempo_consulta_ms": tempo_consulta_ms,
+        "tempo_total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "relatorios": resultados,
+    }
+    manifesto_path = os.path.join(destino, "manifest.json")
+    with open(manifesto_path, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    return {**manifesto, "manifesto_path": manifesto_path}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Gera os relatórios do período para todos os clientes.")
+    parser.add_argument("start_date")
+    parser.add_argument("end_date")
+    parser.add_argument("--destino")
+    parser.add_argument("--formato", choices=["pdf", "html"], default="pdf")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--db-path", default=reports.DEFAULT_DB_PATH)
+    args = parser.parse_args(argv)
+
+    manifesto = gerar_relatorios_em_lote(
+        args.start_date,
+        args.end_date,
+        destino=args.destino,
+        formato=args.formato,
+        max_workers=args.workers,
+        db_path=args.db_path,
+    )
+    print(
+        f"{manifesto['clientes']} relatórios ({manifesto['falhas']} falhas) em "
+        f"{manifesto['tempo_total_ms']:.0f} ms -> {manifesto['manifesto_path']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
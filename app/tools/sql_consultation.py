@@ -8,20 +8,20 @@ para responder perguntas sobre gastos, categorias, períodos e valores.
 from langchain.tools import tool, ToolRuntime
 
 from app.agents.sql_consultor import responder_pergunta as consultar_sql_agent
+from app.tools.contexto import cliente_do_contexto
+from app.tools.orcamento_saida import limitar_texto
 
 
 @tool
 def consultar_dados_financeiros(pergunta: str, runtime: ToolRuntime) -> str:
     """Consulta o banco de dados de transações financeiras para responder perguntas sobre gastos, categorias, períodos e valores.
     
-    Use esta ferramenta quando o usuário perguntar sobre:
-    - Valores gastos (ex: "quanto gastei em alimentação?")
-    - Maiores despesas (ex: "quais foram minhas 5 maiores compras?")
-    - Gastos por categoria (ex: "mostre meus gastos por categoria")
-    - Gastos em períodos específicos (ex: "quanto gastei em outubro?")
-    - Comparações (ex: "gastei mais este mês ou no mês passado?")
-    - Listagem de transações (ex: "liste todas as minhas compras no iFood")
-    - Totais e somas (ex: "qual foi meu gasto total este mês?")
+    Prefira as ferramentas de fatos financeiros (total_por_categoria, maiores_despesas,
+    comparar_meses, historico_empresa, contar_transacoes) e use esta apenas quando
+    nenhuma delas cobrir a pergunta, por exemplo:
+    - Médias e agrupamentos incomuns (ex: "qual meu gasto médio por semana?")
+    - Filtros combinados (ex: "compras acima de R$ 100 aos finais de semana")
+    - Comparações entre períodos arbitrários (ex: "primeiro trimestre contra o segundo")
     
     A ferramenta aceita linguagem natural e entende referências temporais como:
     - "este mês", "mês passado", "últimos 30 dias"
@@ -43,8 +43,9 @@ def consultar_dados_financeiros(pergunta: str, runtime: ToolRuntime) -> str:
         "Suas 3 maiores despesas foram: 1. Aluguel - R$ 1.200,00..."
     """
     try:
-        # Chama o agente SQL existente
-        resultado = consultar_sql_agent(pergunta)
+        # Chama o agente SQL existente, restrito às transações do cliente
+        cliente_id = cliente_do_contexto(runtime)
+        resultado = consultar_sql_agent(pergunta, cliente_id=cliente_id)
         
         if not resultado or resultado.strip() == "":
             return (
@@ -53,7 +54,7 @@ def consultar_dados_financeiros(pergunta: str, runtime: ToolRuntime) -> str:
                 "ou a categoria que deseja consultar."
             )
         
-        return resultado
+        return limitar_texto(resultado, cliente_id=cliente_id)
         
     except Exception as e:
         return f"Não consegui consultar os dados no momento. Erro: {str(e)}"
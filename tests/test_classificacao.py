@@ -0,0 +1,74 @@
+"""Testes da classificação com sugestão de categoria vinda do extrator."""
+from datetime import date
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database
+from app.agents.extrator import DadosTransacaoCategorizada
+from app.graph.orchestrator import executar_ingestao
+from app.tools.classificacao_tool import classificar_empresa, classificar_empresas_em_lote
+
+
+@pytest.fixture(autouse=True)
+def banco_limpo():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def test_classificar_empresa_prioriza_mapeamento_e_aprende_sugestao():
+    assert classificar_empresa("Uber Trip", "Lazer") == "Transporte"
+    assert classificar_empresa("Drogaria São Paulo", "Saúde") == "Saúde"
+    assert classificar_empresa("Drogaria São Paulo") == "Saúde"
+    assert classificar_empresa("Loja Misteriosa", "Inventada") == "Outros"
+    # Um "Outros" registrado não impede uma sugestão melhor depois.
+    assert classificar_empresa("Loja Misteriosa", "Compras") == "Compras"
+
+
+def test_sugestao_de_um_cliente_nao_muda_a_classificacao_global():
+    assert classificar_empresa("Loja Misteriosa") == "Outros"
+    assert classificar_empresa("Loja Misteriosa", "Compras", cliente_id="ana") == "Compras"
+    assert classificar_empresa("Loja Misteriosa", cliente_id="ana") == "Compras"
+    assert classificar_empresa("Loja Misteriosa", cliente_id="bruno") == "Outros"
+
+    # O lote segue a mesma precedência: sugestão válida vence um "Outros" registrado.
+    categorias = classificar_empresas_em_lote(
+        ["Loja Misteriosa", "Uber Trip", "Farmácia Nova"],
+        {"Loja Misteriosa": "Lazer", "Uber Trip": "Lazer", "Farmácia Nova": "Saúde"},
+        cliente_id="bruno",
+    )
+    assert categorias == {"Loja Misteriosa": "Lazer", "Uber Trip": "Transporte", "Farmácia Nova": "Saúde"}
+    with database.session_scope() as session:
+        globais = dict(session.query(database.EmpresaClassificacao.nome_empresa, database.EmpresaClassificacao.categoria))
+    assert globais["loja misteriosa"] == "Outros"
+    assert globais["farmácia nova"] == "Saúde"
+
+
+def test_grafo_categorizado_usa_sugestao_sem_chamada_extra(monkeypatch):
+    chamadas = []
+
+    def _fake_extrair(texto):
+        chamadas.append(texto)
+        return DadosTransacaoCategorizada(
+            valor=-89.9,
+            empresa="Smart Fit",
+            data=date(2024, 8, 1),
+            categoria_sugerida="Saúde",
+        )
+
+    monkeypatch.setattr("app.graph.orchestrator.extrair_dados_categorizados", _fake_extrair)
+
+    estado = executar_ingestao("Smart Fit R$ 89,90 01/08", grafo="categorizado")
+
+    assert len(chamadas) == 1
+    assert estado["categoria"] == "Saúde"
+    with database.session_scope() as session:
+        assert session.get(database.Transacao, estado["transacao_id"]).categoria == "Saúde"
+        mapeamento = session.query(database.EmpresaClassificacao).filter_by(nome_empresa="smart fit").one()
+        assert mapeamento.categoria == "Saúde"
@@ -0,0 +1,105 @@
+"""Testes dos esboços de quantis e da detecção de anomalias na ingestão."""
+from datetime import date
+from pathlib import Path
+import random
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database, estatisticas, repository, schemas
+from app.estatisticas import EstimadorP2
+from app.graph.orchestrator import node_detectar_anomalia
+
+
+@pytest.fixture
+def banco_limpo():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def test_estimador_p2_aproxima_quartis():
+    gerador = random.Random(42)
+    q1, q3 = EstimadorP2(0.25), EstimadorP2(0.75)
+    for _ in range(5000):
+        valor = gerador.uniform(0, 100)
+        q1.adicionar(valor)
+        q3.adicionar(valor)
+
+    assert q1.valor() == pytest.approx(25, abs=2)
+    assert q3.valor() == pytest.approx(75, abs=2)
+
+    restaurado = EstimadorP2(0.75, q3.para_dict())
+    assert restaurado.valor() == pytest.approx(q3.valor())
+
+
+def test_node_detectar_anomalia_usa_esboco_da_categoria(banco_limpo):
+    with database.session_scope() as session:
+        for dia, valor in enumerate([30, 35, 40, 32, 38, 45, 33, 36, 41, 39], start=1):
+            repository.criar_transacao(
+                session,
+                schemas.TransacaoCreate(
+                    valor=-valor, empresa="iFood", data=date(2024, 8, dia), categoria="Alimentação"
+                ),
+            )
+
+    comum = node_detectar_anomalia({"categoria": "Alimentação", "valor": -42.0})
+    atipica = node_detectar_anomalia({"categoria": "Alimentação", "valor": -400.0})
+    sem_historico = node_detectar_anomalia({"categoria": "Viagem", "valor": -4000.0})
+
+    assert comum["anomalia"] is False
+    assert atipica["anomalia"] is True
+    assert sem_historico["anomalia"] is False
+
+
+def test_esbocos_separados_por_cliente(banco_limpo):
+    with database.session_scope() as session:
+        for dia in range(1, 11):
+            for cliente_id, valor in (("ana", -30.0 - dia), ("bruno", -900.0 - 10 * dia)):
+                repository.criar_transacao(
+                    session,
+                    schemas.TransacaoCreate(
+                        valor=valor,
+                        empresa="Mercado",
+                        data=date(2024, 8, dia),
+                        categoria="Mercado",
+                        cliente_id=cliente_id,
+                    ),
+                )
+
+    # R$ 950 é comum para o "bruno", mas atípico para a "ana".
+    assert node_detectar_anomalia({"categoria": "Mercado", "valor": -950.0, "cliente_id": "bruno"})["anomalia"] is False
+    assert node_detectar_anomalia({"categoria": "Mercado", "valor": -950.0, "cliente_id": "ana"})["anomalia"] is True
+    assert node_detectar_anomalia({"categoria": "Mercado", "valor": -950.0})["anomalia"] is False  # sem histórico
+
+
+def test_escrita_concorrente_no_esboco_nao_perde_observacoes(banco_limpo, monkeypatch):
+    with database.session_scope() as session:
+        estatisticas.registrar_valores(session, [("ana", "Mercado", -10.0), ("ana", "Mercado", -20.0)])
+        session.commit()
+
+    carregar = estatisticas._carregar
+    leituras = []
+
+    def carregar_e_concorrer(db, chave):
+        lido = carregar(db, chave)
+        leituras.append(lido[0])
+        if len(leituras) == 1:
+            # Outra ingestão grava o esboço entre a leitura e a escrita desta.
+            lidas, q1, q3 = carregar(db, chave)
+            q1.adicionar(30.0)
+            q3.adicionar(30.0)
+            assert estatisticas._gravar(db, chave, lidas, 1, q1, q3)
+        return lido
+
+    monkeypatch.setattr(estatisticas, "_carregar", carregar_e_concorrer)
+    with database.session_scope() as session:
+        estatisticas.registrar_valor(session, "Mercado", -40.0, "ana")
+        registro = session.get(database.EstatisticaCategoria, ("ana", "Mercado"))
+        assert leituras == [2, 3]
+        assert registro.observacoes == 4
+        assert registro.q1 == pytest.approx(17.5)
@@ -0,0 +1,26 @@
+"""Testes dos prompts do agente extrator."""
+from datetime import date
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.agents import extrator
+
+
+class _DataFixa(date):
+    @classmethod
+    def today(cls):
+        return cls(2031, 1, 15)
+
+
+def test_prompt_enxuto_usa_ano_da_chamada(monkeypatch):
+    monkeypatch.setattr(extrator, "date", _DataFixa)
+
+    mensagens = extrator.prompt.format_messages(**extrator._entradas("Uber R$ 20,00 em 03/01"))
+    sistema = mensagens[0].content
+
+    assert "2031" in sistema
+    # O esquema vai pelo modo de saída estruturada, não pelo texto do prompt.
+    assert "properties" not in sistema and "{" not in sistema
+    assert mensagens[1].content == "Uber R$ 20,00 em 03/01"
@@ -0,0 +1,86 @@
+"""Testes das ferramentas de fatos financeiros do coach."""
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database
+from app.tools import fatos_financeiros as fatos
+
+
+@pytest.fixture
+def transacoes():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    with database.session_scope() as session:
+        session.add_all(
+            database.Transacao(valor=valor, empresa=empresa, data=data, categoria=categoria)
+            for valor, empresa, data, categoria in [
+                (-50.0, "iFood *Restaurante", date(2024, 9, 10), "Alimentação"),
+                (-120.0, "Posto Shell", date(2024, 9, 20), "Combustível"),
+                (-30.0, "IFOOD *Lanche", date(2024, 10, 2), "Alimentação"),
+                (-200.0, "Posto Shell", date(2024, 10, 5), "Combustível"),
+                (-15.5, "Uber", date(2024, 10, 6), "Transporte"),
+                (3000.0, "Salário", date(2024, 10, 5), "Salário"),
+            ]
+        )
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def test_totais_e_maiores_despesas_do_periodo(transacoes):
+    outubro = {"data_inicio": "2024-10-01", "data_fim": "31/10/2024"}
+
+    totais = fatos.total_por_categoria.invoke(outubro)
+    assert [c["categoria"] for c in totais["categorias"]] == ["Combustível", "Alimentação", "Transporte"]
+    assert totais["total_gasto"] == 245.5
+
+    alimentacao = fatos.total_por_categoria.invoke({**outubro, "categoria": "alimentação"})
+    assert alimentacao["categorias"] == [{"categoria": "Alimentação", "total_gasto": 30.0, "quantidade": 1}]
+
+    maiores = fatos.maiores_despesas.invoke({**outubro, "n": 2})
+    assert [(d["empresa"], d["valor"]) for d in maiores["despesas"]] == [("Posto Shell", 200.0), ("IFOOD *Lanche", 30.0)]
+
+
+def test_comparacao_historico_e_contagem(transacoes):
+    comparacao = fatos.comparar_meses.invoke({"mes": "2024-10"})
+    assert comparacao["mes_anterior"]["total_gasto"] == 170.0
+    assert comparacao["mes_atual"]["total_entradas"] == 3000.0
+    assert comparacao["diferenca_gasto"] == 75.5
+    assert comparacao["variacao_percentual"] == 44.4
+
+    historico = fatos.historico_empresa.invoke({"empresa": "ifood"})
+    assert historico["quantidade"] == 2 and historico["total"] == -80.0
+    assert historico["ultima_data"] == "2024-10-02"
+    assert historico["recentes"][0]["empresa"] == "IFOOD *Lanche"
+
+    contagem = fatos.contar_transacoes.invoke({"data_inicio": "2024-10-01", "data_fim": "2024-10-31"})
+    assert (contagem["quantidade"], contagem["gastos"], contagem["entradas"]) == (4, 3, 1)
+
+
+def test_ferramentas_usam_apenas_dados_do_cliente_do_contexto(transacoes):
+    with database.session_scope() as session:
+        session.add(
+            database.Transacao(
+                valor=-99.0,
+                empresa="iFood *Jantar",
+                data=date(2024, 10, 3),
+                categoria="Alimentação",
+                cliente_id="ana",
+            )
+        )
+    runtime = SimpleNamespace(context={"cliente_id": "ana"})
+
+    totais = fatos.total_por_categoria.func(data_inicio="2024-10-01", data_fim="2024-10-31", runtime=runtime)
+    assert totais["categorias"] == [{"categoria": "Alimentação", "total_gasto": 99.0, "quantidade": 1}]
+    assert fatos.historico_empresa.func(empresa="ifood", runtime=runtime)["quantidade"] == 1
+    assert fatos.comparar_meses.func(mes="2024-10", runtime=runtime)["mes_anterior"]["quantidade"] == 0
+
+    # Sem cliente no contexto, a transação da "ana" não entra nos totais.
+    sem_cliente = fatos.historico_empresa.func(empresa="ifood")
+    assert sem_cliente["quantidade"] == 2 and -99.0 not in [item["valor"] for item in sem_cliente["recentes"]]
@@ -0,0 +1,215 @@
+"""Testes da importação direta de extratos OFX, CSV e PDF."""
+from datetime import date
+from pathlib import Path
+import io
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database
+from app.importacao import importar_extrato, iterar_csv, iterar_ofx, iterar_pdf
+
+OFX_SGML = b"""OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+ENCODING:USASCII
+CHARSET:1252
+
+<OFX>
+<BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<BANKACCTFROM><BANKID>0341<ACCTID>12345-6</BANKACCTFROM>
+<BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240815120000[-3:BRT]
+<TRNAMT>-55,90
+<FITID>0001
+<MEMO>IFOOD *RESTAURANTE
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20240816
+<TRNAMT>1500.00
+<FITID>0002
+<NAME>Sal\xe1rio
+</STMTTRN>
+</BANKTRANLIST>
+</STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+OFX_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<BANKACCTFROM><ACCTID>999</ACCTID></BANKACCTFROM>
+<BANKTRANLIST>
+<STMTTRN><DTPOSTED>20240901</DTPOSTED><TRNAMT>-32.50</TRNAMT><FITID>A1</FITID><NAME>Uber Trip</NAME></STMTTRN>
+</BANKTRANLIST>
+</STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+""".encode("utf-8")
+
+CSV = "Data;Descrição;Valor\n15/08/2024;Netflix;-39,90\n15/08/2024;Netflix;-39,90\n20/08/2024;Posto Shell;-1.200,00\n"
+
+
+@pytest.fixture
+def banco_limpo():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def test_iterar_ofx_sgml_e_xml():
+    sgml = list(iterar_ofx(OFX_SGML))
+    assert sgml == [
+        {"fitid": "12345-6:0001", "valor": -55.9, "data": date(2024, 8, 15), "empresa": "IFOOD *RESTAURANTE"},
+        {"fitid": "12345-6:0002", "valor": 1500.0, "data": date(2024, 8, 16), "empresa": "Salário"},
+    ]
+
+    xml = list(iterar_ofx(OFX_XML))
+    assert xml == [{"fitid": "999:A1", "valor": -32.5, "data": date(2024, 9, 1), "empresa": "Uber Trip"}]
+
+
+def test_iterar_csv_gera_identificadores_distintos_para_linhas_repetidas():
+    registros = list(iterar_csv(CSV.encode("utf-8")))
+
+    assert [r["valor"] for r in registros] == [-39.9, -39.9, -1200.0]
+    assert registros[0]["fitid"] != registros[1]["fitid"]
+    assert registros[0]["fitid"] == list(iterar_csv(CSV))[0]["fitid"]
+
+
+def test_importar_extrato_em_lote_ignora_reimportacao(banco_limpo):
+    primeira = importar_extrato(OFX_SGML, "ofx", tamanho_lote=1)
+    segunda = importar_extrato(OFX_SGML, "ofx")
+    csv = importar_extrato(CSV, "csv")
+
+    assert primeira == {"lidas": 2, "inseridas": 2, "duplicadas": 0}
+    assert segunda == {"lidas": 2, "inseridas": 0, "duplicadas": 2}
+    assert csv["inseridas"] == 3
+
+    with database.session_scope() as session:
+        categorias = dict(
+            session.query(database.Transacao.empresa, database.Transacao.categoria).all()
+        )
+    assert categorias["IFOOD *RESTAURANTE"] == "Alimentação"
+    assert categorias["Posto Shell"] == "Combustível"
+
+
+def _pdf_extrato(paginas):
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    documento = canvas.Canvas(buffer)
+    for linhas in paginas:
+        y = 800
+        for linha in linhas:
+            documento.drawString(40, y, linha)
+            y -= 20
+        documento.showPage()
+    documento.save()
+    return buffer.getvalue()
+
+
+def test_iterar_pdf_extrai_paginas_em_paralelo_com_cache(tmp_path, monkeypatch):
+    from app import importacao
+    from app.cache import CacheSQLite
+
+    cache = CacheSQLite("pdf_paginas", caminho=str(tmp_path / "cache.db"))
+    monkeypatch.setattr(importacao, "_cache_paginas", cache)
+    pdf = _pdf_extrato(
+        [
+            ["Extrato de 01/08/2024 a 31/08/2024", "Data Histórico Valor Saldo", "SALDO ANTERIOR 1.000,00"],
+            ["05/08 IFOOD *RESTAURANTE -55,90 944,10", "06/08 PIX RECEBIDO 200,00 C"],
+            ["10/08/2024 POSTO SHELL 1.200,00 D", "Total do período -1.055,90"],
+        ]
+    )
+
+    paralelo = list(iterar_pdf(pdf, max_workers=2))
+    assert [(r["data"], r["empresa"], r["valor"]) for r in paralelo] == [
+        (date(2024, 8, 5), "IFOOD *RESTAURANTE", -55.9),
+        (date(2024, 8, 6), "PIX RECEBIDO", 200.0),
+        (date(2024, 8, 10), "POSTO SHELL", -1200.0),
+    ]
+
+    sequencial = list(iterar_pdf(io.BytesIO(pdf), max_workers=1))
+    assert sequencial == paralelo
+    assert cache.hits == 3 and cache.misses == 0
+
+
+def test_extracoes_sequenciais_simultaneas_nao_misturam_paginas(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app import importacao
+    from app.cache import CacheSQLite
+
+    monkeypatch.setattr(importacao, "_cache_paginas", CacheSQLite("pdf_paginas", caminho=str(tmp_path / "cache.db")))
+    pdfs = [_pdf_extrato([[f"Extrato {n} pagina {p}"] for p in range(5)]) for n in range(4)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        textos = list(executor.map(lambda pdf: list(importacao.textos_pdf(pdf, max_workers=1)), pdfs))
+
+    for n, paginas in enumerate(textos):
+        assert [t.strip() for t in paginas] == [f"Extrato {n} pagina {p}" for p in range(5)]
+
+
+def test_mesmo_extrato_importado_por_dois_clientes(banco_limpo):
+    linha = "Data;Descrição;Valor\n01/08/2024;Uber;-50,00\n"
+
+    assert importar_extrato(linha, "csv", cliente_id="ana")["inseridas"] == 1
+    assert importar_extrato(linha, "csv", cliente_id="bruno") == {"lidas": 1, "inseridas": 1, "duplicadas": 0}
+    assert importar_extrato(linha, "csv", cliente_id="bruno")["duplicadas"] == 1
+
+    with database.session_scope() as session:
+        clientes = sorted(c for (c,) in session.query(database.Transacao.cliente_id))
+    assert clientes == ["ana", "bruno"]
+
+
+def test_linhas_ignoradas_pelo_banco_nao_entram_nos_resumos(banco_limpo):
+    from app import repository, schemas
+
+    def _transacao(cliente_id, fitid):
+        return schemas.TransacaoCreate(
+            valor=-50.0, empresa="Uber", data=date(2024, 8, 1), categoria="Transporte", cliente_id=cliente_id, fitid=fitid
+        )
+
+    with database.session_scope() as session:
+        assert repository.criar_transacoes_em_lote(session, [_transacao(None, "0001")]) == 1
+        # "" e ``None`` colidem no índice único, mas não na verificação prévia:
+        # a linha só é descartada pelo ``OR IGNORE``, como numa importação concorrente.
+        assert repository.criar_transacoes_em_lote(session, [_transacao("", "0001"), _transacao("", None)]) == 1
+
+        resumo = session.get(database.ResumoMensal, ("", "2024-08"))
+        estatistica = session.get(database.EstatisticaCategoria, ("", "Transporte"))
+        assert session.query(database.Transacao).count() == 2
+        assert (resumo.quantidade, estatistica.observacoes) == (2, 2)
+
+
+@pytest.mark.parametrize(
+    "bruto, esperado",
+    [
+        ("1.234,56", 1234.56),
+        ("1,234.56", 1234.56),
+        ("R$ -1.234", -1234.0),
+        ("1,234,567", 1234567.0),
+        ("-55,90", -55.9),
+        ("-55.90", -55.9),
+        ("0.123", 0.123),
+        ("200", 200.0),
+    ],
+)
+def test_parse_valor_infere_o_separador_decimal(bruto, esperado):
+    from app.importacao import _parse_valor
+
+    assert _parse_valor(bruto) == pytest.approx(esperado)
+
+
+def test_linhas_invalidas_do_csv_informam_a_linha():
+    curta = "Data;Descrição;Valor\n01/08/2024;Uber;-50,00\n02/08/2024;Mercado\n"
+    with pytest.raises(ValueError, match="Linha 3 do CSV: 2 colunas"):
+        list(iterar_csv(curta))
+
+    valor_invalido = "Data;Descrição;Valor\n01/08/2024;Uber;abc\n"
+    with pytest.raises(ValueError, match="Linha 2 do CSV: Valor inválido: 'abc'"):
+        list(iterar_csv(valor_invalido))
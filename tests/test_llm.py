@@ -0,0 +1,204 @@
+"""Testes do registro de LLMs e do controle de vazão por modelo."""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sys
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import llm
+
+
+def test_controle_limita_concorrencia_e_respeita_prazo():
+    controle = llm.ControleModelo("teste", rpm=6000, rajada=100, concorrencia=2)
+    simultaneas = {"atual": 0, "maximo": 0}
+    lock = threading.Lock()
+
+    def _chamada(_):
+        with controle.reservar(prazo=5):
+            with lock:
+                simultaneas["atual"] += 1
+                simultaneas["maximo"] = max(simultaneas["maximo"], simultaneas["atual"])
+            time.sleep(0.05)
+            with lock:
+                simultaneas["atual"] -= 1
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(_chamada, range(6)))
+    assert simultaneas["maximo"] == 2
+    assert controle.metricas()["concluidas"] == 6
+
+    controle.entrar(prazo=1)
+    controle.entrar(prazo=1)
+    with pytest.raises(llm.PrazoFilaExcedidoError):
+        controle.entrar(prazo=0.05)
+    assert controle.metricas()["rejeitadas"] == 1
+
+
+def test_balde_de_tokens_espaca_rajadas():
+    balde = llm.BaldeTokens(taxa=20, capacidade=2)
+    inicio = time.monotonic()
+    for _ in range(4):
+        assert balde.adquirir(inicio + 5)
+    # Dois tokens da rajada e mais dois a 20/s: cerca de 100 ms.
+    assert time.monotonic() - inicio >= 0.09
+    assert not balde.adquirir(time.monotonic() + 0.001)
+
+
+def test_obter_llm_compartilha_clientes_e_passa_pelo_controle(monkeypatch):
+    monkeypatch.setattr(llm, "GOOGLE_API_KEY", "chave-teste")
+    monkeypatch.setattr(
+        ChatGoogleGenerativeAI,
+        "_generate",
+        lambda self, messages, stop=None, run_manager=None, **kwargs: ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content="ok"))]
+        ),
+    )
+
+    cliente = llm.obter_llm("modelo-teste", temperature=0.1)
+    assert llm.obter_llm("modelo-teste", temperature=0.1) is cliente
+    assert llm.obter_llm("modelo-teste", temperature=0.5) is not cliente
+
+    assert cliente.invoke("oi").content == "ok"
+    assert llm.metricas()["modelo-teste"]["concluidas"] == 1
+
+
+def test_executar_roteado_escala_em_falha_ou_baixa_confianca(monkeypatch):
+    monkeypatch.setitem(llm._ROTAS, "teste_rota", ["pequeno", "grande"])
+    chamadas = []
+
+    def _chamar(modelo):
+        chamadas.append(modelo)
+        if modelo == "pequeno" and len(chamadas) == 1:
+            raise ValueError("saída fora do esquema")
+        return "talvez" if modelo == "pequeno" else "seguro"
+
+    aceitar = lambda resposta: resposta == "seguro"
+    assert llm.executar_roteado("teste_rota", _chamar, aceitar) == "seguro"
+    assert llm.executar_roteado("teste_rota", _chamar, aceitar) == "seguro"
+    assert chamadas == ["pequeno", "grande", "pequeno", "grande"]
+
+    resumo = llm.metricas_roteamento()["teste_rota"]
+    assert resumo["chamadas"] == 2 and resumo["escalonamentos"] == 2
+    assert resumo["modelos"]["pequeno"]["escaladas"] == 2
+    assert resumo["modelos"]["grande"]["aceitas"] == 2
+    assert resumo["modelos"]["grande"]["latencia_p95_ms"] is not None
+
+    # No último modelo, a resposta é devolvida mesmo sem confiança e erros propagam.
+    monkeypatch.setitem(llm._ROTAS, "teste_rota", ["grande"])
+    assert llm.executar_roteado("teste_rota", lambda _: "talvez", aceitar) == "talvez"
+    with pytest.raises(ValueError):
+        llm.executar_roteado("teste_rota", lambda _: int("x"), aceitar)
+
+
+def test_executar_roteado_nao_escala_em_prazo_circuito_ou_configuracao(monkeypatch):
+    monkeypatch.setitem(llm._ROTAS, "teste_prazo", ["pequeno", "grande"])
+    chamadas = []
+
+    for erro in (llm.PrazoChamadaExcedidoError("prazo"), llm.CircuitoAbertoError("aberto")):
+
+        def _falha_no_pequeno(modelo, erro=erro):
+            chamadas.append(modelo)
+            if modelo == "pequeno":
+                raise erro
+            return "seguro"
+
+        with pytest.raises(type(erro)):
+            llm.executar_roteado("teste_prazo", _falha_no_pequeno)
+    assert chamadas == ["pequeno", "pequeno"]
+    assert llm.metricas_roteamento()["teste_prazo"]["escalonamentos"] == 0
+
+    def _sem_chave(modelo):
+        raise llm.ConfiguracaoAusenteError("GOOGLE_API_KEY não configurada.")
+
+    with pytest.raises(llm.ConfiguracaoAusenteError):
+        llm.executar_roteado("teste_prazo", _sem_chave)
+
+
+def test_executar_resiliente_retenta_com_jitter_e_abre_o_circuito(monkeypatch):
+    monkeypatch.setattr(llm, "_BACKOFF_BASE", 0.001)
+    controle = llm.ControleModelo("resiliencia", rpm=6000, rajada=100, concorrencia=4, limite_falhas=3, resfriamento=0.1)
+    falhas = {"restantes": 1}
+
+    def _instavel():
+        if falhas["restantes"]:
+            falhas["restantes"] -= 1
+            raise ConnectionError("conexão recusada")
+        return "ok"
+
+    assert llm.executar_resiliente(controle, _instavel, prazo=5, tentativas=2) == "ok"
+    assert controle.metricas()["retentativas"] == 1
+
+    # Erros de requisição não são repetidos nem contam contra o provedor.
+    with pytest.raises(ValueError):
+        llm.executar_resiliente(controle, lambda: int("x"), prazo=5, tentativas=2)
+    assert controle.disjuntor.falhas_seguidas == 0
+
+    def _fora_do_ar():
+        raise ConnectionError("indisponível")
+
+    with pytest.raises(ConnectionError):
+        llm.executar_resiliente(controle, _fora_do_ar, prazo=5, tentativas=5)
+    assert controle.metricas()["circuito"] == "aberto"
+    with pytest.raises(llm.CircuitoAbertoError):
+        llm.executar_resiliente(controle, lambda: "ok", prazo=5)
+
+    time.sleep(0.15)
+    assert llm.executar_resiliente(controle, lambda: "ok", prazo=5) == "ok"
+    assert controle.metricas()["circuito"] == "fechado"
+
+
+def test_executar_resiliente_respeita_prazo_e_dispara_hedge():
+    controle = llm.ControleModelo("hedge", rpm=6000, rajada=100, concorrencia=4)
+    for _ in range(30):
+        controle.registrar_latencia(0.02)
+    chamadas = []
+
+    def _primeira_lenta():
+        chamadas.append(time.monotonic())
+        time.sleep(1.0 if len(chamadas) == 1 else 0.02)
+        return len(chamadas)
+
+    inicio = time.monotonic()
+    assert llm.executar_resiliente(controle, _primeira_lenta, prazo=5, hedge=True) == 2
+    assert time.monotonic() - inicio < 0.5
+    assert controle.metricas()["hedges_vencedores"] == 1
+
+    inicio = time.monotonic()
+    with pytest.raises(llm.PrazoChamadaExcedidoError):
+        llm.executar_resiliente(controle, lambda: time.sleep(1), prazo=0.1, tentativas=3)
+    assert time.monotonic() - inicio < 0.5
+
+
+def test_cache_de_respostas_por_agente_reaproveita_prompts_equivalentes(monkeypatch, tmp_path):
+    from app import cache_llm
+
+    monkeypatch.setattr(llm, "GOOGLE_API_KEY", "chave-teste")
+    cache = cache_llm.CacheLLM("teste", "modelo-cache", caminho=str(tmp_path / "cache.db"))
+    monkeypatch.setitem(cache_llm._caches, ("teste", "modelo-cache"), cache)
+    chamadas = []
+
+    def _fake_generate(self, messages, stop=None, run_manager=None, **kwargs):
+        chamadas.append(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="seguro"))])
+
+    monkeypatch.setattr(ChatGoogleGenerativeAI, "_generate", _fake_generate)
+
+    cliente = llm.obter_llm("modelo-cache", agente="teste")
+    assert cliente.invoke("Quanto gastei  em\nmercado?").content == "seguro"
+    assert cliente.invoke("Quanto gastei em mercado?").content == "seguro"
+    assert len(chamadas) == 1
+
+    # Outros parâmetros de chamada geram outra chave.
+    llm.obter_llm("modelo-cache", agente="teste", temperature=0.9).invoke("Quanto gastei em mercado?")
+    assert len(chamadas) == 2
+
+    estatisticas = cache_llm.metricas_cache()["teste:modelo-cache"]
+    assert estatisticas["hits"] == 1 and estatisticas["misses"] == 2
+    assert estatisticas["ttl"] == cache_llm.TTL_PADRAO
@@ -34,7 +34,7 @@ def test_read_root():
 def test_processar_transacao_sucesso(monkeypatch):
     texto_transacao = "Compra de R$ 55,90 no iFood em 15/08/2024"
 
-    def _fake_invoke(_inputs):
+    def _fake_invoke(_inputs, _config=None, **_opcoes):
         return {"transacao_id": 42}
 
     monkeypatch.setattr("app.main.app_graph.invoke", _fake_invoke)
@@ -49,6 +49,187 @@ def test_processar_transacao_sucesso(monkeypatch):
     assert data["transacao_id"] == 42
 
 
+def test_processar_transacao_idempotente(monkeypatch):
+    chamadas = []
+
+    def _fake_invoke(_inputs, _config=None, **_opcoes):
+        chamadas.append(_inputs)
+        return {"transacao_id": len(chamadas)}
+
+    monkeypatch.setattr("app.main.app_graph.invoke", _fake_invoke)
+    cabecalho = {"Idempotency-Key": "notificacao-123"}
+    corpo = {"texto": "Compra de R$ 55,90 no iFood em 15/08/2024"}
+
+    primeira = client.post("/api/transacoes/processar", json=corpo, headers=cabecalho)
+    repeticao = client.post("/api/transacoes/processar", json=corpo, headers=cabecalho)
+
+    assert primeira.status_code == repeticao.status_code == 200
+    assert repeticao.json() == primeira.json()
+    assert len(chamadas) == 1
+
+    conflito = client.post(
+        "/api/transacoes/processar", json={"texto": "outro texto"}, headers=cabecalho
+    )
+    assert conflito.status_code == 422
+
+
+def test_processar_transacao_duplicatas_concorrentes_aguardam(monkeypatch):
+    import threading
+    import time
+
+    chamadas = []
+
+    def _fake_invoke(_inputs, _config=None, **_opcoes):
+        chamadas.append(_inputs)
+        time.sleep(0.3)
+        return {"transacao_id": 7}
+
+    monkeypatch.setattr("app.main.app_graph.invoke", _fake_invoke)
+    respostas = []
+
+    def _enviar():
+        respostas.append(
+            client.post(
+                "/api/transacoes/processar",
+                json={"texto": "Uber R$ 20,00"},
+                headers={"Idempotency-Key": "concorrente"},
+            )
+        )
+
+    threads = [threading.Thread(target=_enviar) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(chamadas) == 1
+    assert [r.json()["transacao_id"] for r in respostas] == [7, 7, 7, 7]
+
+
+def test_idempotencia_por_cliente_e_reserva_abandonada(monkeypatch):
+    import datetime
+
+    from app import idempotencia
+
+    chamadas = []
+
+    def _fake_invoke(_inputs, _config=None, **_opcoes):
+        chamadas.append(_inputs)
+        return {"transacao_id": len(chamadas)}
+
+    monkeypatch.setattr("app.main.app_graph.invoke", _fake_invoke)
+    cabecalho = {"Idempotency-Key": "mesma-chave"}
+    for cliente_id in ("ana", "bruno"):
+        resposta = client.post(
+            "/api/transacoes/processar", json={"texto": "Uber R$ 20,00", "cliente_id": cliente_id}, headers=cabecalho
+        )
+        assert resposta.status_code == 200
+    assert len(chamadas) == 2
+
+    # Reserva de um processo que morreu no meio da execução: o arrendamento venceu.
+    antes = datetime.datetime.utcnow() - idempotencia.ARRENDAMENTO * 2
+    with database.session_scope() as session:
+        session.add(
+            database.ChaveIdempotencia(
+                chave="abandonada",
+                hash_requisicao=idempotencia.calcular_hash({"texto": "Uber R$ 20,00", "multiplas": False}),
+                status="em_andamento",
+                criado_em=antes,
+                reservado_em=antes,
+                expira_em=antes + idempotencia.TTL,
+            )
+        )
+    resposta = client.post(
+        "/api/transacoes/processar", json={"texto": "Uber R$ 20,00"}, headers={"Idempotency-Key": "abandonada"}
+    )
+    assert resposta.status_code == 200 and len(chamadas) == 3
+
+
+def test_execucao_longa_renova_a_reserva(monkeypatch):
+    import datetime
+    import threading
+    import time
+
+    from app import idempotencia
+
+    monkeypatch.setattr(idempotencia, "ARRENDAMENTO", datetime.timedelta(seconds=0.3))
+    chamadas = []
+
+    def _fake_invoke(_inputs, _config=None, **_opcoes):
+        chamadas.append(_inputs)
+        time.sleep(1.2)  # bem além do arrendamento
+        return {"transacao_id": len(chamadas)}
+
+    monkeypatch.setattr("app.main.app_graph.invoke", _fake_invoke)
+    respostas = []
+
+    def _enviar():
+        respostas.append(
+            client.post(
+                "/api/transacoes/processar", json={"texto": "Uber R$ 20,00"}, headers={"Idempotency-Key": "longa"}
+            )
+        )
+
+    original = threading.Thread(target=_enviar)
+    original.start()
+    time.sleep(0.5)
+    _enviar()
+    original.join()
+
+    assert len(chamadas) == 1
+    assert [r.json()["transacao_id"] for r in respostas] == [1, 1]
+
+
+def test_relatorio_assincrono_sem_transacoes():
+    response = client.post(
+        "/api/relatorios",
+        json={"start_date": "2024-08-01", "end_date": "2024-08-31"},
+    )
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    from app.jobs import fila_relatorios
+
+    assert fila_relatorios.obter(job_id).aguardar(timeout=30)
+    response = client.get(f"/api/relatorios/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "concluido"
+    assert response.json()["pdf_url"] is None
+
+    response = client.get(f"/api/relatorios/{job_id}/pdf")
+    assert response.status_code == 404
+
+    assert client.get("/api/relatorios/inexistente").status_code == 404
+
+
+def test_relatorio_so_pode_ser_consultado_pelo_cliente_dono():
+    response = client.post(
+        "/api/relatorios",
+        json={"start_date": "2024-08-01", "end_date": "2024-08-31", "cliente_id": "ana"},
+    )
+    job_id = response.json()["id"]
+
+    from app.jobs import fila_relatorios
+
+    assert fila_relatorios.obter(job_id).aguardar(timeout=30)
+    assert client.get(f"/api/relatorios/{job_id}?cliente_id=ana").status_code == 200
+    for sufixo in ("", "?cliente_id=bruno", "/pdf", "/pdf?cliente_id=bruno"):
+        assert client.get(f"/api/relatorios/{job_id}{sufixo}").status_code == 404
+
+
+def test_resultados_de_jobs_concluidos_expiram():
+    import datetime
+
+    from app.jobs import FilaJobs
+
+    fila = FilaJobs("teste_retencao", workers=1, retencao=datetime.timedelta(seconds=60))
+    job = fila.enfileirar("pdf", lambda: {"pdf_bytes": b"%PDF"})
+    assert job.aguardar(timeout=5) and fila.obter(job.id) is job
+
+    job.concluido_em -= datetime.timedelta(seconds=61)
+    assert fila.obter(job.id) is None
+
+
 def test_crud_transacoes():
     payload = {
         "valor": 55.9,
@@ -117,3 +298,162 @@ def test_dashboard_gastos_por_categoria():
     totais = {item["categoria"]: item["total"] for item in dados}
     assert totais["Transporte"] == 125.0
     assert totais["Lazer"] == 50.0
+
+
+def test_processar_transacao_multiplas_usa_uma_extracao(monkeypatch):
+    from app.agents.extrator import DadosTransacao, DadosTransacoes
+
+    chamadas = []
+
+    def _fake_extrair(texto):
+        chamadas.append(texto)
+        return DadosTransacoes(
+            transacoes=[
+                DadosTransacao(valor=-58.9, empresa="Uber", data=date(2024, 7, 23)),
+                DadosTransacao(valor=-39.9, empresa="Netflix", data=date(2024, 7, 24)),
+                DadosTransacao(valor=-120.0, empresa="Posto Ipiranga", data=date(2024, 7, 25)),
+            ]
+        )
+
+    monkeypatch.setattr("app.graph.orchestrator.extrair_transacoes", _fake_extrair)
+
+    response = client.post(
+        "/api/transacoes/processar",
+        json={"texto": "Uber 58,90; Netflix 39,90; Posto 120,00", "multiplas": True},
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(chamadas) == 1
+    assert len(data["transacao_ids"]) == 3
+    with database.session_scope() as session:
+        salvas = {
+            t.id: (t.empresa, t.categoria) for t in session.query(database.Transacao).all()
+        }
+    assert [salvas[i] for i in data["transacao_ids"]] == [
+        ("Uber", "Transporte"),
+        ("Netflix", "Lazer"),
+        ("Posto Ipiranga", "Combustível"),
+    ]
+
+
+def test_ingestao_interrompida_e_retomada_sem_nova_extracao(monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    from app.agents.extrator import DadosTransacao
+    from app.persistencia import fila_persistencia
+
+    extracoes = []
+    falhas = {"restantes": 1}
+    persistir_original = fila_persistencia.persistir
+
+    def _fake_extrair(texto):
+        extracoes.append(texto)
+        return DadosTransacao(valor=-20.0, empresa="Uber", data=date(2024, 8, 2))
+
+    def _persistir_instavel(transacao, timeout=None):
+        if falhas["restantes"]:
+            falhas["restantes"] -= 1
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return persistir_original(transacao, timeout)
+
+    monkeypatch.setattr("app.graph.orchestrator.extrair_dados_transacao", _fake_extrair)
+    monkeypatch.setattr(fila_persistencia, "persistir", _persistir_instavel)
+
+    falha = client.post("/api/transacoes/processar", json={"texto": "Uber R$ 20,00"})
+    assert falha.status_code == 503
+    ingestao_id = falha.json()["detail"]["ingestao_id"]
+
+    # Um único checkpoint, gravado na saída do grafo (e não um por nó).
+    from app.graph.orchestrator import checkpointer
+
+    assert len(list(checkpointer.list({"configurable": {"thread_id": ingestao_id}}))) == 1
+
+    pendentes = client.get("/api/admin/ingestoes").json()
+    assert {"ingestao_id": ingestao_id, "proximos_nos": ["persistir_dados"]}.items() <= next(
+        p for p in pendentes if p["ingestao_id"] == ingestao_id
+    ).items()
+
+    retomada = client.post(f"/api/admin/ingestoes/{ingestao_id}/retomar")
+    assert retomada.status_code == 200
+    assert retomada.json()["transacao_id"] is not None
+    assert len(extracoes) == 1
+    assert client.post(f"/api/admin/ingestoes/{ingestao_id}/retomar").status_code == 404
+
+
+def test_poda_remove_ingestoes_abandonadas(monkeypatch):
+    from datetime import timedelta
+
+    from sqlalchemy.exc import OperationalError
+
+    from app.graph import orchestrator
+
+    def _extrair_bloqueado(texto):
+        raise OperationalError("SELECT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr("app.graph.orchestrator.extrair_dados_transacao", _extrair_bloqueado)
+    ingestao_id = client.post("/api/transacoes/processar", json={"texto": "Uber"}).json()["detail"]["ingestao_id"]
+    assert orchestrator.podar_ingestoes(forcar=True) == 0  # ainda pode ser retomada
+
+    monkeypatch.setattr(orchestrator, "IDADE_MAXIMA_INGESTAO", timedelta(0))
+    assert orchestrator.podar_ingestoes(forcar=True) >= 1
+    assert ingestao_id not in [p["ingestao_id"] for p in orchestrator.listar_ingestoes_pendentes()]
+
+
+def test_transacoes_isoladas_por_cliente_e_categoria_preferida(monkeypatch):
+    from app.agents.extrator import DadosTransacao, DadosTransacoes
+
+    base = {"empresa": "Uber", "data": date(2024, 8, 10).isoformat(), "categoria": "Transporte"}
+    ana = client.post("/api/transacoes/", json={**base, "valor": -30.0, "cliente_id": "ana"}).json()
+    client.post("/api/transacoes/", json={**base, "valor": -70.0, "cliente_id": "bruno"})
+
+    assert [t["id"] for t in client.get("/api/transacoes/?cliente_id=ana").json()] == [ana["id"]]
+    assert client.get(f"/api/transacoes/{ana['id']}?cliente_id=bruno").status_code == 404
+    assert client.delete(f"/api/transacoes/{ana['id']}?cliente_id=bruno").status_code == 404
+    assert client.get("/api/transacoes/").json() == []
+    assert client.get(f"/api/transacoes/{ana['id']}").status_code == 404
+    totais = client.get("/api/dashboard/gastos-por-categoria?cliente_id=bruno").json()
+    assert totais == [{"categoria": "Transporte", "total": -70.0}]
+
+    # A correção de categoria vale para as próximas transações da Ana com a empresa.
+    resposta = client.put(f"/api/transacoes/{ana['id']}?cliente_id=ana", json={"categoria": "Trabalho"})
+    assert resposta.json()["categoria"] == "Trabalho"
+
+    monkeypatch.setattr(
+        "app.graph.orchestrator.extrair_transacoes",
+        lambda texto: DadosTransacoes(
+            transacoes=[DadosTransacao(valor=-25.0, empresa="UBER", data=date(2024, 8, 20))]
+        ),
+    )
+    for cliente in ("ana", "bruno"):
+        resposta = client.post(
+            "/api/transacoes/processar",
+            json={"texto": "Uber 25,00", "multiplas": True, "cliente_id": cliente},
+        )
+        assert resposta.status_code == 200
+    with database.session_scope() as session:
+        novas = session.query(database.Transacao).filter_by(empresa="UBER").all()
+        assert {(t.cliente_id, t.categoria) for t in novas} == {("ana", "Trabalho"), ("bruno", "Transporte")}
+
+
+def test_chat_indisponivel_responde_503(monkeypatch):
+    from app.llm import PrazoChamadaExcedidoError, PrazoFilaExcedidoError
+
+    def _fila_cheia(pergunta):
+        raise PrazoFilaExcedidoError("fila")
+
+    monkeypatch.setattr("app.main.avaliar_mensagem", _fila_cheia)
+    resposta = client.post("/api/chat", json={"pergunta": "Quanto gastei?"})
+    assert (resposta.status_code, resposta.json()) == (503, {"detail": "fila"})
+
+    class _AgenteSemPrazo:
+        def invoke(self, *args, **kwargs):
+            raise PrazoChamadaExcedidoError("prazo")
+
+    # O coach não pode transformar a indisponibilidade em texto de erro com status 200.
+    monkeypatch.setattr("app.main.avaliar_mensagem", lambda pergunta: "seguro")
+    monkeypatch.setattr("app.agents.coach.GOOGLE_API_KEY", "teste")
+    monkeypatch.setattr("app.agents.coach._cached_agent", _AgenteSemPrazo())
+    monkeypatch.setattr("app.agents.coach._resumo_do_cliente", lambda cliente_id: "")
+    resposta = client.post("/api/chat", json={"pergunta": "Quanto gastei?"})
+    assert (resposta.status_code, resposta.json()) == (503, {"detail": "prazo"})
@@ -0,0 +1,100 @@
+"""Testes do cliente de OCR contra um servidor HTTP local."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import base64
+import io
+import json
+import sys
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.cache import CacheSQLite
+from app.ocr import ClienteOCR, preparar_imagem
+
+
+def _imagem(cor, tamanho=(3000, 2000), formato="PNG"):
+    imagem = Image.effect_noise(tamanho, 60).convert("RGB")
+    imagem.paste(cor, (0, 0, 200, 200))
+    saida = io.BytesIO()
+    imagem.save(saida, format=formato)
+    return saida.getvalue()
+
+
+@pytest.fixture
+def servidor_ocr():
+    recebidas = []
+    falhas = {"restantes": 1}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if falhas["restantes"]:
+                falhas["restantes"] -= 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            url = corpo["messages"][1]["content"][0]["image_url"]["url"]
+            recebidas.append(url)
+            time.sleep(0.2)
+            resposta = json.dumps(
+                {"choices": [{"message": {"content": f"texto {len(recebidas)}"}}]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(resposta)))
+            self.end_headers()
+            self.wfile.write(resposta)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{servidor.server_port}/v1/chat/completions", recebidas
+    servidor.shutdown()
+
+
+def test_preparar_imagem_reduz_e_informa_mime():
+    original = _imagem((255, 0, 0))
+    reduzida, mime = preparar_imagem(original, lado_maximo=1000, bytes_alvo=200 * 1024)
+
+    assert mime == "image/jpeg"
+    assert len(reduzida) <= 200 * 1024 < len(original)
+    assert max(Image.open(io.BytesIO(reduzida)).size) == 1000
+
+    pequena = _imagem((0, 0, 255), tamanho=(50, 50), formato="JPEG")
+    assert preparar_imagem(pequena) == (pequena, "image/jpeg")
+
+
+def test_cliente_ocr_retenta_paraleliza_e_usa_cache(servidor_ocr, tmp_path):
+    url, recebidas = servidor_ocr
+    cliente = ClienteOCR(
+        url=url,
+        api_key="teste",
+        max_concorrencia=4,
+        cache=CacheSQLite("ocr", caminho=str(tmp_path / "cache.db")),
+    )
+    imagens = [_imagem(cor, tamanho=(400, 300)) for cor in ("red", "green", "blue", "white")]
+
+    inicio = time.perf_counter()
+    textos = cliente.extrair_textos(imagens + [imagens[0]])
+    decorrido = time.perf_counter() - inicio
+
+    # Quatro chamadas de 200 ms em paralelo (mais uma retentativa após o 503);
+    # em série levariam pelo menos 800 ms.
+    assert decorrido < 0.7
+    assert len(recebidas) == 4
+    assert textos[0] == textos[-1]
+    assert all(url.startswith("data:image/") for url in recebidas)
+    assert base64.b64decode(recebidas[0].split(",", 1)[1])
+
+    assert cliente.extrair_textos(imagens) == textos[:4]
+    assert len(recebidas) == 4
+    assert cliente.cache.hits == 4
@@ -0,0 +1,65 @@
+"""Testes do orçamento de tamanho dos resultados das tools."""
+from pathlib import Path
+from types import SimpleNamespace
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.cache import CacheSQLite
+from app.tools import orcamento_saida
+
+
+def test_listas_longas_viram_top_n_com_agregado_e_handle(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        orcamento_saida, "_resultados_completos", CacheSQLite("resultados_tools", caminho=str(tmp_path / "c.db"))
+    )
+    despesas = [
+        {"empresa": f"Loja {i}", "categoria": "Compras" if i % 2 else "Lazer", "valor": -float(100 - i)}
+        for i in range(25)
+    ]
+
+    limitado = orcamento_saida.limitar_resultado({"ok": True, "despesas": despesas}, max_linhas=10)
+    assert limitado["despesas"] == despesas[:10]
+    mais = limitado["mais_resultados"]["despesas"]
+    assert (mais["total"], mais["exibidos"]) == (25, 10)
+    assert mais["agregado_omitidos"]["soma"] == sum(d["valor"] for d in despesas[10:])
+    assert set(mais["agregado_omitidos"]["por_categoria"]) == {"Compras", "Lazer"}
+
+    pagina = orcamento_saida.buscar_mais_resultados.invoke({"handle": mais["handle"], "inicio": 20})
+    assert pagina["itens"] == despesas[20:] and pagina["proximo_inicio"] is None
+
+    pequeno = {"ok": True, "despesas": despesas[:3]}
+    assert orcamento_saida.limitar_resultado(pequeno, max_linhas=10) == pequeno
+
+
+def test_texto_longo_e_cortado_em_quebra_de_linha(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        orcamento_saida, "_resultados_completos", CacheSQLite("resultados_tools", caminho=str(tmp_path / "c.db"))
+    )
+    texto = "\n".join(f"linha {i:03d}" for i in range(200))
+
+    cortado = orcamento_saida.limitar_texto(texto, max_caracteres=300)
+    assert len(cortado) < 450
+    assert cortado.splitlines()[-2] == "linha 029"
+    handle = cortado.split("handle='")[1].split("'")[0]
+    inicio = int(cortado.split("inicio=")[1].split(")")[0])
+    continuacao = orcamento_saida.buscar_mais_resultados.invoke({"handle": handle, "inicio": inicio})
+    assert continuacao["texto"].startswith("\nlinha 030")
+
+
+def test_handle_so_pode_ser_paginado_pelo_cliente_que_o_criou(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        orcamento_saida, "_resultados_completos", CacheSQLite("resultados_tools", caminho=str(tmp_path / "c.db"))
+    )
+    linhas = [{"empresa": f"Loja {i}", "valor": -1.0} for i in range(15)]
+    handle = orcamento_saida.limitar_resultado({"linhas": linhas}, max_linhas=10, cliente_id="ana")[
+        "mais_resultados"
+    ]["linhas"]["handle"]
+
+    def buscar(cliente_id):
+        runtime = SimpleNamespace(context={"cliente_id": cliente_id} if cliente_id else {})
+        return orcamento_saida.buscar_mais_resultados.func(handle=handle, inicio=10, runtime=runtime)
+
+    assert buscar("ana")["itens"] == linhas[10:]
+    assert buscar("bruno")["ok"] is False
+    assert buscar(None)["ok"] is False
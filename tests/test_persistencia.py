@@ -0,0 +1,94 @@
+"""Testes da fila de persistência com escritor único."""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database, schemas
+from app.persistencia import FilaPersistencia
+
+
+@pytest.fixture(autouse=True)
+def banco_limpo():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def _transacao(indice, fitid=None):
+    return schemas.TransacaoCreate(
+        valor=-float(indice + 1),
+        empresa=f"Loja {indice}",
+        data=date(2024, 8, 1),
+        categoria="Compras",
+        fitid=fitid,
+    )
+
+
+def test_fila_agrupa_insercoes_concorrentes_e_devolve_ids():
+    fila = FilaPersistencia(janela_ms=50)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        ids = list(executor.map(lambda i: fila.persistir(_transacao(i), timeout=10), range(40)))
+
+    assert len(set(ids)) == 40
+    assert fila.transacoes_gravadas == 40
+    assert fila.lotes_gravados < 40
+    with database.session_scope() as session:
+        for indice, transacao_id in enumerate(ids):
+            assert session.get(database.Transacao, transacao_id).empresa == f"Loja {indice}"
+
+
+def test_fila_isola_registro_invalido_do_lote():
+    fila = FilaPersistencia(janela_ms=50)
+    futuros = [
+        fila.enviar(_transacao(0, fitid="repetido")),
+        fila.enviar(_transacao(1, fitid="repetido")),
+        fila.enviar(_transacao(2)),
+    ]
+
+    assert isinstance(futuros[0].result(timeout=10), int)
+    with pytest.raises(Exception):
+        futuros[1].result(timeout=10)
+    assert isinstance(futuros[2].result(timeout=10), int)
+
+
+def test_escritor_sobrevive_a_falha_fora_da_gravacao(monkeypatch):
+    fila = FilaPersistencia(janela_ms=1, timeout=5)
+    shard_original = database.roteador.shard
+    falhas = {"restantes": 1}
+
+    def _shard_instavel(cliente_id):
+        # A primeira chamada vem de ``enviar``; a segunda, do escritor.
+        if falhas["restantes"] and threading.current_thread().name.startswith("persistencia"):
+            falhas["restantes"] -= 1
+            raise RuntimeError("roteador indisponível")
+        return shard_original(cliente_id)
+
+    monkeypatch.setattr(database.roteador, "shard", _shard_instavel)
+    with pytest.raises(RuntimeError, match="roteador indisponível"):
+        fila.persistir(_transacao(0))
+    assert isinstance(fila.persistir(_transacao(1)), int)
+
+
+def test_persistir_desiste_apos_o_prazo(monkeypatch):
+    fila = FilaPersistencia(janela_ms=1, timeout=0.05)
+    liberar = threading.Event()
+    gravar_original = fila._gravar
+    monkeypatch.setattr(fila, "_gravar", lambda lote: (liberar.wait(5), gravar_original(lote)))
+
+    with pytest.raises(TimeoutError):
+        fila.persistir(_transacao(0))
+    liberar.set()  # o pedido já estava em gravação: conclui depois do prazo do chamador
+    limite = time.monotonic() + 5
+    while fila.transacoes_gravadas < 1 and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert fila.transacoes_gravadas == 1
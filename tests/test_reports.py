@@ -0,0 +1,169 @@
+"""Testes do relatório financeiro e do cache de artefatos."""
+from datetime import date
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database
+from app.cache import CacheSQLite
+from app.tools import reports
+from app.tools.reports_lote import gerar_relatorios_em_lote
+
+
+@pytest.fixture
+def banco_relatorio(tmp_path, monkeypatch):
+    """Cria um banco isolado com algumas transações e um cache vazio."""
+
+    monkeypatch.chdir(tmp_path)
+    db_path = tmp_path / "relatorio.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    database.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        session.add_all(
+            [
+                database.Transacao(valor=3000.0, empresa="Empresa X", data=date(2024, 8, 1), categoria="Salário"),
+                database.Transacao(valor=-55.9, empresa="iFood", data=date(2024, 8, 2), categoria="Alimentação"),
+                database.Transacao(valor=-120.0, empresa="Posto", data=date(2024, 8, 3), categoria="Combustível"),
+            ]
+        )
+        session.commit()
+    monkeypatch.setattr(
+        reports, "_cache_relatorios", CacheSQLite("relatorios", caminho=str(tmp_path / "cache.db"))
+    )
+    yield str(db_path), Session
+    engine.dispose()
+
+
+def _gerar(db_path):
+    return reports.gerar_relatorio("2024-08-01", "2024-08-31", db_path=db_path)
+
+
+def test_relatorio_reutiliza_cache_enquanto_dados_nao_mudam(banco_relatorio):
+    db_path, Session = banco_relatorio
+
+    primeiro = _gerar(db_path)
+    segundo = _gerar(db_path)
+    assert primeiro["cache"] is False
+    assert segundo["cache"] is True
+    assert segundo["totais"] == primeiro["totais"]
+
+    with Session() as session:
+        session.add(
+            database.Transacao(valor=-10.0, empresa="Uber", data=date(2024, 8, 4), categoria="Transporte")
+        )
+        session.commit()
+
+    terceiro = _gerar(db_path)
+    assert terceiro["cache"] is False
+    assert terceiro["totais"]["saidas"] == pytest.approx(185.9)
+
+
+def test_cache_distingue_bancos_com_os_mesmos_dados(banco_relatorio, tmp_path):
+    db_path, _ = banco_relatorio
+    copia = tmp_path / "copia.db"
+    copia.write_bytes(Path(db_path).read_bytes())
+
+    assert _gerar(db_path)["cache"] is False
+    assert _gerar(str(copia))["cache"] is False  # mesma impressão digital, outro banco
+
+
+def test_tool_enfileira_pdf_e_retorna_resumo(banco_relatorio, monkeypatch):
+    db_path, _ = banco_relatorio
+    monkeypatch.setattr(reports, "DEFAULT_DB_PATH", db_path)
+
+    assert "db_path" not in reports.gerar_relatorio_financeiro.args
+    resultado = reports.gerar_relatorio_financeiro.func(
+        start_date="2024-08-01", end_date="2024-08-31", formato="pdf"
+    )
+    assert resultado["totais"]["entradas"] == pytest.approx(3000.0)
+    assert resultado["pdf_url"] == f"/api/relatorios/{resultado['job_id']}/pdf"
+
+    job = reports.fila_relatorios.obter(resultado["job_id"])
+    assert job.aguardar(timeout=30)
+    assert job.status == "concluido"
+    assert job.resultado["pdf_bytes"].startswith(b"%PDF")
+
+
+def test_relatorio_html_com_graficos_svg(banco_relatorio, monkeypatch):
+    db_path, _ = banco_relatorio
+    monkeypatch.setattr(reports, "DEFAULT_DB_PATH", db_path)
+
+    resultado = reports.gerar_relatorio_html("2024-08-01", "2024-08-31", db_path=db_path)
+    html = resultado["html"]
+    assert html.startswith("<!DOCTYPE html>")
+    assert html.count("<svg") == 2
+    assert "Combustível" in html and "iFood" in html
+    assert reports.gerar_relatorio_html("2024-08-01", "2024-08-31", db_path=db_path)["cache"] is True
+
+    tool = reports.gerar_relatorio_financeiro.func(start_date="2024-08-01", end_date="2024-08-31")
+    assert tool["html_url"] == "/api/relatorios/html?start_date=2024-08-01&end_date=2024-08-31"
+    assert "job_id" not in tool
+    assert tool["totais"] == resultado["totais"] and "html" not in tool
+
+
+def test_relatorio_em_memoria_nao_grava_arquivos(banco_relatorio, tmp_path, monkeypatch):
+    db_path, _ = banco_relatorio
+    monkeypatch.setattr(reports, "REPORTS_DIR", str(tmp_path / "reports"))
+
+    resultado = _gerar(db_path)
+    assert resultado["pdf_path"] is None
+    assert resultado["pdf_bytes"].startswith(b"%PDF")
+    assert not (tmp_path / "reports").exists()
+
+    persistido = reports.gerar_relatorio(
+        "2024-08-01", "2024-08-31", db_path=db_path, persistir=True
+    )
+    assert Path(persistido["pdf_path"]).read_bytes() == resultado["pdf_bytes"]
+
+
+def test_relatorios_em_lote_por_cliente(banco_relatorio, tmp_path):
+    db_path, Session = banco_relatorio
+    with Session() as session:
+        session.add_all(
+            [
+                database.Transacao(
+                    valor=-80.0, empresa="Uber", data=date(2024, 8, 5), categoria="Transporte", cliente_id="ana"
+                ),
+                database.Transacao(
+                    valor=-20.0, empresa="Netflix", data=date(2024, 8, 6), categoria="Lazer", cliente_id="bruno"
+                ),
+                # "a/b" e "a_b" viram o mesmo nome após a limpeza.
+                database.Transacao(
+                    valor=-1.0, empresa="Padaria", data=date(2024, 8, 7), categoria="Alimentação", cliente_id="a/b"
+                ),
+                database.Transacao(
+                    valor=-2.0, empresa="Padaria", data=date(2024, 8, 7), categoria="Alimentação", cliente_id="a_b"
+                ),
+            ]
+        )
+        session.commit()
+
+    manifesto = gerar_relatorios_em_lote(
+        "2024-08-01", "2024-08-31", destino=str(tmp_path / "lote"), max_workers=2, db_path=db_path
+    )
+
+    assert manifesto["clientes"] == 5  # ana, bruno, a/b, a_b e as transações sem cliente
+    assert manifesto["falhas"] == 0
+    assert len({item["arquivo"] for item in manifesto["relatorios"]}) == 5
+    por_cliente = {item["cliente_id"]: item for item in manifesto["relatorios"]}
+    assert por_cliente["ana"]["saldo"] == pytest.approx(-80.0)
+    assert Path(por_cliente["bruno"]["arquivo"]).read_bytes().startswith(b"%PDF")
+    assert (tmp_path / "lote" / "manifest.json").exists()
+
+
+def test_cache_despeja_entradas_menos_usadas(tmp_path):
+    cache = CacheSQLite("teste", max_bytes=10, caminho=str(tmp_path / "cache.db"))
+    cache.gravar("a", b"12345")
+    cache.gravar("b", b"12345")
+    assert cache.obter("a") == b"12345"  # "a" passa a ser a mais recente
+
+    cache.gravar("c", b"12345")
+    assert cache.obter("b") is None
+    assert cache.obter("a") == b"12345"
+    assert cache.obter("c") == b"12345"
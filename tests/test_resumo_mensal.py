@@ -0,0 +1,116 @@
+"""Testes do resumo mensal incremental usado como contexto do coach."""
+from datetime import date
+from pathlib import Path
+import json
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database, repository, resumo_mensal, schemas
+
+
+@pytest.fixture
+def banco_limpo():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def _transacao(valor, empresa, data, categoria, **extras):
+    return schemas.TransacaoCreate(valor=valor, empresa=empresa, data=data, categoria=categoria, **extras)
+
+
+def _estado(session, mes):
+    return _valores(session.get(database.ResumoMensal, ("", mes)))
+
+
+def _valores(registro):
+    return (
+        registro.total_gasto,
+        registro.total_entradas,
+        registro.quantidade,
+        json.loads(registro.categorias),
+        json.loads(registro.empresas),
+    )
+
+
+def test_resumo_acompanha_insercoes_alteracoes_e_exclusoes(banco_limpo):
+    with database.session_scope() as session:
+        mercado = repository.criar_transacao(session, _transacao(-100.0, "Mercado", date(2024, 10, 3), "Alimentação"))
+        repository.criar_transacoes(
+            session,
+            [
+                _transacao(-40.0, "Uber", date(2024, 10, 4), "Transporte"),
+                _transacao(5000.0, "Salário", date(2024, 10, 5), "Salário"),
+            ],
+        )
+        repository.criar_transacoes_em_lote(
+            session, [_transacao(-60.0, "Mercado", date(2024, 10, 9), "Alimentação", fitid="x1")]
+        )
+        versao = session.get(database.ResumoMensal, ("", "2024-10")).versao
+
+        repository.atualizar_transacao(session, mercado.id, schemas.TransacaoUpdate(valor=-120.0))
+        uber = session.query(database.Transacao).filter_by(empresa="Uber").one()
+        repository.deletar_transacao(session, uber.id)
+
+        incremental = _estado(session, "2024-10")
+        assert session.get(database.ResumoMensal, ("", "2024-10")).versao == versao + 2
+
+        # Reconstruído do zero, o resumo deve ser idêntico ao mantido incrementalmente.
+        session.delete(session.get(database.ResumoMensal, ("", "2024-10")))
+        session.flush()
+        assert _valores(resumo_mensal.obter_resumo(session, None, "2024-10")) == incremental
+        # A leitura não grava o resumo reconstruído.
+        assert session.query(database.ResumoMensal).count() == 0
+
+    assert incremental == (180.0, 5000.0, 3, {"Alimentação": [180.0, 2]}, {"Mercado": [180.0, 2]})
+
+
+def test_escrita_concorrente_no_resumo_nao_perde_incrementos(banco_limpo, monkeypatch):
+    with database.session_scope() as session:
+        repository.criar_transacao(session, _transacao(-100.0, "Mercado", date(2024, 10, 3), "Alimentação"))
+
+    ler = resumo_mensal._ler
+    tentativas = []
+
+    def ler_e_concorrer(db, cliente_id, mes):
+        resumo = ler(db, cliente_id, mes)
+        tentativas.append(resumo.versao)
+        if len(tentativas) == 1:
+            # Outra ingestão grava o resumo entre a leitura e a escrita desta.
+            outro = ler(db, cliente_id, mes)
+            outro.aplicar(db, {"valor": -40.0, "categoria": "Transporte", "empresa": "Uber", "data": date(2024, 10, 4)}, 1)
+            assert outro.gravar(db)
+        return resumo
+
+    monkeypatch.setattr(resumo_mensal, "_ler", ler_e_concorrer)
+    with database.session_scope() as session:
+        repository.criar_transacao(session, _transacao(-60.0, "Mercado", date(2024, 10, 9), "Alimentação"))
+        registro = session.get(database.ResumoMensal, ("", "2024-10"))
+        assert tentativas == [1, 2]
+        assert registro.versao == 3
+        assert _valores(registro)[0] == 200.0
+
+
+def test_contexto_do_coach_compara_com_mes_anterior(banco_limpo):
+    with database.session_scope() as session:
+        repository.criar_transacoes(
+            session,
+            [
+                _transacao(-200.0, "Posto Shell", date(2024, 9, 10), "Combustível"),
+                _transacao(-300.0, "Posto Shell", date(2024, 10, 10), "Combustível"),
+                _transacao(-50.0, "iFood", date(2024, 10, 12), "Alimentação"),
+            ],
+        )
+        contexto = resumo_mensal.contexto_coach(session, hoje=date(2024, 10, 20))
+
+    assert contexto.startswith("Resumo dos dados (versão 1/1):")
+    assert "2024-10: gastos R$ 350,00 (+75% vs mês anterior)" in contexto
+    assert "Combustível R$ 300,00 (+50% vs mês anterior)" in contexto
+    assert "Posto Shell R$ 300,00 (1x)" in contexto
+    assert "2024-09: gastos R$ 200,00" in contexto
+    assert len(contexto) < 1500
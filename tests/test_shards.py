@@ -0,0 +1,67 @@
+"""Testes do roteamento de sessões por cliente entre arquivos SQLite (shards)."""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import database, repository, schemas
+from app.persistencia import FilaPersistencia
+
+
+@pytest.fixture
+def banco_limpo():
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
+
+
+def _transacao(cliente_id, valor=-10.0, categoria="Compras"):
+    return schemas.TransacaoCreate(
+        valor=valor, empresa="Loja", data=date(2024, 8, 1), categoria=categoria, cliente_id=cliente_id
+    )
+
+
+def test_um_arquivo_por_cliente_com_lru_de_engines(banco_limpo, tmp_path, monkeypatch):
+    roteador = database.RoteadorBanco("cliente", diretorio=str(tmp_path), max_engines=2)
+    monkeypatch.setattr(database, "roteador", roteador)
+
+    for cliente, valor in (("ana", -10.0), ("bruno", -20.0), ("carla/../x", -30.0), ("ana", -5.0)):
+        with database.session_scope(cliente) as session:
+            repository.criar_transacao(session, _transacao(cliente, valor))
+
+    assert roteador.shard("ana") != roteador.shard("bruno")
+    assert Path(roteador.caminho("carla/../x")).parent == tmp_path
+    assert len(roteador.shards()) == 3
+    assert (roteador.aberturas, roteador.descartes) == (4, 2)  # "ana" foi reaberto
+    assert roteador.metricas()["engines_abertos"] == 2
+
+    contagens = roteador.agregar(repository.contar_transacoes)
+    assert contagens.pop("principal") == 0
+    assert sorted(contagens.values()) == [1, 1, 2]
+    with database.session_scope("ana") as session:
+        assert [t.valor for t in repository.listar_transacoes(session, cliente_id="ana")] == [-10.0, -5.0]
+
+
+def test_fila_grava_em_paralelo_nos_buckets(banco_limpo, tmp_path, monkeypatch):
+    roteador = database.RoteadorBanco("hash", diretorio=str(tmp_path), buckets=3)
+    monkeypatch.setattr(database, "roteador", roteador)
+    fila = FilaPersistencia(janela_ms=20, escritores=3)
+    clientes = [f"cliente-{i}" for i in range(12)]
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        ids = list(executor.map(lambda c: fila.persistir(_transacao(c), timeout=10), clientes * 2))
+
+    assert fila.transacoes_gravadas == 24
+    assert len(roteador.shards()) == 3
+    for cliente, transacao_id in zip(clientes * 2, ids):
+        with database.session_scope(cliente) as session:
+            assert session.get(database.Transacao, transacao_id).cliente_id == cliente
+
+    gastos = repository.calcular_gastos_por_categoria_em_todos_os_bancos()
+    assert gastos == [schemas.GastoPorCategoria(categoria="Compras", total=-240.0)]
@@ -0,0 +1,136 @@
+"""Testes do acesso somente leitura e limitado do agente SQL."""
+from pathlib import Path
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.agents.sql_consultor import (
+    TABELA_CLIENTE,
+    ConsultaRejeitadaError,
+    SQLDatabaseLeitura,
+    criar_engine_leitura,
+)
+
+
+@pytest.fixture
+def banco_leitura(tmp_path):
+    caminho = tmp_path / "leitura.db"
+    conexao = sqlite3.connect(caminho)
+    conexao.execute("CREATE TABLE transacoes (id INTEGER PRIMARY KEY, empresa TEXT, valor REAL)")
+    conexao.executemany(
+        "INSERT INTO transacoes (empresa, valor) VALUES (?, ?)",
+        [(f"Loja {i % 50}", -float(i)) for i in range(500)],
+    )
+    conexao.commit()
+    conexao.close()
+    return SQLDatabaseLeitura(criar_engine_leitura(str(caminho)), prazo=0.2, max_linhas=20)
+
+
+def test_conexao_e_somente_leitura_com_limite_de_linhas(banco_leitura):
+    assert banco_leitura.run("SELECT COUNT(*) FROM transacoes") == "[(500,)]"
+
+    linhas = banco_leitura._execute("SELECT id FROM transacoes")
+    assert len(linhas) == 21 and linhas[-1] == {"aviso": "resultado limitado às primeiras 20 linhas"}
+
+    assert "readonly" in banco_leitura.run_no_throw("DELETE FROM transacoes")
+    assert banco_leitura.run("SELECT COUNT(*) FROM transacoes") == "[(500,)]"
+
+
+def test_recusa_produto_cartesiano_e_interrompe_consultas_longas(banco_leitura):
+    with pytest.raises(ConsultaRejeitadaError, match="produto cartesiano"):
+        banco_leitura._execute("SELECT COUNT(*) FROM transacoes a, transacoes b")
+    assert banco_leitura.run_no_throw("SELECT COUNT(*) FROM transacoes a, transacoes b").startswith("Error:")
+
+    # Junções por coluna usam índice automático e continuam permitidas.
+    assert banco_leitura._execute(
+        "SELECT COUNT(*) AS n FROM transacoes a JOIN transacoes b ON a.empresa = b.empresa"
+    ) == [{"n": 5000}]
+
+    inicio = time.monotonic()
+    with pytest.raises(ConsultaRejeitadaError, match="interrompida"):
+        banco_leitura._execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT MAX(i) FROM n"
+        )
+    assert time.monotonic() - inicio < 1
+
+
+def test_agente_do_cliente_so_enxerga_as_proprias_transacoes(tmp_path):
+    caminho = tmp_path / "clientes.db"
+    conexao = sqlite3.connect(caminho)
+    conexao.execute(
+        "CREATE TABLE transacoes (id INTEGER PRIMARY KEY, cliente_id TEXT, valor REAL, data_atualizacao TEXT)"
+    )
+    conexao.execute("CREATE TABLE outra (segredo TEXT)")
+    conexao.executemany(
+        "INSERT INTO transacoes (cliente_id, valor) VALUES (?, ?)",
+        [("ana", -10.0), ("bruno", -20.0), ("d'ana", -30.0), ("ana", -5.0), (None, -7.0)],
+    )
+    conexao.commit()
+    conexao.close()
+
+    banco = SQLDatabaseLeitura(
+        criar_engine_leitura(str(caminho), cliente_id="ana"), include_tables=[TABELA_CLIENTE]
+    )
+    assert banco.get_usable_table_names() == ["transacoes"]
+    assert banco.run("SELECT COUNT(*), SUM(valor) FROM transacoes") == "[(2, -15.0)]"
+
+    # Nenhum SQL escrito pelo LLM alcança as linhas de outro cliente, nem mesmo uma
+    # CTE com o nome da visão.
+    for consulta in (
+        "SELECT COUNT(*) FROM main.transacoes",
+        "WITH t AS (SELECT * FROM main.transacoes) SELECT COUNT(*) FROM t",
+        "WITH transacoes AS (SELECT * FROM main.transacoes) SELECT COUNT(*) FROM transacoes",
+        "SELECT segredo FROM outra",
+        "PRAGMA table_list",
+    ):
+        assert banco.run_no_throw(consulta).startswith("Error: (sqlite3.DatabaseError)")
+    # O catálogo temporário, que traz o nome da visão interna, é lido como NULL.
+    assert "_cliente_" not in banco.run("SELECT name, sql FROM sqlite_temp_master")
+
+    # Sem cliente, apenas as transações sem cliente.
+    sem_cliente = SQLDatabaseLeitura(criar_engine_leitura(str(caminho), isolar=True))
+    assert sem_cliente.run("SELECT COUNT(*), SUM(valor) FROM transacoes") == "[(1, -7.0)]"
+
+    # A visão lê a tabela real: alterações aparecem na hora, sem cópia.
+    conexao = sqlite3.connect(caminho)
+    conexao.execute("INSERT INTO transacoes (cliente_id, valor) VALUES ('ana', -1.0)")
+    conexao.execute("UPDATE transacoes SET valor = -6.0 WHERE valor = -5.0")
+    conexao.commit()
+    conexao.close()
+    assert banco.run("SELECT COUNT(*), SUM(valor) FROM transacoes") == "[(3, -17.0)]"
+
+
+def test_agentes_descartados_liberam_o_engine(monkeypatch):
+    from app.agents import sql_consultor
+
+    descartados = []
+
+    class _Engine:
+        def __init__(self, cliente_id):
+            self.cliente_id = cliente_id
+
+        def dispose(self):
+            descartados.append(self.cliente_id)
+
+    class _Banco:
+        def __init__(self, cliente_id):
+            self._engine = _Engine(cliente_id)
+
+    monkeypatch.setattr(sql_consultor, "MAX_AGENTES", 2)
+    monkeypatch.setattr(sql_consultor, "_agentes", type(sql_consultor._agentes)())
+    monkeypatch.setattr(sql_consultor, "_build_llm", lambda: None)
+    monkeypatch.setattr(sql_consultor, "_banco", _Banco)
+    monkeypatch.setattr(sql_consultor, "SQLDatabaseToolkit", lambda db, llm: db)
+    monkeypatch.setattr(sql_consultor, "create_sql_agent", lambda llm, toolkit, verbose: toolkit)
+
+    ana = sql_consultor._get_agent_executor("ana")
+    sql_consultor._get_agent_executor("bruno")
+    assert sql_consultor._get_agent_executor("ana") is ana
+    sql_consultor._get_agent_executor("carla")
+
+    assert descartados == ["bruno"]
+    assert list(sql_consultor._agentes) == ["ana", "carla"]